@@ -1,9 +1,11 @@
 #include <cstdint>
 #include <optional>
 
+#include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 
+#include "conc_table.hpp"
 #include "domain.hpp"
 #include "enum.hpp"
 #include "eval.hpp"
@@ -11,6 +13,7 @@
 #include "rand.hpp"
 #include "results.hpp"
 #include "sconst_range.hpp"
+#include "to_eval.hpp"
 #include "uconst_range.hpp"
 
 namespace py = pybind11;
@@ -24,43 +27,87 @@ void register_rng(py::module_ &m) {
   py::class_<rngdist::Sampler, SamplerPtr>(m, "Sampler", py::module_local())
       .def("__str__", [](const rngdist::Sampler &) { return "<Sampler>"; });
 
-  m.def("uniform_sampler", []() -> SamplerPtr {
-    return std::make_shared<rngdist::UniformSampler>();
-  });
+  py::enum_<rngdist::Spread>(m, "Spread", py::module_local())
+      .value("iid", rngdist::Spread::iid)
+      .value("stratified", rngdist::Spread::stratified)
+      .value("quasi", rngdist::Spread::quasi);
+
+  const auto spread = [](SamplerPtr s, rngdist::Spread sp) {
+    s->spread = sp;
+    return s;
+  };
+
+  m.def(
+      "uniform_sampler",
+      [=](rngdist::Spread sp) -> SamplerPtr {
+        return spread(std::make_shared<rngdist::UniformSampler>(), sp);
+      },
+      py::arg("spread") = rngdist::Spread::iid);
 
   m.def(
       "normal_sampler",
-      [](double sigma) -> SamplerPtr {
-        return std::make_shared<rngdist::NormalSampler>(sigma);
+      [=](double sigma, rngdist::Spread sp) -> SamplerPtr {
+        return spread(std::make_shared<rngdist::NormalSampler>(sigma), sp);
       },
-      py::arg("sigma"));
+      py::arg("sigma"), py::arg("spread") = rngdist::Spread::iid);
 
   m.def(
       "skew_left_sampler",
-      [](double sigma, double alpha) -> SamplerPtr {
-        return std::make_shared<rngdist::SkewNormalLeftSampler>(sigma, alpha);
+      [=](double sigma, double alpha, rngdist::Spread sp) -> SamplerPtr {
+        return spread(
+            std::make_shared<rngdist::SkewNormalLeftSampler>(sigma, alpha), sp);
       },
-      py::arg("sigma"), py::arg("alpha"));
+      py::arg("sigma"), py::arg("alpha"),
+      py::arg("spread") = rngdist::Spread::iid);
 
   m.def(
       "skew_right_sampler",
-      [](double sigma, double alpha) -> SamplerPtr {
-        return std::make_shared<rngdist::SkewNormalRightSampler>(sigma, alpha);
+      [=](double sigma, double alpha, rngdist::Spread sp) -> SamplerPtr {
+        return spread(
+            std::make_shared<rngdist::SkewNormalRightSampler>(sigma, alpha),
+            sp);
       },
-      py::arg("sigma"), py::arg("alpha"));
+      py::arg("sigma"), py::arg("alpha"),
+      py::arg("spread") = rngdist::Spread::iid);
 
   m.def(
       "bimodal_sampler",
-      [](double sigma, double separation) -> SamplerPtr {
-        return std::make_shared<rngdist::BimodalSymmetricSampler>(sigma,
-                                                                  separation);
+      [=](double sigma, double separation, rngdist::Spread sp) -> SamplerPtr {
+        return spread(std::make_shared<rngdist::BimodalSymmetricSampler>(
+                          sigma, separation),
+                      sp);
       },
-      py::arg("sigma"), py::arg("separation"));
+      py::arg("sigma"), py::arg("separation"),
+      py::arg("spread") = rngdist::Spread::iid);
 }
 
-// TODO integrate this class more tightly with PerBitRes
 void register_results_class(py::module_ &m) {
-  auto cls = py::class_<Results>(m, "Results");
+  auto cls = py::class_<Results>(m, "Results", py::buffer_protocol());
+
+  // (numFns, num_fields) view of the per candidate counters, columns are
+  // ordered as in Result::fields
+  cls.def_buffer([](const Results &self) -> py::buffer_info {
+    constexpr auto itemsize = static_cast<py::ssize_t>(sizeof(std::uint64_t));
+    constexpr auto numFields = static_cast<py::ssize_t>(Result::num_fields);
+    return py::buffer_info(
+        const_cast<Result *>(self.data()), itemsize,
+        py::format_descriptor<std::uint64_t>::format(), 2,
+        {static_cast<py::ssize_t>(self.numFns()), numFields},
+        {numFields * itemsize, itemsize}, true);
+  });
+
+  cls.def_property_readonly_static("fields", [](const py::object &) {
+    py::tuple t(Result::num_fields);
+    for (std::size_t i = 0; i < Result::num_fields; ++i)
+      t[i] = py::str(Result::fields[i].data(), Result::fields[i].size());
+    return t;
+  });
+  cls.def_property_readonly("bw", &Results::getBw);
+  cls.def_property_readonly("cases", &Results::getCases);
+  cls.def_property_readonly("unsolved_cases", &Results::getUnsolvedCases);
+  cls.def_property_readonly("base_distance", &Results::getBaseDistance);
+  cls.def_property_readonly("max_dist", &Results::getMaxDist);
+  cls.def("__len__", &Results::numFns);
 
   cls.def("__str__", [](const Results &self) {
     std::ostringstream oss;
@@ -71,6 +118,18 @@ void register_results_class(py::module_ &m) {
   });
 }
 
+void register_eval_jobs(py::module_ &m) {
+  py::class_<EvalJob>(m, "EvalJob");
+
+  m.def(
+      "run_eval_jobs",
+      [](const std::vector<EvalJob> &jobs, unsigned int num_threads) {
+        py::gil_scoped_release release;
+        return EvalJob::runAll(jobs, num_threads);
+      },
+      py::arg("jobs"), py::arg("num_threads") = 1);
+}
+
 template <template <std::size_t> class D, std::size_t BW>
   requires Domain<D, BW>
 void register_domain_class(py::module_ &m) {
@@ -88,6 +147,89 @@ void register_domain_class(py::module_ &m) {
   });
 }
 
+template <template <std::size_t> class D, std::size_t BW>
+  requires Domain<D, BW>
+void register_ref_cache_class(py::module_ &m) {
+  using RefCacheT = RefCache<D, BW>;
+  const std::string cls_name =
+      std::string("RefCache") + std::string(D<BW>::name) + std::to_string(BW);
+
+  py::class_<RefCacheT>(m, cls_name.c_str())
+      .def("__len__", &RefCacheT::size);
+
+  using RowOutputsT = RowOutputs<D, BW>;
+  const std::string outs_name =
+      std::string("RowOutputs") + std::string(D<BW>::name) + std::to_string(BW);
+
+  // __len__ is the number of fns, rows the number of rows
+  py::class_<RowOutputsT>(m, outs_name.c_str())
+      .def("__len__", &RowOutputsT::numFns)
+      .def_property_readonly("rows", &RowOutputsT::size);
+}
+
+template <std::size_t ResBw, std::size_t... BWs>
+void register_conc_table(py::module_ &m) {
+  using Table = ConcTable<ResBw, BWs...>;
+  using Fn = detail::nary_fn_t<sizeof...(BWs)>;
+
+  if constexpr (Table::enabled) {
+    std::string sfx = std::to_string(ResBw);
+    ((sfx += "_" + std::to_string(BWs)), ...);
+    constexpr auto n = static_cast<py::ssize_t>(Table::num_entries);
+    using Entries =
+        py::array_t<std::uint8_t, py::array::c_style | py::array::forcecast>;
+
+    py::class_<Table, std::shared_ptr<Table>>(m, ("ConcTable" + sfx).c_str(),
+                                              py::buffer_protocol())
+        // (2, num_entries) read only view of the outputs and the validity
+        .def_buffer([](const Table &t) -> py::buffer_info {
+          return py::buffer_info(const_cast<std::uint8_t *>(t.data()), 1,
+                                 py::format_descriptor<std::uint8_t>::format(),
+                                 2, {py::ssize_t{2}, n}, {n, py::ssize_t{1}},
+                                 true);
+        })
+        .def(py::init([](const Entries &a) {
+               return Table(
+                   std::vector<std::uint8_t>(a.data(), a.data() + a.size()));
+             }),
+             py::arg("entries"))
+        .def("__len__", [](const Table &) { return Table::num_entries; });
+
+    m.def(
+        ("conc_table_" + sfx).c_str(),
+        [](std::uintptr_t crtOpAddr,
+           std::optional<std::uintptr_t> opConFnAddr) {
+          py::gil_scoped_release release;
+          std::optional<Fn> opCon;
+          if (opConFnAddr)
+            opCon = reinterpret_cast<Fn>(*opConFnAddr);
+          return std::make_shared<Table>(reinterpret_cast<Fn>(crtOpAddr),
+                                         opCon);
+        },
+        py::arg("crtOpAddr"), py::arg("opConFnAddr"));
+  }
+}
+
+// the ConcTable passed to an enum, only bitwidths with a table take one
+template <typename EnumT>
+std::shared_ptr<const typename EnumT::Table>
+castTable(const py::object &table) {
+  using Table = typename EnumT::Table;
+  if (table.is_none())
+    return nullptr;
+  if constexpr (Table::enabled)
+    if (py::isinstance<Table>(table))
+      return table.cast<std::shared_ptr<Table>>();
+
+  throw py::type_error("expected a ConcTable of the same bitwidths");
+}
+
+template <std::size_t BW> void register_conc_tables(py::module_ &m) {
+  register_conc_table<BW, BW>(m);
+  register_conc_table<BW, BW, BW>(m);
+  register_conc_table<BW, BW, BW, BW>(m);
+}
+
 template <template <std::size_t> class Dom, std::size_t ResBw,
           std::size_t... BWs>
   requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
@@ -100,16 +242,66 @@ void register_enum_domain(py::module_ &m) {
   std::string cls_name = std::string("ToEval") + dname + std::to_string(ResBw);
   ((cls_name += "_" + std::to_string(BWs)), ...);
 
-  py::class_<EvalVec>(m, cls_name.c_str())
+  using Lane = typename EvalVec::Lane;
+  using LaneArray = py::array_t<Lane>;
+  using WeightArray =
+      py::array_t<std::uint64_t, py::array::c_style | py::array::forcecast>;
+  constexpr auto laneSize = static_cast<py::ssize_t>(sizeof(Lane));
+
+  py::class_<EvalVec>(m, cls_name.c_str(), py::buffer_protocol())
+      // (rows, (args + 1) * arity) read only view, each domain value taking
+      // arity columns and the best abstraction last
+      .def_buffer([](const EvalVec &v) -> py::buffer_info {
+        return py::buffer_info(
+            const_cast<Lane *>(v.data()), laneSize,
+            py::format_descriptor<Lane>::format(), 2,
+            {static_cast<py::ssize_t>(v.size()),
+             static_cast<py::ssize_t>(EvalVec::num_cols)},
+            {laneSize, static_cast<py::ssize_t>(v.capacity()) * laneSize},
+            true);
+      })
+      // lanes of the ToEval dtype are read in place through their strides, so
+      // a memory mapped array is not copied before its rows are
+      .def(py::init([](const LaneArray &a,
+                       const std::optional<WeightArray> &weights) {
+             if (a.ndim() != 2 ||
+                 a.shape(1) != static_cast<py::ssize_t>(EvalVec::num_cols))
+               throw py::value_error("expected a (rows, " +
+                                     std::to_string(EvalVec::num_cols) +
+                                     ") array");
+
+             const auto lanes = a.template unchecked<2>();
+             return EvalVec::fromLanes(
+                 static_cast<std::size_t>(a.shape(0)),
+                 [&](std::size_t i, std::size_t c) -> std::uint64_t {
+                   return lanes(static_cast<py::ssize_t>(i),
+                                static_cast<py::ssize_t>(c));
+                 },
+                 weights ? std::vector<std::uint64_t>(
+                               weights->data(),
+                               weights->data() + weights->size())
+                         : std::vector<std::uint64_t>{});
+           }),
+           py::arg("lanes"), py::arg("weights") = py::none())
+      // (rows) number of identical rows each row stands for
+      .def_property_readonly("weights",
+                             [](const EvalVec &v) {
+                               std::vector<std::uint64_t> w(v.size());
+                               for (std::size_t i = 0; i < w.size(); ++i)
+                                 w[i] = v.weight(i);
+
+                               return py::array_t<std::uint64_t>(
+                                   static_cast<py::ssize_t>(w.size()),
+                                   w.data());
+                             })
+      .def("dedup", &EvalVec::dedup)
       .def("__len__", [](const EvalVec &v) { return v.size(); })
-      .def(
-          "__getitem__",
-          [](const EvalVec &v, std::size_t i) -> const Row & {
-            if (i >= v.size())
-              throw py::index_error();
-            return v[i];
-          },
-          py::return_value_policy::reference_internal)
+      .def("__getitem__",
+           [](const EvalVec &v, std::size_t i) -> Row {
+             if (i >= v.size())
+               throw py::index_error();
+             return v[i];
+           })
       .def(
           "__iter__",
           [](const EvalVec &v) {
@@ -122,47 +314,85 @@ void register_enum_domain(py::module_ &m) {
   std::string fn_name = dname + "_" + std::to_string(ResBw);
   ((fn_name += "_" + std::to_string(BWs)), ...);
 
+  using SamplerPtr = std::shared_ptr<rngdist::Sampler>;
+
+  // table is a ConcTable of the same op, or None to call the op instead.
+  // crtBatchAddr and opConBatchAddr are the batched variants of the op and op
+  // constraint, from LowerToLLVM.add_fn(..., batch=True). fast_abst takes
+  // best abstractions from EnumDomain::fastBestAbst where there is one, and
+  // symmetric shares the best abstraction of swapped args of a commutative op,
+  // see EnumDomain::genLows
+  using OptAddr = std::optional<std::uintptr_t>;
+
+  // rows [begin, end) of the exhaustive enumeration (all of it by default),
+  // so that it can be produced in chunks
   m.def(
       ("enum_low_" + fn_name).c_str(),
-      [](std::uintptr_t crtOpAddr, std::optional<std::uintptr_t> opConFnAddr) {
+      [](std::uintptr_t crtOpAddr, OptAddr opConFnAddr,
+         unsigned int num_threads, const py::object &table,
+         OptAddr crtBatchAddr, OptAddr opConBatchAddr, bool fast_abst,
+         bool symmetric, std::size_t begin, std::optional<std::size_t> end) {
+        EnumT ed{crtOpAddr,    opConFnAddr,    castTable<EnumT>(table),
+                 crtBatchAddr, opConBatchAddr, fast_abst,
+                 symmetric};
+        const typename EnumT::Lattices lattices = EnumT::lowLattices();
+        const std::size_t n = EnumT::numLows(lattices);
+        if (begin > end.value_or(n) || end.value_or(n) > n)
+          throw py::index_error("rows out of range");
+
         py::gil_scoped_release release;
-        EnumT ed{crtOpAddr, opConFnAddr};
-        return std::make_unique<EvalVec>(ed.genLows());
+        return std::make_unique<EvalVec>(
+            ed.genLows(lattices, begin, end.value_or(n), num_threads));
       },
-      py::arg("crtOpAddr"), py::arg("opConFnAddr"),
-      py::return_value_policy::take_ownership);
+      py::arg("crtOpAddr"), py::arg("opConFnAddr"), py::arg("num_threads") = 1,
+      py::arg("table") = py::none(), py::arg("crtBatchAddr") = py::none(),
+      py::arg("opConBatchAddr") = py::none(), py::arg("fast_abst") = false,
+      py::arg("symmetric") = false, py::arg("begin") = 0,
+      py::arg("end") = py::none(), py::return_value_policy::take_ownership);
 
-  using SamplerPtr = std::shared_ptr<rngdist::Sampler>;
+  // number of rows enum_low makes
+  m.def(
+      ("num_lows_" + fn_name).c_str(),
+      [] { return EnumT::numLows(EnumT::lowLattices()); });
 
   m.def(("enum_mid_" + fn_name).c_str(),
-        [](std::uintptr_t crtOpAddr, std::optional<std::uintptr_t> opConFnAddr,
+        [](std::uintptr_t crtOpAddr, OptAddr opConFnAddr,
            unsigned int num_lat_samples, unsigned int seed,
-           SamplerPtr sampler) {
+           SamplerPtr sampler, unsigned int num_threads,
+           const py::object &table, OptAddr crtBatchAddr,
+           OptAddr opConBatchAddr, bool fast_abst) {
+          EnumT ed{crtOpAddr,    opConFnAddr,    castTable<EnumT>(table),
+                   crtBatchAddr, opConBatchAddr, fast_abst};
           py::gil_scoped_release release;
 
-          std::mt19937 rng(seed);
-          EnumT ed{crtOpAddr, opConFnAddr};
           return std::make_unique<EvalVec>(
-              ed.genMids(num_lat_samples, rng, *sampler));
+              ed.genMids(num_lat_samples, seed, *sampler, num_threads));
         },
         py::arg("crtOpAddr"), py::arg("opConFnAddr"),
         py::arg("num_lat_samples"), py::arg("seed"), py::arg("sampler"),
+        py::arg("num_threads") = 1, py::arg("table") = py::none(),
+        py::arg("crtBatchAddr") = py::none(),
+        py::arg("opConBatchAddr") = py::none(), py::arg("fast_abst") = false,
         py::return_value_policy::take_ownership);
 
   m.def(("enum_high_" + fn_name).c_str(),
-        [](std::uintptr_t crtOpAddr, std::optional<std::uintptr_t> opConFnAddr,
+        [](std::uintptr_t crtOpAddr, OptAddr opConFnAddr,
            unsigned int num_lat_samples, unsigned int num_conc_samples,
-           unsigned int seed, SamplerPtr sampler) {
+           unsigned int seed, SamplerPtr sampler, unsigned int num_threads,
+           const py::object &table, OptAddr crtBatchAddr,
+           OptAddr opConBatchAddr, bool fast_abst) {
+          EnumT ed{crtOpAddr,    opConFnAddr,    castTable<EnumT>(table),
+                   crtBatchAddr, opConBatchAddr, fast_abst};
           py::gil_scoped_release release;
 
-          std::mt19937 rng(seed);
-          EnumT ed{crtOpAddr, opConFnAddr};
-          return std::make_unique<EvalVec>(
-              ed.genHighs(num_lat_samples, num_conc_samples, rng, *sampler));
+          return std::make_unique<EvalVec>(ed.genHighs(
+              num_lat_samples, num_conc_samples, seed, *sampler, num_threads));
         },
         py::arg("crtOpAddr"), py::arg("opConFnAddr"),
         py::arg("num_lat_samples"), py::arg("num_conc_samples"),
-        py::arg("seed"), py::arg("sampler"),
+        py::arg("seed"), py::arg("sampler"), py::arg("num_threads") = 1,
+        py::arg("table") = py::none(), py::arg("crtBatchAddr") = py::none(),
+        py::arg("opConBatchAddr") = py::none(), py::arg("fast_abst") = false,
         py::return_value_policy::take_ownership);
 }
 
@@ -181,14 +411,143 @@ void register_eval_domain(py::module_ &m) {
   std::string fn_name = "eval_" + dname_lower + "_" + std::to_string(ResBw);
   ((fn_name += "_" + std::to_string(BWs)), ...);
 
+  using LaneArray = py::array_t<typename EvalVec::Lane>;
+
+  m.def(
+      fn_name.c_str(),
+      [](const EvalVec &v, const std::vector<std::uintptr_t> &xfers,
+         const std::vector<std::uintptr_t> &bases, unsigned int num_threads,
+         const std::vector<std::uint64_t> &unsound_budgets) -> Results {
+        py::gil_scoped_release release;
+        return EvalT{xfers, bases, unsound_budgets}.eval(v, num_threads);
+      },
+      py::arg("to_eval"), py::arg("xfers"), py::arg("bases"),
+      py::arg("num_threads") = 1,
+      py::arg("unsound_budgets") = std::vector<std::uint64_t>{});
+
   m.def(
       fn_name.c_str(),
       [](const EvalVec &v, const std::vector<std::uintptr_t> &xfers,
-         const std::vector<std::uintptr_t> &bases) -> Results {
+         const RefCache<Dom, ResBw> &refs, unsigned int num_threads,
+         const std::vector<std::uint64_t> &unsound_budgets) -> Results {
         py::gil_scoped_release release;
-        return EvalT{xfers, bases}.eval(v);
+        return EvalT{xfers, {}, unsound_budgets}.eval(v, refs, num_threads);
       },
-      py::arg("to_eval"), py::arg("xfers"), py::arg("bases"));
+      py::arg("to_eval"), py::arg("xfers"), py::arg("refs"),
+      py::arg("num_threads") = 1,
+      py::arg("unsound_budgets") = std::vector<std::uint64_t>{});
+
+  // the job holds references to its rows and ref cache itself, keep_alive
+  // would run its hook on the sentinel returned by a failed argument load.
+  // run_eval_jobs decides how many threads it runs on
+  m.def(
+      ("eval_job_" + fn_name.substr(5)).c_str(),
+      [](const py::object &to_eval, const std::vector<std::uintptr_t> &xfers,
+         const std::vector<std::uintptr_t> &bases, const py::object &refs,
+         const std::vector<std::uint64_t> &unsound_budgets) {
+        const auto *v = to_eval.cast<const EvalVec *>();
+        if (!refs.is_none())
+          return EvalJob(v->size(),
+                         [e = EvalT{xfers, {}, unsound_budgets}, v,
+                          r = refs.cast<const RefCache<Dom, ResBw> *>(),
+                          owners = py::make_tuple(to_eval, refs)](
+                             unsigned int numThreads) {
+                           return e.eval(*v, *r, numThreads);
+                         });
+
+        return EvalJob(v->size(),
+                       [e = EvalT{xfers, bases, unsound_budgets}, v,
+                        owner = to_eval](unsigned int numThreads) {
+                         return e.eval(*v, numThreads);
+                       });
+      },
+      py::arg("to_eval"), py::arg("xfers"),
+      py::arg("bases") = std::vector<std::uintptr_t>{},
+      py::arg("refs") = py::none(),
+      py::arg("unsound_budgets") = std::vector<std::uint64_t>{});
+
+  // lanes is a (rows, columns) array of the lanes of a ToEval, as viewed from
+  // its buffer, copied chunk_rows at a time and evaluated as they come, so
+  // that it can be a memory mapped file that is never read in at once
+  m.def(
+      ("eval_job_chunks_" + fn_name.substr(5)).c_str(),
+      [](const LaneArray &lanes, std::size_t chunk_rows,
+         const std::vector<std::uintptr_t> &xfers,
+         const std::vector<std::uintptr_t> &bases,
+         const std::vector<std::uint64_t> &unsound_budgets) {
+        if (chunk_rows == 0)
+          throw py::value_error("chunk_rows must be positive");
+        if (lanes.ndim() != 2 ||
+            lanes.shape(1) != static_cast<py::ssize_t>(EvalVec::num_cols))
+          throw py::value_error("expected a (rows, " +
+                                std::to_string(EvalVec::num_cols) +
+                                ") array");
+
+        const auto n = static_cast<std::size_t>(lanes.shape(0));
+        EvalT e{xfers, bases, unsound_budgets};
+        return EvalJob(n, [e = std::move(e), l = lanes.template unchecked<2>(),
+                           n, chunk_rows, owner = lanes](
+                              unsigned int numThreads) {
+          return e.evalChunks(
+              (n + chunk_rows - 1) / chunk_rows,
+              [&](std::size_t k) {
+                const std::size_t begin = k * chunk_rows;
+                const std::size_t rows = std::min(n - begin, chunk_rows);
+                return EvalVec::fromLanes(
+                    rows, [&](std::size_t i, std::size_t c) -> std::uint64_t {
+                      return l(static_cast<py::ssize_t>(begin + i),
+                               static_cast<py::ssize_t>(c));
+                    });
+              },
+              numThreads);
+        });
+      },
+      py::arg("lanes"), py::arg("chunk_rows"),
+      py::arg("xfers"), py::arg("bases") = std::vector<std::uintptr_t>{},
+      py::arg("unsound_budgets") = std::vector<std::uint64_t>{});
+
+  m.def(
+      ("row_outputs_" + fn_name.substr(5)).c_str(),
+      [](const EvalVec &v, const std::vector<std::uintptr_t> &xfers,
+         unsigned int num_threads) {
+        py::gil_scoped_release release;
+        return EvalT{xfers, {}}.outputs(v, num_threads);
+      },
+      py::arg("to_eval"), py::arg("xfers"), py::arg("num_threads") = 1);
+
+  // bytes row_outputs would take for num_fns fns on num_rows rows
+  m.def(("row_outputs_bytes_" + fn_name.substr(5)).c_str(),
+        &RowOutputs<Dom, ResBw>::bytes, py::arg("num_fns"),
+        py::arg("num_rows"));
+
+  m.def(
+      ("eval_outputs_" + fn_name.substr(5)).c_str(),
+      [](const EvalVec &v, const RowOutputs<Dom, ResBw> &outs,
+         const std::vector<std::size_t> &fns, const RefCache<Dom, ResBw> &refs,
+         unsigned int num_threads) {
+        py::gil_scoped_release release;
+        return EvalT::evalOutputs(v, outs, fns, refs, num_threads);
+      },
+      py::arg("to_eval"), py::arg("outputs"), py::arg("fns"), py::arg("refs"),
+      py::arg("num_threads") = 1);
+
+  m.def(
+      ("meet_ref_cache_" + fn_name.substr(5)).c_str(),
+      [](const EvalVec &v, const RefCache<Dom, ResBw> &refs,
+         const RowOutputs<Dom, ResBw> &outs, std::size_t fn) {
+        py::gil_scoped_release release;
+        return EvalT::meetOutputs(v, refs, outs, fn);
+      },
+      py::arg("to_eval"), py::arg("refs"), py::arg("outputs"), py::arg("fn"));
+
+  m.def(
+      ("ref_cache_" + fn_name.substr(5)).c_str(),
+      [](const EvalVec &v, const std::vector<std::uintptr_t> &bases,
+         unsigned int num_threads) {
+        py::gil_scoped_release release;
+        return EvalT{{}, bases}.buildRefs(v, num_threads);
+      },
+      py::arg("to_eval"), py::arg("bases"), py::arg("num_threads") = 1);
 }
 
 template <template <std::size_t> class Dom, std::size_t ResBw,
@@ -216,6 +575,7 @@ template <template <std::size_t> class Dom, std::size_t BW>
   requires Domain<Dom, BW>
 void register_domain(py::module_ &m) {
   register_domain_class<Dom, BW>(m);
+  register_ref_cache_class<Dom, BW>(m);
 
   register_uniform_arity<Dom, BW, 1>(m);
   register_uniform_arity<Dom, BW, 2>(m);
@@ -227,35 +587,14 @@ void register_domain_widths(py::module_ &m) {
   (register_domain<Dom, BWs>(m), ...);
 }
 
-#define MAKE_OPAQUE_UNIFORM(DOM, BW)                                           \
-  PYBIND11_MAKE_OPAQUE(ToEval<DOM, BW, BW>);                                   \
-  PYBIND11_MAKE_OPAQUE(ToEval<DOM, BW, BW, BW>);                               \
-  PYBIND11_MAKE_OPAQUE(ToEval<DOM, BW, BW, BW, BW>);
-
-// Register domain classes here
-MAKE_OPAQUE_UNIFORM(KnownBits, 4);
-MAKE_OPAQUE_UNIFORM(KnownBits, 8);
-MAKE_OPAQUE_UNIFORM(KnownBits, 16);
-MAKE_OPAQUE_UNIFORM(KnownBits, 32);
-MAKE_OPAQUE_UNIFORM(KnownBits, 64);
-
-MAKE_OPAQUE_UNIFORM(UConstRange, 4);
-MAKE_OPAQUE_UNIFORM(UConstRange, 8);
-MAKE_OPAQUE_UNIFORM(UConstRange, 16);
-MAKE_OPAQUE_UNIFORM(UConstRange, 32);
-MAKE_OPAQUE_UNIFORM(UConstRange, 64);
-
-MAKE_OPAQUE_UNIFORM(SConstRange, 4);
-MAKE_OPAQUE_UNIFORM(SConstRange, 8);
-MAKE_OPAQUE_UNIFORM(SConstRange, 16);
-MAKE_OPAQUE_UNIFORM(SConstRange, 32);
-MAKE_OPAQUE_UNIFORM(SConstRange, 64);
-
 PYBIND11_MODULE(_eval_engine, m) {
   m.doc() = "Evaluation engine for synth_xfer";
 
   register_rng(m);
   register_results_class(m);
+  register_eval_jobs(m);
+  register_conc_tables<4>(m);
+  register_conc_tables<8>(m);
 
   register_domain_widths<KnownBits, 4, 8, 16, 32, 64>(m);
   register_domain_widths<UConstRange, 4, 8, 16, 32, 64>(m);
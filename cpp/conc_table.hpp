@@ -0,0 +1,84 @@
+#pragma once
+
+#include <array>
+#include <cstddef>
+#include <cstdint>
+#include <optional>
+#include <stdexcept>
+#include <string>
+#include <utility>
+#include <vector>
+
+// Output and validity of a concrete op on every concrete input, indexed by the
+// args concatenated with the first one most significant. It only depends on
+// the op and the bitwidths, so one table serves every domain, and looking it
+// up replaces the indirect call into the jit'd op (and op constraint). Only
+// available while the table stays small, see enabled.
+template <std::size_t ResBw, std::size_t... BWs> class ConcTable {
+public:
+  static constexpr std::size_t N = sizeof...(BWs);
+  static constexpr std::size_t in_bits = (BWs + ...);
+  static constexpr bool enabled = ResBw <= 8 && in_bits <= 16;
+  static constexpr std::size_t num_entries = std::size_t{1}
+                                             << (enabled ? in_bits : 0);
+
+  // the op (and op constraint) run on every input
+  template <typename ConcOpFn, typename OpConFn>
+    requires enabled
+  ConcTable(ConcOpFn concOp, std::optional<OpConFn> opCon)
+      : entries(2 * num_entries) {
+    for (std::size_t idx = 0; idx < num_entries; ++idx) {
+      const std::array<std::uint64_t, N> vals = args(idx);
+      if (opCon && apply(*opCon, vals) == 0)
+        continue;
+
+      entries[idx] = static_cast<std::uint8_t>(apply(concOp, vals));
+      entries[num_entries + idx] = 1;
+    }
+  }
+
+  // a table saved from data()
+  ConcTable(std::vector<std::uint8_t> entries_)
+    requires enabled
+      : entries(std::move(entries_)) {
+    if (entries.size() != 2 * num_entries)
+      throw std::invalid_argument("expected a (2, " +
+                                  std::to_string(num_entries) + ") table");
+  }
+
+  // the op output on vals, or nothing if the op constraint rejects them
+  std::optional<std::uint64_t>
+  at(const std::array<std::uint64_t, N> &vals) const noexcept {
+    std::size_t idx = 0;
+    std::size_t i = 0;
+    ((idx = (idx << BWs) | static_cast<std::size_t>(vals[i++])), ...);
+
+    if (!entries[num_entries + idx])
+      return std::nullopt;
+
+    return entries[idx];
+  }
+
+  // (2, num_entries) outputs followed by the validity of every input
+  const std::uint8_t *data() const noexcept { return entries.data(); }
+
+private:
+  std::vector<std::uint8_t> entries;
+
+  static std::array<std::uint64_t, N> args(std::size_t idx) noexcept {
+    std::array<std::uint64_t, N> vals{};
+    std::size_t shift = in_bits;
+    std::size_t i = 0;
+    ((shift -= BWs, vals[i++] = (idx >> shift) & ((std::size_t{1} << BWs) - 1)),
+     ...);
+
+    return vals;
+  }
+
+  template <typename F>
+  static std::uint64_t apply(F f, const std::array<std::uint64_t, N> &vals) {
+    return [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+      return f(vals[Is]...);
+    }(std::make_index_sequence<N>{});
+  }
+};
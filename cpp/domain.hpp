@@ -67,11 +67,6 @@ constexpr bool operator!=(const D<BW> &lhs, const D<BW> &rhs) {
 
 namespace DomainHelpers {
 
-template <template <std::size_t> class Dom, std::size_t ResBw,
-          std::size_t... BWs>
-  requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
-using ToEval = std::vector<std::tuple<Dom<BWs>..., Dom<ResBw>>>;
-
 // TODO specialized to arity 2 domains
 template <std::size_t BW>
 inline const constexpr std::array<std::uint64_t, 2>
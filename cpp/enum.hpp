@@ -1,15 +1,23 @@
 #pragma once
 
+#include <algorithm>
 #include <array>
+#include <cmath>
+#include <memory>
+#include <numeric>
 #include <optional>
 #include <random>
+#include <stdexcept>
+#include <thread>
 #include <tuple>
 #include <utility>
 #include <vector>
 
 #include "apint.hpp"
+#include "conc_table.hpp"
 #include "domain.hpp"
 #include "rand.hpp"
+#include "to_eval.hpp"
 
 using namespace DomainHelpers;
 
@@ -37,40 +45,107 @@ public:
   using EvalVec = ToEval<Dom, ResBw, BWs...>;
   using ConcOpFn = detail::nary_fn_t<N>;
   using OpConFn = detail::nary_fn_t<N>;
-
-  constexpr EnumDomain(const std::uintptr_t concOpAddr,
-                       const std::optional<std::uintptr_t> opConAddr)
+  using Table = ConcTable<ResBw, BWs...>;
+  // fn(in, out, n) runs the op on n inputs, arg k of input i at in[k * n + i]
+  using BatchFn = void (*)(const std::uint64_t *, std::uint64_t *,
+                           std::uint64_t);
+
+  // with a table of the same op, the op is looked up instead of called.
+  // otherwise with the batched variants of the op (and op constraint), the
+  // concrete inputs are run through them batch_rows at a time. with fastAbst,
+  // best abstractions come from fastBestAbst wherever it has one. symmetric
+  // is for commutative ops, see genLows
+  EnumDomain(const std::uintptr_t concOpAddr,
+             const std::optional<std::uintptr_t> opConAddr,
+             std::shared_ptr<const Table> table_ = nullptr,
+             const std::optional<std::uintptr_t> concBatchAddr = std::nullopt,
+             const std::optional<std::uintptr_t> opConBatchAddr = std::nullopt,
+             const bool fastAbst_ = false, const bool symmetric_ = false)
       : concOp(reinterpret_cast<ConcOpFn>(concOpAddr)),
         opCon(opConAddr ? std::optional<OpConFn>(
                               reinterpret_cast<OpConFn>(*opConAddr))
-                        : std::nullopt) {}
+                        : std::nullopt),
+        table(std::move(table_)),
+        concBatch(concBatchAddr ? reinterpret_cast<BatchFn>(*concBatchAddr)
+                                : nullptr),
+        opConBatch(opConBatchAddr ? reinterpret_cast<BatchFn>(*opConBatchAddr)
+                                  : nullptr),
+        fastAbst(fastAbst_), symmetric(symmetric_) {
+    if (symmetric && !swappable)
+      throw std::invalid_argument(
+          "symmetric needs two args of the same bitwidth");
+  }
 
-  EvalVec genLows() const {
-    EvalVec r;
+  static constexpr std::size_t batch_rows = 256;
+  static constexpr std::array<std::size_t, N> arg_bws = {BWs...};
+  static constexpr bool swappable = N == 2 && arg_bws[0] == arg_bws[N - 1];
 
-    auto lattices =
-        std::tuple<std::vector<Dom<BWs>>...>{Dom<BWs>::enumLattice()...};
+  using Lattices = std::tuple<std::vector<Dom<BWs>>...>;
+
+  static Lattices lowLattices() { return Lattices{Dom<BWs>::enumLattice()...}; }
+
+  // number of rows genLows makes
+  static std::size_t numLows(const Lattices &lattices) {
+    return std::apply([](const auto &...l) { return (l.size() * ...); },
+                      lattices);
+  }
 
-    ArgsTuple current{};
-    for_each_combination<0>(lattices, current, [&](const ArgsTuple &args) {
-      r.emplace_back(std::tuple_cat(args, std::tuple<ResD>{toBestAbst(args)}));
+  // the lattice Cartesian product split into numThreads contiguous shards
+  // enumerated concurrently, the rows come out in the same order either way.
+  // with symmetric, a commutative op gives the same best abstraction on
+  // swapped args, so it is computed once for both orders of two different
+  // args. both rows are still made, since a candidate need not commute
+  EvalVec genLows(unsigned int numThreads = 1) const {
+    const Lattices lattices = lowLattices();
+    return genLows(lattices, 0, numLows(lattices), numThreads);
+  }
+
+  // rows [begin, end) of genLows, split into numThreads shards the same way
+  EvalVec genLows(const Lattices &lattices, std::size_t begin,
+                  std::size_t end, unsigned int numThreads) const {
+    const std::size_t n = end - begin;
+    if (numThreads <= 1)
+      return genLows(lattices, begin, end);
+
+    return sharded(n, numThreads, [&](std::size_t s, std::size_t shards) {
+      return genLows(lattices, begin + n * s / shards,
+                     begin + n * (s + 1) / shards);
     });
+  }
+
+  // rows [begin, end) of the lattice Cartesian product, in the same order as
+  // genLows, so the product can be produced in chunks
+  EvalVec genLows(const Lattices &lattices, std::size_t begin,
+                  std::size_t end) const {
+    EvalVec r;
+    r.reserve(end - begin);
+    if constexpr (swappable)
+      if (symmetric) {
+        genPairs(lattices, begin, end, r);
+        return r;
+      }
+
+    for (std::size_t idx = begin; idx < end; ++idx) {
+      const ArgsTuple args = nthCombination(lattices, idx);
+      r.push_back(std::tuple_cat(args, std::tuple<ResD>{toBestAbst(args)}));
+    }
 
     return r;
   }
 
   EvalVec genMids(unsigned int num_lat_samples, std::mt19937 &rng,
-                  const rngdist::Sampler &sampler) {
+                  const rngdist::Sampler &sampler) const {
     EvalVec r;
     r.reserve(num_lat_samples);
 
+    LevelDraws draws(sampler, num_lat_samples, rng);
     for (unsigned int i = 0; i < num_lat_samples; ++i) {
       while (true) {
-        ArgsTuple args = make_random_args(rng, sampler);
+        ArgsTuple args = draws.args(i, rng);
         ResD res = toBestAbst(args);
 
         if (!res.isBottom()) {
-          r.emplace_back(std::tuple_cat(args, std::tuple<ResD>{res}));
+          r.push_back(std::tuple_cat(args, std::tuple<ResD>{res}));
           break;
         }
       }
@@ -79,32 +154,56 @@ public:
     return r;
   }
 
+  // with one thread the rows are drawn from mt19937(seed), as by the rng
+  // overload. otherwise shard s of numThreads draws its share of the rows from
+  // mt19937 seeded with (seed, s), so the rows only depend on the seed and the
+  // thread count. the LevelDraws of a shard only spread its own share
+  EvalVec genMids(unsigned int num_lat_samples, unsigned int seed,
+                  const rngdist::Sampler &sampler,
+                  unsigned int numThreads) const {
+    return seeded(num_lat_samples, seed, numThreads,
+                  [&](unsigned int n, std::mt19937 &rng) {
+                    return genMids(n, rng, sampler);
+                  });
+  }
+
   EvalVec genHighs(unsigned int num_lat_samples, unsigned int num_conc_samples,
-                   std::mt19937 &rng, const rngdist::Sampler &sampler) {
+                   unsigned int seed, const rngdist::Sampler &sampler,
+                   unsigned int numThreads) const {
+    return seeded(num_lat_samples, seed, numThreads,
+                  [&](unsigned int n, std::mt19937 &rng) {
+                    return genHighs(n, num_conc_samples, rng, sampler);
+                  });
+  }
+
+  EvalVec genHighs(unsigned int num_lat_samples, unsigned int num_conc_samples,
+                   std::mt19937 &rng, const rngdist::Sampler &sampler) const {
     EvalVec r;
     r.reserve(num_lat_samples);
 
+    LevelDraws draws(sampler, num_lat_samples, rng);
     for (unsigned int i = 0; i < num_lat_samples; ++i) {
-      ArgsTuple args = make_random_args(rng, sampler);
+      ArgsTuple args = draws.args(i, rng);
       ResD res = ResD::bottom();
 
       const std::uint64_t cap = static_cast<std::uint64_t>(num_conc_samples);
       const std::uint64_t total_space = capped_concrete_space(args, cap);
-      if (total_space <= cap) {
+      const std::optional<ResD> fast =
+          fastAbst ? fastBestAbst(args) : std::nullopt;
+      if (fast) {
+        res = *fast;
+      } else if (total_space <= cap) {
         res = toBestAbst(args);
       } else {
+        Joiner joiner(*this);
         for (unsigned int j = 0; j < num_conc_samples; ++j) {
           std::array<std::uint64_t, N> concretes{};
           fill_sampled_concretes(args, rng, concretes);
-
-          if (opCon && apply_n_ary(*opCon, concretes) == 0)
-            continue;
-
-          auto out = apply_n_ary(concOp, concretes);
-          res = res.join(ResD::fromConcrete(APInt<ResBw>(out)));
+          joiner.add(concretes);
         }
+        res = joiner.result();
       }
-      r.emplace_back(std::tuple_cat(args, std::tuple<ResD>{res}));
+      r.push_back(std::tuple_cat(args, std::tuple<ResD>{res}));
     }
 
     return r;
@@ -113,35 +212,294 @@ public:
 private:
   ConcOpFn concOp;
   std::optional<OpConFn> opCon;
+  std::shared_ptr<const Table> table;
+  BatchFn concBatch;
+  BatchFn opConBatch;
+  bool fastAbst;
+  bool symmetric;
+
+  // a table is faster still, and a constraint without a batched variant
+  // would have to be called per input anyway
+  bool batched() const noexcept {
+    return concBatch && (!opCon || opConBatch) && !table;
+  }
+
+  // the op output on vals, or nothing if the op constraint rejects them
+  std::optional<std::uint64_t>
+  conc(const std::array<std::uint64_t, N> &vals) const {
+    if constexpr (Table::enabled)
+      if (table)
+        return table->at(vals);
+
+    if (opCon && apply_n_ary(*opCon, vals) == 0)
+      return std::nullopt;
+
+    return apply_n_ary(concOp, vals);
+  }
+
+  // gen(s, shards) for every shard s of min(numThreads, numRows), each on its
+  // own thread unless there is just one, concatenated in shard order
+  template <typename F>
+  static EvalVec sharded(std::size_t numRows, unsigned int numThreads,
+                         const F &gen) {
+    const std::size_t shards = std::clamp<std::size_t>(
+        numThreads, 1, std::max<std::size_t>(numRows, 1));
+    if (shards == 1)
+      return gen(0, 1);
+
+    std::vector<EvalVec> parts(shards);
+
+    std::vector<std::thread> workers;
+    workers.reserve(shards);
+    for (std::size_t s = 0; s < shards; ++s)
+      workers.emplace_back([&, s] { parts[s] = gen(s, shards); });
+    for (std::thread &w : workers)
+      w.join();
+
+    EvalVec r;
+    r.reserve(numRows);
+    for (const EvalVec &part : parts)
+      r.append(part);
+
+    return r;
+  }
+
+  template <typename F>
+  static EvalVec seeded(unsigned int numRows, unsigned int seed,
+                        unsigned int numThreads, const F &gen) {
+    return sharded(numRows, numThreads, [&](std::size_t s, std::size_t n) {
+      std::seed_seq seq{seed, static_cast<unsigned int>(s)};
+      std::mt19937 rng = n == 1 ? std::mt19937(seed) : std::mt19937(seq);
+      return gen(static_cast<unsigned int>(numRows * (s + 1) / n -
+                                           numRows * s / n),
+                 rng);
+    });
+  }
+
+  // the best abstraction without enumerating the concretes of args, where the
+  // domain has a shortcut. nothing if there is none for these args
+  std::optional<ResD> fastBestAbst(const ArgsTuple &args) const {
+    if (std::apply([](const auto &...a) { return (a.isBottom() || ...); },
+                   args))
+      return ResD::bottom();
+
+    if constexpr (requires(const ResD &d) { d.endpoints(); }) {
+      // the join of the op outputs on the corners of the args, exact for ops
+      // monotone in every arg (in the order of the domain) and constraints
+      // that accept a whole box if they accept its corners
+      const std::array<std::array<std::uint64_t, 2>, N> ends = std::apply(
+          [](const auto &...a) {
+            return std::array<std::array<std::uint64_t, 2>, N>{
+                {{a.endpoints()[0].getZExtValue(),
+                  a.endpoints()[1].getZExtValue()}...}};
+          },
+          args);
+
+      ResD res = ResD::bottom();
+      for (std::size_t corner = 0; corner < std::size_t{1} << N; ++corner) {
+        std::array<std::uint64_t, N> vals{};
+        for (std::size_t k = 0; k < N; ++k)
+          vals[k] = ends[k][(corner >> k) & 1];
+
+        const std::optional<std::uint64_t> out = conc(vals);
+        if (!out)
+          return std::nullopt;
+        res = res.join(ResD::fromConcrete(APInt<ResBw>(*out)));
+      }
+
+      return res;
+    } else if constexpr (requires(const ResD &d) { d.maybeBits(); } &&
+                         ((BWs == ResBw) && ...)) {
+      // bit i of a bitwise op only depends on bit i of the args, so running it
+      // on args of all zeros or all ones covers every bit at once: bit i of
+      // the result can be b if some run whose args can all take the value of
+      // their bit i gives b there. exact for bitwise ops without a constraint
+      if (opCon)
+        return std::nullopt;
+
+      const std::array<std::array<std::uint64_t, 2>, N> maybe = std::apply(
+          [](const auto &...a) {
+            return std::array<std::array<std::uint64_t, 2>, N>{
+                {{a.maybeBits()[0].getZExtValue(),
+                  a.maybeBits()[1].getZExtValue()}...}};
+          },
+          args);
+      const std::uint64_t ones = APInt<ResBw>::getAllOnes().getZExtValue();
+
+      std::uint64_t may0 = 0;
+      std::uint64_t may1 = 0;
+      for (std::size_t corner = 0; corner < std::size_t{1} << N; ++corner) {
+        std::array<std::uint64_t, N> vals{};
+        std::uint64_t allowed = ones;
+        for (std::size_t k = 0; k < N; ++k) {
+          const std::size_t bit = (corner >> k) & 1;
+          vals[k] = bit ? ones : 0;
+          allowed &= maybe[k][bit];
+        }
+
+        const std::optional<std::uint64_t> out = conc(vals);
+        if (!out)
+          return std::nullopt;
+        may0 |= allowed & ~*out;
+        may1 |= allowed & *out;
+      }
+
+      return ResD::fromMaybeBits(APInt<ResBw>(may0), APInt<ResBw>(may1));
+    } else {
+      return std::nullopt;
+    }
+  }
 
   ResD toBestAbst(const ArgsTuple &args) const {
+    if (fastAbst)
+      if (const std::optional<ResD> res = fastBestAbst(args))
+        return *res;
+
     auto concSets = build_concrete_sets(args);
-    ResD res = ResD::bottom();
+    Joiner joiner(*this);
     std::array<std::uint64_t, N> current{};
 
     for_each_conc_combination<0>(
-        concSets, current, [&](const std::array<std::uint64_t, N> &vals) {
-          if (opCon && apply_n_ary(*opCon, vals) == 0)
-            return;
+        concSets, current,
+        [&](const std::array<std::uint64_t, N> &vals) { joiner.add(vals); });
+
+    return joiner.result();
+  }
+
+  // the join of the abstractions of the op outputs on the inputs added to it.
+  // when batching, the inputs are gathered column major and the buffer is run
+  // through the batched op each time it fills up
+  class Joiner {
+  public:
+    explicit Joiner(const EnumDomain &ed_) : ed(ed_) {}
+
+    void add(const std::array<std::uint64_t, N> &vals) {
+      if (!ed.batched()) {
+        if (const auto out = ed.conc(vals))
+          join(*out);
+        return;
+      }
+
+      for (std::size_t k = 0; k < N; ++k)
+        in[k * batch_rows + size] = vals[k];
+      if (++size == batch_rows)
+        flush();
+    }
+
+    ResD result() {
+      flush();
+      return res;
+    }
+
+  private:
+    const EnumDomain &ed;
+    ResD res = ResD::bottom();
+    std::array<std::uint64_t, N * batch_rows> in;
+    std::array<std::uint64_t, batch_rows> outs;
+    std::array<std::uint64_t, batch_rows> valid;
+    std::size_t size = 0;
+
+    void join(std::uint64_t x) {
+      res = res.join(ResD::fromConcrete(APInt<ResBw>(x)));
+    }
+
+    void flush() {
+      if (size == 0)
+        return;
+
+      // a partly full buffer has its columns moved back to back
+      for (std::size_t k = 1; k < N; ++k)
+        std::copy_n(in.begin() + static_cast<std::ptrdiff_t>(k * batch_rows),
+                    size, in.begin() + static_cast<std::ptrdiff_t>(k * size));
 
-          auto out = apply_n_ary(concOp, vals);
-          res = res.join(ResD::fromConcrete(APInt<ResBw>(out)));
+      ed.concBatch(in.data(), outs.data(), size);
+      if (ed.opConBatch)
+        ed.opConBatch(in.data(), valid.data(), size);
+      for (std::size_t i = 0; i < size; ++i)
+        if (!ed.opConBatch || valid[i])
+          join(outs[i]);
+
+      size = 0;
+    }
+  };
+
+  // the args of num rows, with their levels drawn as the spread of sampler
+  // says. stratified draws the unit behind the level of arg k of row i from
+  // its own of num equal strata of [0, 1), in an order shuffled per arg (a
+  // latin hypercube). quasi takes the d'th draw of arg k from the R_N
+  // sequence, frac(shift_k + d alpha^(k + 1)) for the inverse alpha of the
+  // root of x^(N + 1) = x + 1 and a random shift. redraws of a row stay in
+  // its strata, or move on along the sequence
+  class LevelDraws {
+  public:
+    LevelDraws(const rngdist::Sampler &sampler_, std::size_t num_,
+               std::mt19937 &rng)
+        : sampler(sampler_), num(num_) {
+      if (sampler.spread == rngdist::Spread::stratified) {
+        for (std::vector<std::size_t> &p : perms) {
+          p.resize(num);
+          std::iota(p.begin(), p.end(), std::size_t{0});
+          std::shuffle(p.begin(), p.end(), rng);
+        }
+      } else if (sampler.spread == rngdist::Spread::quasi) {
+        double phi = 2.0;
+        for (int it = 0; it < 64; ++it)
+          phi = std::pow(1.0 + phi, 1.0 / static_cast<double>(N + 1));
+
+        double a = 1.0;
+        for (std::size_t k = 0; k < N; ++k) {
+          a /= phi;
+          alpha[k] = a;
+          shift[k] = rngdist::detail::uniform01(rng);
+        }
+      }
+    }
+
+    ArgsTuple args(std::size_t i, std::mt19937 &rng) {
+      switch (sampler.spread) {
+      case rngdist::Spread::iid:
+        return make_random_args(rng, [&](std::size_t, std::uint64_t hi) {
+          return sampler(rng, 0ULL, hi);
+        });
+      case rngdist::Spread::stratified:
+        return make_random_args(rng, [&](std::size_t k, std::uint64_t hi) {
+          const double u = (static_cast<double>(perms[k][i]) +
+                            rngdist::detail::uniform01(rng)) /
+                           static_cast<double>(num);
+          return sampler.level(u, 0ULL, hi);
+        });
+      case rngdist::Spread::quasi:
+        ++draws;
+        return make_random_args(rng, [&](std::size_t k, std::uint64_t hi) {
+          const double x = shift[k] + static_cast<double>(draws) * alpha[k];
+          return sampler.level(x - std::floor(x), 0ULL, hi);
         });
+      }
 
-    return res;
-  }
+      throw std::invalid_argument("unknown sampler spread");
+    }
 
-  ArgsTuple make_random_args(std::mt19937 &rng,
-                             const rngdist::Sampler &sampler) const {
+  private:
+    const rngdist::Sampler &sampler;
+    std::size_t num;
+    std::array<std::vector<std::size_t>, N> perms{};
+    std::array<double, N> alpha{};
+    std::array<double, N> shift{};
+    std::uint64_t draws = 0;
+  };
+
+  // args whose k'th one is drawn from its lattice at level(k, num_levels)
+  template <typename Level>
+  static ArgsTuple make_random_args(std::mt19937 &rng, const Level &level) {
     ArgsTuple res{};
+    std::size_t k = 0;
     std::apply(
         [&](auto &...elems) {
           (
               [&] {
                 using D = std::decay_t<decltype(elems)>;
                 const std::uint64_t hi = D::num_levels();
-                const std::uint64_t level = sampler(rng, 0ULL, hi);
-                elems = D::rand(rng, level);
+                elems = D::rand(rng, level(k++, hi));
               }(),
               ...);
         },
@@ -167,23 +525,63 @@ private:
     }(std::make_index_sequence<N>{});
   }
 
-  // lattice Cartesian product for genLows
-  template <std::size_t I, typename LatticeTuple, typename CurrentTuple,
-            typename Body>
-  static void for_each_combination(const LatticeTuple &lattices,
-                                   CurrentTuple &current, Body &&body) {
-    if constexpr (I == N) {
-      body(current);
-    } else {
-      const auto &vec = std::get<I>(lattices);
-      for (const auto &v : vec) {
-        std::get<I>(current) = v;
-        for_each_combination<I + 1>(lattices, current,
-                                    std::forward<Body>(body));
+  // rows [begin, end) of the lattice product ordered by the smaller of the
+  // two arg indices i: first (i, i), then (i, j) and (j, i) for each j > i,
+  // so that both orders of a pair are next to each other and share their best
+  // abstraction. the i(2n - i) rows before (i, i) are those of the args < i
+  void genPairs(const Lattices &lattices, std::size_t begin, std::size_t end,
+                EvalVec &r) const
+    requires swappable
+  {
+    if (begin >= end)
+      return;
+
+    const std::vector<Dom<arg_bws[0]>> &lat = std::get<0>(lattices);
+    const std::size_t n = lat.size();
+    std::size_t i = 0;
+    while ((i + 1) * (2 * n - i - 1) <= begin)
+      ++i;
+    const std::size_t off = begin - i * (2 * n - i);
+    std::size_t j = off == 0 ? i : i + 1 + (off - 1) / 2;
+    bool swapped = off != 0 && (off - 1) % 2 == 1;
+
+    std::optional<ResD> best;
+    for (std::size_t idx = begin; idx < end; ++idx) {
+      const ArgsTuple args{lat[i], lat[j]};
+      if (!best)
+        best = toBestAbst(args);
+      r.push_back(std::tuple_cat(
+          swapped ? ArgsTuple{lat[j], lat[i]} : args, std::tuple<ResD>{*best}));
+
+      if (i != j && !swapped) {
+        swapped = true;
+        continue;
       }
+      best.reset();
+      swapped = false;
+      if (++j == n)
+        j = ++i;
     }
   }
 
+  // the idx'th element of the lattice Cartesian product, the last arg varying
+  // fastest
+  static ArgsTuple nthCombination(const Lattices &lattices, std::size_t idx) {
+    ArgsTuple args{};
+    [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+      (
+          [&] {
+            constexpr std::size_t I = N - 1 - Is;
+            const auto &vec = std::get<I>(lattices);
+            std::get<I>(args) = vec[idx % vec.size()];
+            idx /= vec.size();
+          }(),
+          ...);
+    }(std::make_index_sequence<N>{});
+
+    return args;
+  }
+
   // concrete Cartesian product for toBestAbst
   template <std::size_t I, typename ConcSetsTuple, typename Body>
   static void for_each_conc_combination(const ConcSetsTuple &concSets,
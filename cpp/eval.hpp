@@ -1,14 +1,22 @@
 #pragma once
 
+#include <algorithm>
 #include <array>
+#include <atomic>
 #include <cstddef>
 #include <cstdint>
+#include <exception>
+#include <functional>
+#include <optional>
+#include <stdexcept>
+#include <thread>
 #include <tuple>
 #include <utility>
 #include <vector>
 
 #include "domain.hpp"
 #include "results.hpp"
+#include "to_eval.hpp"
 
 using namespace DomainHelpers;
 
@@ -23,8 +31,161 @@ auto xfer_fn_ptr(std::index_sequence<Is...>)
 template <std::size_t N>
 using xfer_fn_t = decltype(xfer_fn_ptr<N>(std::make_index_sequence<N>{}));
 
+inline std::size_t numShards(std::size_t numRows, unsigned int numThreads) {
+  return std::clamp<std::size_t>(numThreads, 1,
+                                 std::max<std::size_t>(numRows, 1));
+}
+
+// split [0, numRows) into numShards contiguous shards and call
+// f(shard, begin, end) for each one, shard 0 runs on the calling thread
+template <typename F>
+void forEachShard(std::size_t numRows, std::size_t numShards, const F &f) {
+  auto runShard = [&](std::size_t s) {
+    f(s, numRows * s / numShards, numRows * (s + 1) / numShards);
+  };
+
+  std::vector<std::thread> workers;
+  workers.reserve(numShards - 1);
+  for (std::size_t s = 1; s < numShards; ++s)
+    workers.emplace_back(runShard, s);
+  runShard(0);
+  for (std::thread &w : workers)
+    w.join();
+}
+
 } // namespace detail
 
+// an eval bound to its rows and fns with the types erased, so that evals over
+// different domains and bitwidths can be run side by side with runAll
+class EvalJob {
+public:
+  // f(numThreads) evals the job's numRows rows on that many threads
+  EvalJob(std::size_t numRows, std::function<Results(unsigned int)> f)
+      : rows(numRows), run(std::move(f)) {}
+
+  // runs the jobs side by side on numThreads threads in all (one of them the
+  // calling one) and returns the results in order. with fewer threads than
+  // jobs, each thread runs jobs one after another on one thread each.
+  // otherwise every job gets a thread of its own and the rest are split
+  // between the jobs in proportion to their rows
+  static std::vector<Results> runAll(const std::vector<EvalJob> &jobs,
+                                     unsigned int numThreads = 1) {
+    const std::vector<unsigned int> threads = splitThreads(jobs, numThreads);
+    std::vector<std::optional<Results>> outs(jobs.size());
+    std::vector<std::exception_ptr> errs(jobs.size());
+    std::atomic<std::size_t> next = 0;
+    auto runJobs = [&] {
+      for (std::size_t i = next++; i < jobs.size(); i = next++) {
+        try {
+          outs[i].emplace(jobs[i].run(threads[i]));
+        } catch (...) {
+          errs[i] = std::current_exception();
+        }
+      }
+    };
+
+    const std::size_t numWorkers =
+        std::min<std::size_t>(jobs.size(), std::max(numThreads, 1u));
+    std::vector<std::thread> workers;
+    for (std::size_t i = 1; i < numWorkers; ++i)
+      workers.emplace_back(runJobs);
+    runJobs();
+    for (std::thread &w : workers)
+      w.join();
+
+    for (const std::exception_ptr &e : errs)
+      if (e)
+        std::rethrow_exception(e);
+
+    std::vector<Results> r;
+    r.reserve(jobs.size());
+    for (std::optional<Results> &o : outs)
+      r.push_back(std::move(*o));
+
+    return r;
+  }
+
+private:
+  std::size_t rows;
+  std::function<Results(unsigned int)> run;
+
+  // threads per job, the spare ones given out by largest remainder
+  static std::vector<unsigned int>
+  splitThreads(const std::vector<EvalJob> &jobs, unsigned int numThreads) {
+    std::vector<unsigned int> threads(jobs.size(), 1);
+    std::size_t total = 0;
+    for (const EvalJob &job : jobs)
+      total += job.rows;
+    if (jobs.size() >= numThreads || total == 0)
+      return threads;
+
+    const std::size_t spare = numThreads - jobs.size();
+    std::size_t given = 0;
+    std::vector<std::pair<std::size_t, std::size_t>> rems;
+    for (std::size_t i = 0; i < jobs.size(); ++i) {
+      const std::size_t share = spare * jobs[i].rows;
+      threads[i] += static_cast<unsigned int>(share / total);
+      given += share / total;
+      rems.emplace_back(share % total, i);
+    }
+
+    std::ranges::stable_sort(rems, std::greater{},
+                             &std::pair<std::size_t, std::size_t>::first);
+    for (std::size_t k = 0; k < spare - given; ++k)
+      ++threads[rems[k].second];
+
+    return threads;
+  }
+};
+
+// per row meet of the base fns along with its solved flag and distance to the
+// best abstraction. it only depends on the rows and the base fns, so it can be
+// built once per solution set and reused for every candidate eval
+template <template <std::size_t> class Dom, std::size_t ResBw>
+  requires Domain<Dom, ResBw>
+class RefCache {
+public:
+  explicit RefCache(std::size_t numRows)
+      : ref(numRows), solved(numRows), baseDis(numRows) {}
+
+  std::size_t size() const noexcept { return ref.size(); }
+
+  std::vector<Dom<ResBw>> ref;
+  std::vector<std::uint8_t> solved;
+  std::vector<std::uint64_t> baseDis;
+};
+
+// the output of every xfer fn on every row, fn after fn. met with a RefCache
+// of the fns picked so far, the fns can be evaluated against the picks again
+// without being run. all of it is held at once, bytes(numFns, numRows) of it
+template <template <std::size_t> class Dom, std::size_t ResBw>
+  requires Domain<Dom, ResBw>
+class RowOutputs {
+public:
+  RowOutputs(std::size_t numFns_, std::size_t numRows_)
+      : fns(numFns_), rows(numRows_), out(numFns_ * numRows_) {}
+
+  static constexpr std::size_t bytes(std::size_t numFns,
+                                     std::size_t numRows) noexcept {
+    return numFns * numRows * sizeof(Dom<ResBw>);
+  }
+
+  std::size_t numFns() const noexcept { return fns; }
+  std::size_t size() const noexcept { return rows; }
+
+  Dom<ResBw> &at(std::size_t f, std::size_t i) noexcept {
+    return out[f * rows + i];
+  }
+  const Dom<ResBw> &at(std::size_t f, std::size_t i) const noexcept {
+    return out[f * rows + i];
+  }
+
+private:
+  std::size_t fns;
+  std::size_t rows;
+  std::vector<Dom<ResBw>> out;
+};
+
 template <template <std::size_t> class Dom, std::size_t ResBw,
           std::size_t... BWs>
   requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
@@ -33,82 +194,375 @@ public:
   static constexpr std::size_t N = sizeof...(BWs);
 
   using ResultD = Dom<ResBw>;
-  using ArgsTuple = std::tuple<Dom<BWs>...>;
-  using Row = std::tuple<Dom<BWs>..., ResultD>;
   using EvalVec = ToEval<Dom, ResBw, BWs...>;
+  using PackedArgs = std::array<typename EvalVec::Packed, N>;
+  using RefCacheT = RefCache<Dom, ResBw>;
+  using RowOutputsT = RowOutputs<Dom, ResBw>;
   using XferFn = detail::xfer_fn_t<N>;
 
 private:
+  using UnsoundCounts = std::vector<std::uint64_t>;
+
+  // the meet of the base fns on a row, whether it is the best abstraction and
+  // its distance to it
+  struct BaseRow {
+    ResultD ref;
+    bool solved;
+    std::uint64_t dis;
+  };
+
+  // an xfer fn on a row, met with the base fns, before it is counted
+  struct Outcome {
+    std::uint64_t dis;
+    bool sound;
+    bool exact;
+  };
+
+  // with unsound budgets, rows are run in blocks of this many rows per shard
+  static constexpr std::size_t budget_rows = 4096;
+
   std::vector<XferFn> xfrFns;
   std::vector<XferFn> refFns;
+  // per xfer fn, the number of unsound rows after which the fn is no longer
+  // run (0 for no limit). empty if no fn has a budget, so that evals without
+  // budgets skip the blocks
+  std::vector<std::uint64_t> unsoundBudgets;
 
 public:
   constexpr Eval(const std::vector<std::uintptr_t> &xfrAddrs,
-                 const std::vector<std::uintptr_t> &refAddrs)
-      : xfrFns(xfrAddrs.size(), nullptr), refFns(refAddrs.size(), nullptr) {
+                 const std::vector<std::uintptr_t> &refAddrs,
+                 const std::vector<std::uint64_t> &budgets = {})
+      : xfrFns(xfrAddrs.size(), nullptr), refFns(refAddrs.size(), nullptr),
+        unsoundBudgets(budgets) {
+    if (!unsoundBudgets.empty() && unsoundBudgets.size() != xfrFns.size())
+      throw std::invalid_argument("need one unsound budget per xfer fn");
+    if (std::ranges::all_of(unsoundBudgets,
+                            [](std::uint64_t b) { return b == 0; }))
+      unsoundBudgets.clear();
+
     for (std::size_t i = 0; i < xfrFns.size(); ++i)
       xfrFns[i] = reinterpret_cast<XferFn>(xfrAddrs[i]);
     for (std::size_t i = 0; i < refFns.size(); ++i)
       refFns[i] = reinterpret_cast<XferFn>(refAddrs[i]);
   }
 
-  Results eval(const EvalVec &toEval) const {
-    Results r{static_cast<unsigned int>(xfrFns.size()), ResBw,
-              ResultD::num_levels};
+  // rows are split into numThreads contiguous shards, each accumulating into
+  // its own Results. the counters are integers so the reduction is exact and
+  // the result does not depend on the thread count
+  Results eval(const EvalVec &toEval, unsigned int numThreads = 1) const {
+    UnsoundCounts unsound(unsoundBudgets.size());
+    return evalWith(toEval, unsound, numThreads);
+  }
 
-    for (const Row &row : toEval) {
-      const ArgsTuple args = take_args(row);
-      const ResultD &best = std::get<N>(row);
-      evalSingle(args, best, r);
-    }
+  // same as eval over the concatenation of chunk(0) .. chunk(numChunks - 1),
+  // but only one chunk is held at a time. unsound budgets span all chunks.
+  // the base fns are run on each chunk, so nothing per row outlives its chunk
+  template <typename F>
+  Results evalChunks(std::size_t numChunks, const F &chunk,
+                     unsigned int numThreads = 1) const {
+    UnsoundCounts unsound(unsoundBudgets.size());
+    Results r = emptyResults();
+    for (std::size_t k = 0; k < numChunks; ++k)
+      r += evalWith(chunk(k), unsound, numThreads);
 
     return r;
   }
 
-private:
-  static ArgsTuple take_args(const Row &row) {
-    return [&]<std::size_t... Is>(std::index_sequence<Is...>) {
-      return ArgsTuple{std::get<Is>(row)...};
-    }(std::make_index_sequence<N>{});
+  // same as eval, but the base fns are taken from a prebuilt RefCache
+  Results eval(const EvalVec &toEval, const RefCacheT &refs,
+               unsigned int numThreads = 1) const {
+    UnsoundCounts unsound(unsoundBudgets.size());
+    return evalWith(toEval, refs, unsound, numThreads);
   }
 
-  void evalSingle(const ArgsTuple &args, const ResultD &best,
-                  Results &r) const {
-    using BWConstTuple =
-        std::tuple<std::integral_constant<std::size_t, BWs>...>;
-    constexpr auto idxs = std::make_index_sequence<N>{};
+  RowOutputsT outputs(const EvalVec &toEval,
+                      unsigned int numThreads = 1) const {
+    RowOutputsT o{xfrFns.size(), toEval.size()};
+    detail::forEachShard(
+        toEval.size(), detail::numShards(toEval.size(), numThreads),
+        [&](std::size_t, std::size_t begin, std::size_t end) {
+          for (std::size_t i = begin; i < end; ++i) {
+            const PackedArgs args = packed_args(toEval, i);
+            for (std::size_t f = 0; f < xfrFns.size(); ++f)
+              o.at(f, i) = run_fn(xfrFns[f], args);
+          }
+        });
 
-    auto run_fns = [&](const std::vector<XferFn> &fns) {
-      std::vector<ResultD> out;
-      out.reserve(fns.size());
+    return o;
+  }
 
-      for (XferFn f : fns) {
-        auto packedRes = [&]<std::size_t... Is>(std::index_sequence<Is...>) {
-          return f(pack<std::tuple_element_t<Is, BWConstTuple>::value>(
-              std::get<Is>(args).v)...);
-        }(idxs);
-        out.emplace_back(ResultD(unpack<ResBw>(packedRes)));
-      }
+  // same as eval with the given fns of outs as xfer fns, in that order, without
+  // running them
+  static Results evalOutputs(const EvalVec &toEval, const RowOutputsT &outs,
+                             const std::vector<std::size_t> &fns,
+                             const RefCacheT &refs,
+                             unsigned int numThreads = 1) {
+    checkOutputs(toEval, outs, refs);
+    for (std::size_t f : fns)
+      if (f >= outs.numFns())
+        throw std::out_of_range("no such fn in the outputs");
 
-      return out;
+    const auto empty = [&] {
+      return Results{static_cast<unsigned int>(fns.size()), ResBw,
+                     ResultD::num_levels};
     };
+    std::vector<Results> shards(detail::numShards(toEval.size(), numThreads),
+                                empty());
+    detail::forEachShard(
+        toEval.size(), shards.size(),
+        [&](std::size_t s, std::size_t begin, std::size_t end) {
+          for (std::size_t i = begin; i < end; ++i) {
+            const ResultD best = toEval.template get<N>(i);
+            const std::uint64_t w = toEval.weight(i);
+            for (unsigned int k = 0; k < fns.size(); ++k) {
+              const ResultD x = refs.ref[i].meet(outs.at(fns[k], i));
+              const bool sound = isSuperset(x, best);
+              const std::uint64_t dis = x.distance(best);
+              shards[s].incResult(Result(sound, dis, x == best, refs.solved[i],
+                                         sound ? dis : refs.baseDis[i], w),
+                                  k);
+            }
+            shards[s].incCases(refs.solved[i], refs.baseDis[i], w);
+          }
+        });
 
-    std::vector<ResultD> synth_results = run_fns(xfrFns);
-    ResultD ref = DomainHelpers::meetAll(run_fns(refFns));
+    Results r = empty();
+    for (const Results &shard : shards)
+      r += shard;
 
-    bool solved = (ref == best);
-    unsigned long baseDis = ref.distance(best);
+    return r;
+  }
+
+  // refs with fn f of outs added to the base fns
+  static RefCacheT meetOutputs(const EvalVec &toEval, const RefCacheT &refs,
+                               const RowOutputsT &outs, std::size_t f) {
+    checkOutputs(toEval, outs, refs);
+    if (f >= outs.numFns())
+      throw std::out_of_range("no such fn in the outputs");
+
+    RefCacheT met{toEval.size()};
+    for (std::size_t i = 0; i < toEval.size(); ++i) {
+      const ResultD best = toEval.template get<N>(i);
+      met.ref[i] = refs.ref[i].meet(outs.at(f, i));
+      met.solved[i] = met.ref[i] == best;
+      met.baseDis[i] = met.ref[i].distance(best);
+    }
+
+    return met;
+  }
+
+  RefCacheT buildRefs(const EvalVec &toEval,
+                      unsigned int numThreads = 1) const {
+    RefCacheT refs{toEval.size()};
+    detail::forEachShard(
+        toEval.size(), detail::numShards(toEval.size(), numThreads),
+        [&](std::size_t, std::size_t begin, std::size_t end) {
+          for (std::size_t i = begin; i < end; ++i) {
+            const ResultD best = toEval.template get<N>(i);
+            refs.ref[i] = meetRefs(packed_args(toEval, i));
+            refs.solved[i] = refs.ref[i] == best;
+            refs.baseDis[i] = refs.ref[i].distance(best);
+          }
+        });
+
+    return refs;
+  }
+
+private:
+  Results evalWith(const EvalVec &toEval, UnsoundCounts &unsound,
+                   unsigned int numThreads) const {
+    return evalBases(
+        toEval,
+        [&](std::size_t i, const PackedArgs &args) {
+          const ResultD best = toEval.template get<N>(i);
+          const ResultD ref = meetRefs(args);
+          return BaseRow{ref, ref == best, ref.distance(best)};
+        },
+        unsound, numThreads);
+  }
 
-    for (unsigned int i = 0; i < synth_results.size(); ++i) {
-      ResultD synth_after_meet = ref.meet(synth_results[i]);
-      bool sound = DomainHelpers::isSuperset(synth_after_meet, best);
-      bool exact = (synth_after_meet == best);
-      unsigned long dis = synth_after_meet.distance(best);
-      unsigned long soundDis = sound ? dis : baseDis;
+  Results evalWith(const EvalVec &toEval, const RefCacheT &refs,
+                   UnsoundCounts &unsound, unsigned int numThreads) const {
+    if (refs.size() != toEval.size())
+      throw std::invalid_argument("RefCache was built for a different ToEval");
 
-      r.incResult(Result(sound, dis, exact, solved, soundDis), i);
+    return evalBases(
+        toEval,
+        [&](std::size_t i, const PackedArgs &) {
+          return BaseRow{refs.ref[i], refs.solved[i] != 0, refs.baseDis[i]};
+        },
+        unsound, numThreads);
+  }
+
+  // baseAt(i, args) gives the BaseRow of row i. fns over their unsound budget
+  // are skipped. whether a fn still runs on a row must not depend on how the
+  // rows are sharded, so with budgets each block of rows is run first, then
+  // every shard counts its rows in row order starting from the unsound counts
+  // of the shards before it, which makes the cutoff the same as on a single
+  // thread. a fn may still run on the rest of the block its budget is spent
+  // in, those outcomes are dropped. a row of weight w counts as w identical
+  // rows
+  template <typename BaseAt>
+  Results evalBases(const EvalVec &toEval, const BaseAt &baseAt,
+                   UnsoundCounts &unsound, unsigned int numThreads) const {
+    if (unsoundBudgets.empty()) {
+      std::vector<Results> shards(detail::numShards(toEval.size(), numThreads),
+                                  emptyResults());
+      detail::forEachShard(
+          toEval.size(), shards.size(),
+          [&](std::size_t s, std::size_t begin, std::size_t end) {
+            for (std::size_t i = begin; i < end; ++i) {
+              const PackedArgs args = packed_args(toEval, i);
+              const BaseRow b = baseAt(i, args);
+              const ResultD best = toEval.template get<N>(i);
+              const std::uint64_t w = toEval.weight(i);
+              for (unsigned int f = 0; f < xfrFns.size(); ++f)
+                count(shards[s], f, outcome(f, args, b, best), b, w);
+              shards[s].incCases(b.solved, b.dis, w);
+            }
+          });
+
+      return reduce(shards);
     }
 
-    r.incCases(solved, baseDis);
+    // each shard gets budget_rows rows of a block
+    const std::size_t block = budget_rows * std::max(numThreads, 1u);
+    std::vector<Results> shards(
+        detail::numShards(std::min(toEval.size(), block), numThreads),
+        emptyResults());
+    std::vector<unsigned int> live;
+    std::vector<BaseRow> bases;
+    std::vector<Outcome> outs;
+    // per shard and live fn, the unsound rows of the shard, then the unsound
+    // count of the fn before the shard
+    std::vector<std::uint64_t> before;
+    for (std::size_t b0 = 0; b0 < toEval.size(); b0 += block) {
+      const std::size_t rows = std::min(block, toEval.size() - b0);
+      const std::size_t numShards = detail::numShards(rows, numThreads);
+      live.clear();
+      for (unsigned int f = 0; f < xfrFns.size(); ++f)
+        if (!spent(unsound, f))
+          live.push_back(f);
+
+      const std::size_t L = live.size();
+      bases.resize(rows);
+      outs.resize(rows * L);
+      before.assign(numShards * L, 0);
+      detail::forEachShard(
+          rows, numShards,
+          [&](std::size_t s, std::size_t begin, std::size_t end) {
+            for (std::size_t j = begin; j < end; ++j) {
+              const PackedArgs args = packed_args(toEval, b0 + j);
+              const ResultD best = toEval.template get<N>(b0 + j);
+              bases[j] = baseAt(b0 + j, args);
+              for (std::size_t k = 0; k < L; ++k) {
+                outs[j * L + k] = outcome(live[k], args, bases[j], best);
+                if (!outs[j * L + k].sound)
+                  before[s * L + k] += toEval.weight(b0 + j);
+              }
+            }
+          });
+
+      // prefix sums over the shards in row order. a fn is counted on a row
+      // as long as its count before the row is under budget, as on a single
+      // thread. counts past the budget are only compared against it, so they
+      // may include rows the fn is not counted on
+      for (std::size_t k = 0; k < L; ++k) {
+        std::uint64_t total = unsound[live[k]];
+        for (std::size_t s = 0; s < numShards; ++s)
+          total += std::exchange(before[s * L + k], total);
+        unsound[live[k]] = total;
+      }
+
+      detail::forEachShard(
+          rows, numShards,
+          [&](std::size_t s, std::size_t begin, std::size_t end) {
+            for (std::size_t j = begin; j < end; ++j) {
+              const std::uint64_t w = toEval.weight(b0 + j);
+              for (std::size_t k = 0; k < L; ++k) {
+                const unsigned int f = live[k];
+                std::uint64_t &c = before[s * L + k];
+                if (overBudget(f, c))
+                  continue;
+
+                const Outcome &o = outs[j * L + k];
+                count(shards[s], f, o, bases[j], w);
+                if (!o.sound)
+                  c += w;
+              }
+              shards[s].incCases(bases[j].solved, bases[j].dis, w);
+            }
+          });
+    }
+
+    return reduce(shards);
+  }
+
+  bool spent(const UnsoundCounts &unsound, unsigned int f) const {
+    return overBudget(f, unsound[f]);
+  }
+
+  bool overBudget(unsigned int f, std::uint64_t unsound) const {
+    return unsoundBudgets[f] != 0 && unsound >= unsoundBudgets[f];
+  }
+
+  Outcome outcome(unsigned int f, const PackedArgs &args, const BaseRow &b,
+                  const ResultD &best) const {
+    const ResultD x = b.ref.meet(run_fn(xfrFns[f], args));
+    return Outcome{x.distance(best), DomainHelpers::isSuperset(x, best),
+                   x == best};
+  }
+
+  static void count(Results &r, unsigned int f, const Outcome &o,
+                    const BaseRow &b, std::uint64_t w) {
+    r.incResult(
+        Result(o.sound, o.dis, o.exact, b.solved, o.sound ? o.dis : b.dis, w),
+        f);
+  }
+
+  static void checkOutputs(const EvalVec &toEval, const RowOutputsT &outs,
+                           const RefCacheT &refs) {
+    if (outs.size() != toEval.size())
+      throw std::invalid_argument(
+          "RowOutputs were built for a different ToEval");
+    if (refs.size() != toEval.size())
+      throw std::invalid_argument("RefCache was built for a different ToEval");
+  }
+
+  Results emptyResults() const {
+    return Results{static_cast<unsigned int>(xfrFns.size()), ResBw,
+                   ResultD::num_levels};
+  }
+
+  Results reduce(const std::vector<Results> &shards) const {
+    Results r = emptyResults();
+    for (const Results &shard : shards)
+      r += shard;
+
+    return r;
+  }
+
+  static PackedArgs packed_args(const EvalVec &toEval, std::size_t i) {
+    return [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+      return PackedArgs{toEval.template packed<Is>(i)...};
+    }(std::make_index_sequence<N>{});
+  }
+
+  static ResultD run_fn(XferFn f, const PackedArgs &args) {
+    return [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+      return ResultD(unpack<ResBw>(f(args[Is]...)));
+    }(std::make_index_sequence<N>{});
+  }
+
+  // same fold as meetAll, without collecting the results first
+  ResultD meetRefs(const PackedArgs &args) const {
+    if (refFns.empty())
+      return ResultD::top();
+
+    ResultD ref = run_fn(refFns[0], args);
+    for (std::size_t i = 1; i < refFns.size(); ++i)
+      ref = ref.meet(run_fn(refFns[i], args));
+
+    return ref;
   }
 };
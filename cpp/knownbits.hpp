@@ -26,6 +26,11 @@ public:
 
   constexpr const BV &operator[](std::size_t i) const noexcept { return v[i]; }
 
+  // the bits that can be 0 and the bits that can be 1 in a concrete value
+  constexpr const std::array<BV, 2> maybeBits() const noexcept {
+    return {~one(), ~zero()};
+  }
+
   friend std::ostream &operator<<(std::ostream &os, const KnownBits &x) {
     if (x.isBottom()) {
       return os << "(bottom)\n";
@@ -120,6 +125,12 @@ public:
     return KnownBits({~x, x});
   }
 
+  // the values whose bits in may0 can be 0 and whose bits in may1 can be 1
+  static constexpr const KnownBits
+  fromMaybeBits(const APInt<BW> &may0, const APInt<BW> &may1) noexcept {
+    return KnownBits({~may1, ~may0});
+  }
+
   const APInt<BW> sample_concrete(std::mt19937 &rng) const {
     std::uniform_int_distribution<unsigned long> dist(
         0, APInt<BW>::getAllOnes().getZExtValue());
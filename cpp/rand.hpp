@@ -1,9 +1,12 @@
 #pragma once
 
+#include <algorithm>
 #include <cassert>
 #include <cmath>
+#include <cstddef>
 #include <cstdint>
 #include <random>
+#include <vector>
 
 namespace rngdist {
 
@@ -38,14 +41,123 @@ namespace detail {
   return static_cast<std::uint64_t>(static_cast<__uint128_t>(lo) + idx);
 }
 
+// span of a normal beyond which it has no mass to speak of, in stddevs
+inline constexpr double tail_sigmas = 12.0;
+
+[[nodiscard]] inline double normal_cdf(double z) noexcept {
+  return 0.5 * std::erfc(-z / std::sqrt(2.0));
+}
+
+// a density on [0, 1] sampled with a single uniform draw, by looking it up in
+// its inverse cdf tabulated once. the cdf is summed over cells of [xa, xb],
+// outside of which the density is taken to be 0, and a draw is placed in the
+// cell it falls in, linearly within it. a guide of the cells table_size evenly
+// spaced probabilities fall in narrows the search for that cell
+class InverseCdf {
+public:
+  static constexpr std::size_t cells = std::size_t{1} << 16;
+  static constexpr std::size_t table_size = std::size_t{1} << 12;
+
+  // mass(a, b) is the mass of the density on [a, b], up to a constant factor
+  template <typename Mass>
+  InverseCdf(double xa_, double xb, const Mass &mass)
+      : xa(std::clamp(xa_, 0.0, 1.0)), cdf(cells + 1), guide(table_size + 1) {
+    xb = std::clamp(xb, xa, 1.0);
+    w = (xb - xa) / static_cast<double>(cells);
+
+    for (std::size_t c = 0; c < cells; ++c) {
+      const double a = xa + w * static_cast<double>(c);
+      cdf[c + 1] = cdf[c] + std::max(mass(a, a + w), 0.0);
+    }
+
+    // no mass to speak of, fall back to uniform
+    if (!(cdf[cells] > 0.0))
+      for (std::size_t c = 0; c <= cells; ++c)
+        cdf[c] = static_cast<double>(c);
+
+    std::size_t c = 0;
+    for (std::size_t k = 0; k <= table_size; ++k) {
+      const double u = cdf[cells] * static_cast<double>(k) /
+                       static_cast<double>(table_size);
+      while (c + 1 < cells && cdf[c + 1] <= u)
+        ++c;
+      guide[k] = c;
+    }
+  }
+
+  [[nodiscard]] double operator()(Engine &g) const noexcept {
+    return at(uniform01(g));
+  }
+
+  // the density put through its inverse cdf at u in [0, 1)
+  [[nodiscard]] double at(double u) const noexcept {
+    u = std::clamp(u, 0.0, 1.0);
+    const double t = u * cdf[cells];
+    const std::size_t k = std::min(
+        static_cast<std::size_t>(u * static_cast<double>(table_size)),
+        table_size - 1);
+
+    // the cell with cdf[c] <= t < cdf[c + 1], between the guides of k
+    const auto first = cdf.begin() + static_cast<std::ptrdiff_t>(guide[k] + 1);
+    const auto last =
+        cdf.begin() + static_cast<std::ptrdiff_t>(guide[k + 1] + 1);
+    const std::size_t c = static_cast<std::size_t>(
+        std::upper_bound(first, last, t) - cdf.begin() - 1);
+
+    const double m = cdf[c + 1] - cdf[c];
+    const double frac = m > 0.0 ? std::clamp((t - cdf[c]) / m, 0.0, 1.0) : 0.0;
+    return xa + w * (static_cast<double>(c) + frac);
+  }
+
+private:
+  double xa;
+  double w = 0.0;
+  std::vector<double> cdf;
+  std::vector<std::size_t> guide;
+};
+
+// mass of the normal density of mean mu and stddev sigma on [a, b]
+[[nodiscard]] inline double normal_mass(double mu, double sigma, double a,
+                                        double b) noexcept {
+  return normal_cdf((b - mu) / sigma) - normal_cdf((a - mu) / sigma);
+}
+
+// the skew normal 0.5 + sigma * z with z of density 2 phi(z) Phi(shape z),
+// drawn by z = delta |u| + sqrt(1 - delta^2) v for standard normal u and v
+inline InverseCdf skew_normal_icdf(double sigma, double shape) {
+  return InverseCdf(0.5 - tail_sigmas * sigma, 0.5 + tail_sigmas * sigma,
+                    [=](double a, double b) {
+                      const double z = ((a + b) / 2.0 - 0.5) / sigma;
+                      return std::exp(-z * z / 2.0) * normal_cdf(shape * z) *
+                             (b - a);
+                    });
+}
+
 } // namespace detail
 
+// how the unit draws behind the levels of a set of rows are spread over
+// [0, 1): each on its own, one per stratum, or along a low discrepancy
+// sequence. only iid goes through sample, the others through level
+enum class Spread { iid, stratified, quasi };
+
 struct Sampler {
   virtual ~Sampler() = default;
 
+  Spread spread = Spread::iid;
+
   [[nodiscard]] virtual std::uint64_t sample(Engine &rng, std::uint64_t lo,
                                              std::uint64_t hi) const = 0;
 
+  // the unit draw u in [0, 1) put through the inverse cdf of the distribution
+  [[nodiscard]] virtual double quantile(double u) const = 0;
+
+  // the value in [lo, hi] a unit draw u in [0, 1) stands for
+  [[nodiscard]] std::uint64_t level(double u, std::uint64_t lo,
+                                    std::uint64_t hi) const {
+    assert(lo <= hi);
+    return detail::map_unit_to_u64(quantile(u), lo, hi);
+  }
+
   [[nodiscard]] std::uint64_t operator()(Engine &rng, std::uint64_t lo,
                                          std::uint64_t hi) const {
     return sample(rng, lo, hi);
@@ -59,96 +171,91 @@ struct UniformSampler final : Sampler {
     std::uniform_int_distribution<std::uint64_t> d{lo, hi};
     return d(rng);
   }
+
+  [[nodiscard]] double quantile(double u) const override { return u; }
 };
 
 struct NormalSampler final : Sampler {
-  explicit NormalSampler(double sigma_) : sigma(sigma_) {}
+  explicit NormalSampler(double sigma_)
+      : sigma(sigma_),
+        icdf(0.5 - detail::tail_sigmas * sigma_,
+             0.5 + detail::tail_sigmas * sigma_, [=](double a, double b) {
+               return detail::normal_mass(0.5, sigma_, a, b);
+             }) {
+    assert(std::isfinite(sigma) && sigma > 0.0);
+  }
   double sigma;
 
   [[nodiscard]] std::uint64_t sample(Engine &rng, std::uint64_t lo,
                                      std::uint64_t hi) const override {
     assert(lo <= hi);
-    assert(std::isfinite(sigma) && sigma > 0.0);
-
-    static thread_local std::normal_distribution<double> nd{0.0, 1.0};
+    return detail::map_unit_to_u64(icdf(rng), lo, hi);
+  }
 
-    for (int iter = 0; iter < 10'000; ++iter) {
-      const double x = 0.5 + sigma * nd(rng);
-      if (x >= 0.0 && x <= 1.0) {
-        return detail::map_unit_to_u64(x, lo, hi);
-      }
-    }
-    return detail::map_unit_to_u64(detail::uniform01(rng), lo, hi);
+  [[nodiscard]] double quantile(double u) const override {
+    return icdf.at(u);
   }
+
+private:
+  detail::InverseCdf icdf;
 };
 
 struct SkewNormalLeftSampler final : Sampler {
   SkewNormalLeftSampler(double sigma_, double alpha_)
-      : sigma(sigma_), alpha(alpha_) {}
+      : sigma(sigma_), alpha(alpha_),
+        icdf(detail::skew_normal_icdf(sigma_, -std::fabs(alpha_))) {
+    assert(std::isfinite(sigma) && sigma > 0.0);
+    assert(std::isfinite(alpha));
+  }
   double sigma;
   double alpha; // magnitude
 
   [[nodiscard]] std::uint64_t sample(Engine &rng, std::uint64_t lo,
                                      std::uint64_t hi) const override {
     assert(lo <= hi);
-    assert(std::isfinite(sigma) && sigma > 0.0);
-    assert(std::isfinite(alpha));
+    return detail::map_unit_to_u64(icdf(rng), lo, hi);
+  }
 
-    static thread_local std::normal_distribution<double> nd{0.0, 1.0};
-
-    const double a = -std::fabs(alpha);
-    const double denom = std::sqrt(1.0 + a * a);
-    const double delta = a / denom;
-    const double s = std::sqrt(1.0 - delta * delta);
-
-    for (int iter = 0; iter < 10'000; ++iter) {
-      const double u = nd(rng);
-      const double v = nd(rng);
-      const double z = delta * std::fabs(u) + s * v;
-      const double x = 0.5 + sigma * z;
-      if (x >= 0.0 && x <= 1.0) {
-        return detail::map_unit_to_u64(x, lo, hi);
-      }
-    }
-    return detail::map_unit_to_u64(detail::uniform01(rng), lo, hi);
+  [[nodiscard]] double quantile(double u) const override {
+    return icdf.at(u);
   }
+
+private:
+  detail::InverseCdf icdf;
 };
 
 struct SkewNormalRightSampler final : Sampler {
   SkewNormalRightSampler(double sigma_, double alpha_)
-      : sigma(sigma_), alpha(alpha_) {}
+      : sigma(sigma_), alpha(alpha_),
+        icdf(detail::skew_normal_icdf(sigma_, std::fabs(alpha_))) {
+    assert(std::isfinite(sigma) && sigma > 0.0);
+    assert(std::isfinite(alpha));
+  }
   double sigma;
   double alpha; // magnitude
 
   [[nodiscard]] std::uint64_t sample(Engine &rng, std::uint64_t lo,
                                      std::uint64_t hi) const override {
     assert(lo <= hi);
-    assert(std::isfinite(sigma) && sigma > 0.0);
-    assert(std::isfinite(alpha));
+    return detail::map_unit_to_u64(icdf(rng), lo, hi);
+  }
 
-    static thread_local std::normal_distribution<double> nd{0.0, 1.0};
-
-    const double a = +std::fabs(alpha);
-    const double denom = std::sqrt(1.0 + a * a);
-    const double delta = a / denom;
-    const double s = std::sqrt(1.0 - delta * delta);
-
-    for (int iter = 0; iter < 10'000; ++iter) {
-      const double u = nd(rng);
-      const double v = nd(rng);
-      const double z = delta * std::fabs(u) + s * v;
-      const double x = 0.5 + sigma * z;
-      if (x >= 0.0 && x <= 1.0) {
-        return detail::map_unit_to_u64(x, lo, hi);
-      }
-    }
-    return detail::map_unit_to_u64(detail::uniform01(rng), lo, hi);
+  [[nodiscard]] double quantile(double u) const override {
+    return icdf.at(u);
   }
+
+private:
+  detail::InverseCdf icdf;
 };
 
+// an even mix of normals at 0.5 -+ separation, clamped to [0, 0.49]
 struct BimodalSymmetricSampler final : Sampler {
   BimodalSymmetricSampler(double sigma_, double separation_)
-      : sigma(sigma_), separation(separation_) {}
+      : sigma(sigma_), separation(separation_),
+        icdf(bimodal_icdf(sigma_, std::clamp(separation_, 0.0, 0.49))) {
+    assert(std::isfinite(sigma) && sigma > 0.0);
+    assert(std::isfinite(separation));
+  }
 
   double sigma;
   double separation;
@@ -156,26 +263,23 @@ struct BimodalSymmetricSampler final : Sampler {
   [[nodiscard]] std::uint64_t sample(Engine &rng, std::uint64_t lo,
                                      std::uint64_t hi) const override {
     assert(lo <= hi);
-    assert(std::isfinite(sigma) && sigma > 0.0);
-    assert(std::isfinite(separation));
+    return detail::map_unit_to_u64(icdf(rng), lo, hi);
+  }
 
-    static thread_local std::normal_distribution<double> nd{0.0, 1.0};
-    std::bernoulli_distribution pick_right{0.5};
-
-    double sep = separation;
-    if (sep < 0.0)
-      sep = 0.0;
-    else if (sep > 0.49)
-      sep = 0.49;
-
-    for (int iter = 0; iter < 10'000; ++iter) {
-      const double mu = pick_right(rng) ? (0.5 + sep) : (0.5 - sep);
-      const double x = mu + sigma * nd(rng);
-      if (x >= 0.0 && x <= 1.0) {
-        return detail::map_unit_to_u64(x, lo, hi);
-      }
-    }
-    return detail::map_unit_to_u64(detail::uniform01(rng), lo, hi);
+  [[nodiscard]] double quantile(double u) const override {
+    return icdf.at(u);
+  }
+
+private:
+  detail::InverseCdf icdf;
+
+  static detail::InverseCdf bimodal_icdf(double sd, double sep) {
+    return detail::InverseCdf(
+        0.5 - sep - detail::tail_sigmas * sd,
+        0.5 + sep + detail::tail_sigmas * sd, [=](double a, double b) {
+          return detail::normal_mass(0.5 - sep, sd, a, b) +
+                 detail::normal_mass(0.5 + sep, sd, a, b);
+        });
   }
 };
 
@@ -1,18 +1,31 @@
 #pragma once
 
+#include <array>
+#include <cstddef>
+#include <cstdint>
 #include <functional>
 #include <iomanip>
 #include <iostream>
 #include <string_view>
+#include <type_traits>
 #include <vector>
 
 class Result {
 public:
+  // column order of the (numFns, num_fields) buffer exposed to python
+  static constexpr std::size_t num_fields = 6;
+  static constexpr std::array<std::string_view, num_fields> fields = {
+      "sound",          "distance", "exact", "unsolved_exact",
+      "sound_distance", "rows"};
+
   Result() = default;
 
-  Result(bool s, unsigned long p, bool e, bool solved, unsigned long sd)
-      : sound(s), distance(p), exact(e), soundDistance(sd) {
-    unsolvedExact = !solved ? e : 0;
+  // the outcome on a row standing for w identical ones
+  Result(bool s, std::uint64_t p, bool e, bool solved, std::uint64_t sd,
+         std::uint64_t w = 1)
+      : sound(s ? w : 0), distance(p * w), exact(e ? w : 0),
+        soundDistance(sd * w), rows(w) {
+    unsolvedExact = !solved ? exact : 0;
   }
 
   Result &operator+=(const Result &rhs) {
@@ -21,6 +34,7 @@ public:
     exact += rhs.exact;
     unsolvedExact += rhs.unsolvedExact;
     soundDistance += rhs.soundDistance;
+    rows += rhs.rows;
 
     return *this;
   }
@@ -28,24 +42,29 @@ public:
   friend class Results;
 
 private:
-  unsigned long sound;
-  unsigned long distance;
-  unsigned long exact;
-  unsigned long unsolvedExact;
-  unsigned long soundDistance;
+  std::uint64_t sound = {};
+  std::uint64_t distance = {};
+  std::uint64_t exact = {};
+  std::uint64_t unsolvedExact = {};
+  std::uint64_t soundDistance = {};
+  // rows the fn was run on, less than the case count if its eval was aborted
+  std::uint64_t rows = {};
 };
 
+static_assert(std::is_standard_layout_v<Result>);
+static_assert(sizeof(Result) == Result::num_fields * sizeof(std::uint64_t));
+
 class Results {
 private:
   const unsigned int bw = {};
   std::vector<Result> r;
-  unsigned int cases = {};
-  unsigned int unsolvedCases = {};
-  unsigned int baseDistance = {};
+  std::uint64_t cases = {};
+  std::uint64_t unsolvedCases = {};
+  std::uint64_t baseDistance = {};
   std::uint64_t (*maxDist)() = {};
 
   void printMember(std::ostream &os, std::string_view name,
-                   const std::function<unsigned int(const Result &x)> &getter,
+                   const std::function<std::uint64_t(const Result &x)> &getter,
                    bool md) const {
     os << std::left << std::setw(20) << name;
     os << "[";
@@ -87,15 +106,38 @@ public:
     x.printMember(
         os, "sound distance:", [](const Result &x) { return x.soundDistance; },
         true);
+    x.printMember(
+        os, "num rows:", [](const Result &x) { return x.rows; }, false);
 
     return os << "\n";
   }
 
   void incResult(const Result &newR, unsigned int i) { r[i] += newR; }
 
-  void incCases(bool solved, unsigned long dis) {
-    cases += 1;
-    unsolvedCases += !solved ? 1 : 0;
-    baseDistance += dis;
+  // merge the counters of another shard evaluated with the same fns
+  Results &operator+=(const Results &rhs) {
+    for (std::size_t i = 0; i < r.size(); ++i)
+      r[i] += rhs.r[i];
+
+    cases += rhs.cases;
+    unsolvedCases += rhs.unsolvedCases;
+    baseDistance += rhs.baseDistance;
+
+    return *this;
+  }
+
+  void incCases(bool solved, std::uint64_t dis, std::uint64_t w = 1) {
+    cases += w;
+    unsolvedCases += !solved ? w : 0;
+    baseDistance += dis * w;
   }
+
+  // raw accessors backing the python buffer interface
+  const Result *data() const noexcept { return r.data(); }
+  std::size_t numFns() const noexcept { return r.size(); }
+  unsigned int getBw() const noexcept { return bw; }
+  std::uint64_t getCases() const noexcept { return cases; }
+  std::uint64_t getUnsolvedCases() const noexcept { return unsolvedCases; }
+  std::uint64_t getBaseDistance() const noexcept { return baseDistance; }
+  std::uint64_t getMaxDist() const noexcept { return maxDist(); }
 };
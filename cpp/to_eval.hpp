@@ -0,0 +1,244 @@
+#pragma once
+
+#include <algorithm>
+#include <array>
+#include <cstddef>
+#include <cstdint>
+#include <functional>
+#include <iterator>
+#include <stdexcept>
+#include <tuple>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+#include "domain.hpp"
+
+using namespace DomainHelpers;
+
+// Rows of (args..., best abstraction) stored struct of arrays style. Every
+// field of every domain value gets its own column, and all columns live in one
+// column major buffer, so the eval kernel streams each field linearly and
+// never materializes APInt tuples. Lanes use the narrowest unsigned type the
+// widest bitwidth of the row fits in, and are widened when read.
+template <template <std::size_t> class Dom, std::size_t ResBw,
+          std::size_t... BWs>
+  requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
+class ToEval {
+public:
+  static constexpr std::size_t N = sizeof...(BWs);
+  static constexpr std::size_t arity = Dom<ResBw>::arity;
+  static constexpr std::size_t num_cols = (N + 1) * arity;
+
+  static constexpr std::size_t max_bw = std::max({ResBw, BWs...});
+
+  using Lane = std::conditional_t<
+      (max_bw <= 8), std::uint8_t,
+      std::conditional_t<
+          (max_bw <= 16), std::uint16_t,
+          std::conditional_t<(max_bw <= 32), std::uint32_t, std::uint64_t>>>;
+  using Row = std::tuple<Dom<BWs>..., Dom<ResBw>>;
+  using Packed = std::array<std::uint64_t, arity>;
+
+  using BWConstTuple =
+      std::tuple<std::integral_constant<std::size_t, BWs>...,
+                 std::integral_constant<std::size_t, ResBw>>;
+
+  // bitwidths of the domain values in a row, the result is last
+  static constexpr std::array<std::size_t, N + 1> bws = {BWs..., ResBw};
+
+  // bitwidth of the I'th domain value in a row, the result is at I == N
+  template <std::size_t I>
+  static constexpr std::size_t bw_of =
+      std::tuple_element_t<I, BWConstTuple>::value;
+
+  class Iterator {
+  public:
+    using iterator_category = std::input_iterator_tag;
+    using value_type = Row;
+    using difference_type = std::ptrdiff_t;
+    using pointer = void;
+    using reference = Row;
+
+    Iterator(const ToEval *v_, std::size_t i_) : v(v_), i(i_) {}
+
+    Row operator*() const { return (*v)[i]; }
+    Iterator &operator++() {
+      ++i;
+      return *this;
+    }
+    Iterator operator++(int) {
+      Iterator tmp = *this;
+      ++i;
+      return tmp;
+    }
+    bool operator==(const Iterator &rhs) const { return i == rhs.i; }
+    bool operator!=(const Iterator &rhs) const { return i != rhs.i; }
+
+  private:
+    const ToEval *v;
+    std::size_t i;
+  };
+
+  ToEval() = default;
+
+  // numRows rows, with column c of row i set to lane(i, c) and the given
+  // weights (all 1 if empty). throws if a lane does not fit in the bitwidth of
+  // its column
+  template <typename F>
+  static ToEval fromLanes(std::size_t numRows, const F &lane,
+                          std::vector<std::uint64_t> weights = {}) {
+    if (!weights.empty() && weights.size() != numRows)
+      throw std::invalid_argument("need one weight per row");
+
+    ToEval v;
+    v.wts = std::move(weights);
+    v.regrow(numRows);
+    for (std::size_t c = 0; c < num_cols; ++c) {
+      const std::size_t bw = bws[c / arity];
+      const std::uint64_t mask = bw == 64 ? ~std::uint64_t{0}
+                                          : (std::uint64_t{1} << bw) - 1;
+      for (std::size_t i = 0; i < numRows; ++i) {
+        const std::uint64_t x = lane(i, c);
+        if (x & ~mask)
+          throw std::invalid_argument("lane does not fit in its bitwidth");
+
+        v.buf[c * v.cap + i] = static_cast<Lane>(x);
+      }
+    }
+    v.rows = numRows;
+
+    return v;
+  }
+
+  std::size_t size() const noexcept { return rows; }
+  std::size_t capacity() const noexcept { return cap; }
+
+  void reserve(std::size_t n) {
+    if (n > cap)
+      regrow(n);
+  }
+
+  void push_back(const Row &row) {
+    if (rows == cap)
+      regrow(std::max<std::size_t>(2 * cap, 64));
+    if (!wts.empty())
+      wts.push_back(1);
+
+    [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+      (store(Is, rows, pack<bw_of<Is>>(std::get<Is>(row).v)), ...);
+    }(std::make_index_sequence<N + 1>{});
+    ++rows;
+  }
+
+  // packed lanes of the I'th domain value of row i, as passed to the jit'd fns
+  template <std::size_t I> Packed packed(std::size_t i) const noexcept {
+    Packed p{};
+    for (std::size_t k = 0; k < arity; ++k)
+      p[k] = buf[(I * arity + k) * cap + i];
+
+    return p;
+  }
+
+  template <std::size_t I> Dom<bw_of<I>> get(std::size_t i) const {
+    return Dom<bw_of<I>>(unpack<bw_of<I>>(packed<I>(i)));
+  }
+
+  Row operator[](std::size_t i) const {
+    return [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+      return Row{get<Is>(i)...};
+    }(std::make_index_sequence<N + 1>{});
+  }
+
+  // the rows of o added after the rows of this one
+  void append(const ToEval &o) {
+    reserve(rows + o.rows);
+    if (!wts.empty() || !o.wts.empty()) {
+      wts.resize(rows, 1);
+      for (std::size_t i = 0; i < o.rows; ++i)
+        wts.push_back(o.weight(i));
+    }
+
+    for (std::size_t c = 0; c < num_cols; ++c)
+      std::copy_n(o.buf.begin() + static_cast<std::ptrdiff_t>(c * o.cap),
+                  o.rows,
+                  buf.begin() + static_cast<std::ptrdiff_t>(c * cap + rows));
+    rows += o.rows;
+  }
+
+  // the number of identical rows row i stands for
+  std::uint64_t weight(std::size_t i) const noexcept {
+    return wts.empty() ? 1 : wts[i];
+  }
+
+  // empty if every row has weight 1
+  const std::vector<std::uint64_t> &weights() const noexcept { return wts; }
+
+  // identical rows collapsed into the first one, with the weights summed. the
+  // counters of an eval are the same as on the original rows
+  ToEval dedup() const {
+    std::unordered_map<Lanes, std::size_t, LanesHash> seen;
+    seen.reserve(rows);
+
+    ToEval v;
+    v.regrow(rows);
+    for (std::size_t i = 0; i < rows; ++i) {
+      Lanes key{};
+      for (std::size_t c = 0; c < num_cols; ++c)
+        key[c] = buf[c * cap + i];
+
+      const auto [it, inserted] = seen.try_emplace(key, v.rows);
+      if (!inserted) {
+        v.wts[it->second] += weight(i);
+        continue;
+      }
+
+      for (std::size_t c = 0; c < num_cols; ++c)
+        v.buf[c * v.cap + v.rows] = key[c];
+      v.wts.push_back(weight(i));
+      ++v.rows;
+    }
+
+    return v;
+  }
+
+  // column c of row i is at data()[c * capacity() + i]
+  const Lane *data() const noexcept { return buf.data(); }
+
+  Iterator begin() const { return Iterator(this, 0); }
+  Iterator end() const { return Iterator(this, rows); }
+
+private:
+  using Lanes = std::array<Lane, num_cols>;
+
+  struct LanesHash {
+    std::size_t operator()(const Lanes &l) const noexcept {
+      std::size_t h = 0;
+      for (Lane x : l)
+        h ^= std::hash<Lane>{}(x) + 0x9e3779b97f4a7c15ULL + (h << 6) + (h >> 2);
+
+      return h;
+    }
+  };
+
+  std::vector<Lane> buf;
+  std::size_t rows = 0;
+  std::size_t cap = 0;
+  // per row weights, empty if every row has weight 1
+  std::vector<std::uint64_t> wts;
+
+  void store(std::size_t d, std::size_t i, const Packed &p) noexcept {
+    for (std::size_t k = 0; k < arity; ++k)
+      buf[(d * arity + k) * cap + i] = static_cast<Lane>(p[k]);
+  }
+
+  void regrow(std::size_t newCap) {
+    std::vector<Lane> newBuf(num_cols * newCap);
+    for (std::size_t c = 0; c < num_cols; ++c)
+      std::copy_n(buf.begin() + static_cast<std::ptrdiff_t>(c * cap), rows,
+                  newBuf.begin() + static_cast<std::ptrdiff_t>(c * newCap));
+
+    buf = std::move(newBuf);
+    cap = newCap;
+  }
+};
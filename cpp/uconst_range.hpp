@@ -25,6 +25,11 @@ public:
 
   constexpr const BV &operator[](std::size_t i) const noexcept { return v[i]; }
 
+  // the least and greatest concrete values
+  constexpr const std::array<BV, 2> endpoints() const noexcept {
+    return {lower(), upper()};
+  }
+
   friend std::ostream &operator<<(std::ostream &os, const UConstRange &x) {
     if (x.isBottom()) {
       return os << "(bottom)\n";
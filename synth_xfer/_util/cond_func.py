@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from hashlib import sha256
 from typing import Callable
 
 from xdsl.dialects.builtin import StringAttr, i1
@@ -8,6 +9,21 @@ from xdsl_smt.dialects.transfer import AbstractValueType, GetOp, MakeOp, SelectO
 from synth_xfer._util.dce import dce
 
 
+def _canonical(fn: FuncOp) -> str:
+    "fn after DCE, printed with its name and the names of its values left out"
+    fn = dce(fn.clone())
+    fn.sym_name = StringAttr("f")
+    for op in fn.walk():
+        for res in op.results:
+            res.name_hint = None
+        for region in op.regions:
+            for block in region.blocks:
+                for arg in block.args:
+                    arg.name_hint = None
+
+    return str(fn)
+
+
 @dataclass
 class FunctionWithCondition:
     """
@@ -105,6 +121,17 @@ class FunctionWithCondition:
         )
         return whole_function
 
+    def structural_key(self) -> str:
+        """
+        Hash of the body and condition up to dead code and names, the same for every
+        proposal of a program however it was named.
+        """
+        parts = [_canonical(self.func)]
+        if self.cond is not None:
+            parts.append(_canonical(self.cond))
+
+        return sha256("\n".join(parts).encode()).hexdigest()
+
     def lower(self, lowerer: Callable[[FuncOp], dict]) -> dict[int, str]:
         lowerer(self.func)
         lowerer(self.cond) if self.cond else None
@@ -12,8 +12,13 @@ def general_cost(a: float, b: float, s: float, p: float) -> float:
 
 
 def general_sound_and_dist_cost(a: float, b: float, res: EvalResult) -> float:
+    """
+    An aborted result only covers the inputs the candidate ran on before it ran
+    out of unsound budget: the skipped inputs count as unsound and its partial
+    distance is not trusted, so it is scored as making no improvement.
+    """
     sound = res.get_sound_prop()
-    improve = res.get_potential_improve()
+    improve = 0 if res.aborted else res.get_potential_improve()
     return general_cost(a, b, sound, improve)
 
 
@@ -1,9 +1,17 @@
-from typing import TYPE_CHECKING, Callable
-
+from dataclasses import dataclass
+from hashlib import sha256
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from typing import TYPE_CHECKING, Any, Callable
+
+import numpy as np
+from numpy.lib.format import open_memmap
 from xdsl.parser import IntegerType
 from xdsl_smt.dialects.transfer import TransIntegerType
 
 from synth_xfer import _eval_engine
+from synth_xfer._util.domain import AbstractDomain
 from synth_xfer._util.eval_result import EvalResult, PerBitRes
 from synth_xfer._util.jit import Jit
 from synth_xfer._util.lower import LowerToLLVM
@@ -11,60 +19,127 @@ from synth_xfer._util.parse_mlir import HelperFuncs
 from synth_xfer._util.random import Sampler
 
 if TYPE_CHECKING:
-    from synth_xfer._eval_engine import Results, ToEval
-
+    from synth_xfer._eval_engine import (
+        ConcTable,
+        EvalJob,
+        RefCache,
+        Results,
+        RowOutputs,
+        ToEval,
+    )
 
-def get_per_bit(a: "Results") -> list[PerBitRes]:
-    x = str(a).split("\n")
 
-    def get[T](in_str: str, to_match: str, parser: Callable[[str], T]) -> T:
-        og_str, to_parse = in_str.split(":")
+@dataclass
+class LowStream:
+    """
+    Exhaustive inputs enumerated once into a file and mapped from it, evaluated
+    chunk_rows at a time instead of kept in memory
+    """
 
-        assert og_str.strip() == to_match
+    to_eval_cls: type["ToEval"]
+    "The ToEval class the inputs would be stored in"
+    lanes: np.ndarray
+    "(rows, columns) memory mapped lanes, laid out as the buffer of a ToEval"
+    chunk_rows: int
 
-        return parser(to_parse)
+    def __len__(self) -> int:
+        "The number of chunks"
+        return (len(self.lanes) + self.chunk_rows - 1) // self.chunk_rows
 
-    def get_ints(s: str) -> list[int]:
-        return eval(s)
+    def chunk(self, k: int) -> "ToEval":
+        return self.to_eval_cls(
+            self.lanes[k * self.chunk_rows : (k + 1) * self.chunk_rows]
+        )
 
-    def get_floats(s: str) -> list[float]:
-        return eval(s)
 
-    bw = get(x[0], "bw", int)
-    num_cases = get(x[1], "num cases", int)
-    num_unsolved_cases = get(x[2], "num unsolved", int)
-    base_distance = get(x[3], "base distance", float)
-    sound = get(x[4], "num sound", get_ints)
-    distance = get(x[5], "distance", get_floats)
-    exact = get(x[6], "num exact", get_ints)
-    num_unsolved_exact_cases = get(x[7], "num unsolved exact", get_ints)
-    sound_distance = get(x[8], "sound distance", get_floats)
+def get_per_bit(a: "Results") -> list[PerBitRes]:
+    counters = np.asarray(a)
+    assert counters.shape[0] > 0, "No output from EvalEngine"
+    assert counters.shape[1] == len(a.fields), "EvalEngine output mismatch"
 
-    assert len(sound) > 0, "No output from EvalEngine"
-    assert (
-        len(sound)
-        == len(distance)
-        == len(exact)
-        == len(num_unsolved_exact_cases)
-        == len(sound_distance)
-    ), "EvalEngine output mismatch"
+    max_dist = float(a.max_dist)
+    sound, distance, exact, unsolved_exact, sound_distance, rows = counters.T.tolist()
 
     return [
         PerBitRes(
-            all_cases=num_cases,
+            all_cases=a.cases,
             sounds=sound[i],
             exacts=exact[i],
-            dist=distance[i],
-            unsolved_cases=num_unsolved_cases,
-            unsolved_exacts=num_unsolved_exact_cases[i],
-            base_dist=base_distance,
-            sound_dist=sound_distance[i],
-            bitwidth=bw,
+            dist=distance[i] / max_dist,
+            unsolved_cases=a.unsolved_cases,
+            unsolved_exacts=unsolved_exact[i],
+            base_dist=a.base_distance / max_dist,
+            sound_dist=sound_distance[i] / max_dist,
+            bitwidth=a.bw,
+            aborted=rows[i] < a.cases,
         )
-        for i in range(len(sound))
+        for i in range(counters.shape[0])
     ]
 
 
+# part of the enum cache key, bump it whenever the enumeration changes
+_ENUM_CACHE_VERSION = 4
+
+
+def _save_npy(path: Path, x: np.ndarray) -> None:
+    # written under a unique name and moved in place, so concurrent runs never
+    # see a partial file
+    with NamedTemporaryFile(dir=path.parent, suffix=".npy", delete=False) as f:
+        np.save(f, x)
+    os.replace(f.name, path)
+
+
+def _save_chunks(
+    path: Path,
+    num_rows: int,
+    chunk_rows: int,
+    enum: Callable[[int, int], "ToEval"],
+) -> None:
+    """
+    Rows [0, num_rows) of an enumeration saved to path the way _load_or_enum saves
+    them. The rows are made by enum(begin, end) chunk_rows at a time, so they are
+    never all held in memory.
+    """
+
+    with TemporaryDirectory(dir=path.parent) as tmp:
+        lanes_tmp = Path(tmp) / "lanes.npy"
+        lanes = None
+        for begin in range(0, num_rows, chunk_rows):
+            end = min(num_rows, begin + chunk_rows)
+            x = np.asarray(enum(begin, end))
+            if lanes is None:
+                # column major, like the buffer of a ToEval that np.save writes
+                lanes = open_memmap(
+                    lanes_tmp, "w+", x.dtype, (num_rows, x.shape[1]), fortran_order=True
+                )
+
+            lanes[begin:end] = x
+
+        assert lanes is not None
+        lanes.flush()
+        os.replace(lanes_tmp, path)
+
+
+def _load_or_enum[T](
+    cache_dir: Path | None,
+    key: str,
+    cls: Callable[[np.ndarray], T],
+    enum: Callable[[], T],
+) -> T:
+    if cache_dir is None:
+        return enum()
+
+    path = cache_dir / f"{key}.npy"
+    if path.exists():
+        return cls(np.load(path, mmap_mode="r"))
+
+    x = enum()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _save_npy(path, np.asarray(x))
+
+    return x
+
+
 def setup_eval(
     lbw: list[int],
     mbw: list[tuple[int, int]],
@@ -73,27 +148,56 @@ def setup_eval(
     helper_funcs: HelperFuncs,
     jit: Jit,
     sampler: Sampler,
-) -> dict[int, "ToEval"]:
+    cache_dir: Path | None = None,
+    low_chunk_rows: int = 0,
+    num_threads: int = 1,
+    fast_abst: bool = False,
+    symmetric: bool = False,
+) -> dict[int, "ToEval | LowStream"]:
+    """
+    With a cache_dir, each enumeration is stored there under a hash of everything
+    it depends on (concrete op, domain, bitwidths, sample counts, seed, sampler,
+    thread count) and loaded from it instead of being enumerated again.
+    With low_chunk_rows, the low bitwidths are enumerated that many rows at a time
+    into a file (their cache entry, or a temporary one) and every eval streams them
+    from it in chunks of that many rows, so they are never all held in memory.
+    Each enumeration is split across num_threads threads. The sampled rows are
+    reproducible for a given seed and num_threads, but differ between thread counts.
+    With fast_abst, best abstractions are computed from a few concrete inputs where
+    the domain allows it (the corners of the arg ranges, or all zeros and all ones
+    args for KnownBits), instead of from all of them. This is only exact for some
+    ops (monotone ones for ranges, bitwise ones for KnownBits), so it is checked
+    against the exhaustive enumeration at bitwidth 4 first. If the check fails,
+    KnownBits falls back to enumerating every concrete input, and ranges raise.
+    With symmetric, the best abstraction of a commutative op at the low bitwidths is
+    computed once for both orders of two different args, roughly halving the work of
+    the enumeration. Both rows are still evaluated, so the counters are the same.
+    """
+
     all_bws = lbw + [x[0] for x in mbw] + [x[0] for x in hbw]
-    lowerer = LowerToLLVM(all_bws)
-    crt = lowerer.add_fn(helper_funcs.crt_func, shim=True)
+    # the checks of fast_abst and symmetric run the op at bitwidth 4
+    checked = (fast_abst or symmetric) and 4 not in all_bws
+    lowerer = LowerToLLVM(all_bws + [4] if checked else all_bws)
+    crt = lowerer.add_fn(helper_funcs.crt_func, shim=True, batch=True)
     op_constraint = (
-        lowerer.add_fn(helper_funcs.op_constraint_func, shim=True)
+        lowerer.add_fn(helper_funcs.op_constraint_func, shim=True, batch=True)
         if helper_funcs.op_constraint_func
         else None
     )
 
-    jit.add_mod(str(lowerer))
+    jit.add_mod(str(lowerer), cache=True)
 
     def get_bw(x: TransIntegerType | IntegerType, bw: int):
         return bw if isinstance(x, TransIntegerType) else x.width.data
 
-    def get_enum_f(level: str, bw: int) -> Callable:
-        domain_str = str(helper_funcs.domain).lower()
+    def get_bws_str(bw: int) -> str:
         ret_bw = get_bw(helper_funcs.conc_ret_ty, bw)
         arg_bws = [str(get_bw(x, bw)) for x in helper_funcs.conc_arg_ty]
-        arg_str = "_".join(arg_bws)
-        func_name = f"enum_{level}_{domain_str}_{ret_bw}_{arg_str}"
+        return f"{ret_bw}_{'_'.join(arg_bws)}"
+
+    def get_enum_f(level: str, bw: int) -> Callable:
+        domain_str = str(helper_funcs.domain).lower()
+        func_name = f"enum_{level}_{domain_str}_{get_bws_str(bw)}"
 
         try:
             enum_fn = getattr(_eval_engine, func_name)
@@ -106,34 +210,184 @@ def setup_eval(
 
         return enum_fn
 
-    low_to_evals: dict[int, "ToEval"] = {
-        bw: get_enum_f("low", bw)(
-            jit.get_fn_ptr(crt[bw].name),
-            jit.get_fn_ptr(op_constraint[bw].name) if op_constraint else None,
+    def get_batch_addrs(bw: int) -> tuple[int, int | None]:
+        # variants of the op (and op constraint) run on a buffer of inputs per call
+        crt_batch = jit.get_fn_ptr(f"{crt[bw].name}_batch")
+        if not op_constraint:
+            return crt_batch, None
+
+        return crt_batch, jit.get_fn_ptr(f"{op_constraint[bw].name}_batch")
+
+    def get_to_eval_cls(bw: int) -> type["ToEval"]:
+        return getattr(_eval_engine, f"ToEval{helper_funcs.domain}{get_bws_str(bw)}")
+
+    op_constraint_func = helper_funcs.op_constraint_func
+    tables: dict[int, "ConcTable | None"] = {}
+
+    def get_table(bw: int) -> "ConcTable | None":
+        # small ops are run on every input once and looked up from then on. the
+        # table does not depend on the domain, so every domain shares its cache
+        if bw in tables:
+            return tables[bw]
+
+        bws_str = get_bws_str(bw)
+        table_f = getattr(_eval_engine, f"conc_table_{bws_str}", None)
+        key = sha256(
+            "\n".join(
+                [
+                    str(_ENUM_CACHE_VERSION),
+                    f"ConcTable{bws_str}",
+                    str(helper_funcs.crt_func),
+                    str(op_constraint_func) if op_constraint_func else "",
+                ]
+            ).encode()
+        ).hexdigest()
+
+        tables[bw] = table_f and _load_or_enum(
+            cache_dir,
+            key,
+            getattr(_eval_engine, f"ConcTable{bws_str}"),
+            lambda: table_f(
+                jit.get_fn_ptr(crt[bw].name),
+                jit.get_fn_ptr(op_constraint[bw].name) if op_constraint else None,
+            ),
+        )
+
+        return tables[bw]
+
+    def enum_key(level: str, bw: int, *params: int) -> str:
+        # only the low enumeration is exhaustive, the others also take a sampler
+        sampled = level != "low"
+        return sha256(
+            "\n".join(
+                [
+                    str(_ENUM_CACHE_VERSION),
+                    get_to_eval_cls(bw).__name__,
+                    level,
+                    str(helper_funcs.crt_func),
+                    str(op_constraint_func) if op_constraint_func else "",
+                    repr(params),
+                    repr(sampler) if sampled else "",
+                    str(num_threads) if sampled else "",
+                    "fast_abst" if fast_abst else "",
+                    "symmetric" if symmetric and not sampled else "",
+                ]
+            ).encode()
+        ).hexdigest()
+
+    def enum_kwargs(bw: int) -> dict[str, Any]:
+        crt_batch, op_constraint_batch = get_batch_addrs(bw)
+        return {
+            "num_threads": num_threads,
+            "table": get_table(bw),
+            "crtBatchAddr": crt_batch,
+            "opConBatchAddr": op_constraint_batch,
+            "fast_abst": fast_abst,
+        }
+
+    def enum(level: str, bw: int, *params: int) -> "ToEval":
+        sampled = level != "low"
+        enum_f = get_enum_f(level, bw)
+        to_eval = _load_or_enum(
+            cache_dir,
+            enum_key(level, bw, *params),
+            get_to_eval_cls(bw),
+            lambda: enum_f(
+                jit.get_fn_ptr(crt[bw].name),
+                jit.get_fn_ptr(op_constraint[bw].name) if op_constraint else None,
+                *params,
+                *([sampler.sampler] if sampled else []),
+                **enum_kwargs(bw),
+                **({} if sampled else {"symmetric": symmetric}),
+            ),
+        )
+
+        # sampled rows can repeat, each distinct one is evaluated once with the
+        # number of its copies as weight
+        return to_eval.dedup() if sampled else to_eval
+
+    def stream(bw: int) -> LowStream:
+        # the same cache entry as enum("low", bw), but enumerated and saved a chunk
+        # at a time. without a cache_dir the file is removed once it is mapped
+        enum_f = get_enum_f("low", bw)
+        domain_str = str(helper_funcs.domain).lower()
+        num_lows = getattr(_eval_engine, f"num_lows_{domain_str}_{get_bws_str(bw)}")
+        num_rows = num_lows()
+
+        def save(path: Path) -> None:
+            _save_chunks(
+                path,
+                num_rows,
+                low_chunk_rows,
+                lambda begin, end: enum_f(
+                    jit.get_fn_ptr(crt[bw].name),
+                    jit.get_fn_ptr(op_constraint[bw].name) if op_constraint else None,
+                    **enum_kwargs(bw),
+                    symmetric=symmetric,
+                    begin=begin,
+                    end=end,
+                ),
+            )
+
+        if cache_dir is None:
+            with TemporaryDirectory() as tmp:
+                path = Path(tmp) / "low.npy"
+                save(path)
+                lanes = np.load(path, mmap_mode="r")
+        else:
+            path = cache_dir / f"{enum_key('low', bw)}.npy"
+            if not path.exists():
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                save(path)
+            lanes = np.load(path, mmap_mode="r")
+
+        return LowStream(get_to_eval_cls(bw), lanes, low_chunk_rows)
+
+    if fast_abst:
+        enum_f = get_enum_f("low", 4)
+        addrs = (
+            jit.get_fn_ptr(crt[4].name),
+            jit.get_fn_ptr(op_constraint[4].name) if op_constraint else None,
         )
-        for bw in lbw
+        exact, fast = (
+            np.asarray(enum_f(*addrs, num_threads=num_threads, fast_abst=f))
+            for f in (False, True)
+        )
+        if not np.array_equal(exact, fast):
+            # most KnownBits ops are not bitwise, so there it is only a shortcut for
+            # the ones that are
+            if helper_funcs.domain != AbstractDomain.KnownBits:
+                raise ValueError(
+                    f"fast_abst is not exact for this concrete op in "
+                    f"{helper_funcs.domain}"
+                )
+            fast_abst = False
+
+    def commutes() -> bool:
+        # swapped args give the same op output and constraint in the table of every
+        # input at bitwidth 4
+        arg_bws = [get_bw(x, 4) for x in helper_funcs.conc_arg_ty]
+        table = get_table(4)
+        if len(arg_bws) != 2 or arg_bws[0] != arg_bws[1] or table is None:
+            return False
+
+        n = 2 ** arg_bws[0]
+        outs = np.asarray(table).reshape(2, n, n)
+        return np.array_equal(outs, outs.transpose(0, 2, 1))
+
+    if symmetric and not commutes():
+        raise ValueError("symmetric needs a commutative concrete op")
+
+    low_to_evals: dict[int, "ToEval | LowStream"] = {
+        bw: stream(bw) if low_chunk_rows else enum("low", bw) for bw in lbw
     }
 
     mid_to_evals: dict[int, "ToEval"] = {
-        bw: get_enum_f("mid", bw)(
-            jit.get_fn_ptr(crt[bw].name),
-            jit.get_fn_ptr(op_constraint[bw].name) if op_constraint else None,
-            samples,
-            seed,
-            sampler.sampler,
-        )
-        for bw, samples in mbw
+        bw: enum("mid", bw, samples, seed) for bw, samples in mbw
     }
 
     high_to_evals: dict[int, "ToEval"] = {
-        bw: get_enum_f("high", bw)(
-            jit.get_fn_ptr(crt[bw].name),
-            jit.get_fn_ptr(op_constraint[bw].name) if op_constraint else None,
-            lat_samples,
-            crt_samples,
-            seed,
-            sampler.sampler,
-        )
+        bw: enum("high", bw, lat_samples, crt_samples, seed)
         for bw, lat_samples, crt_samples in hbw
     }
 
@@ -149,28 +403,153 @@ def get_eval_res(per_bits: list[list[PerBitRes]]) -> list[EvalResult]:
     return [EvalResult(x) for x in ds]
 
 
+def _get_eval_f(prefix: str, x: "ToEval | LowStream") -> Callable:
+    cls = x.to_eval_cls if isinstance(x, LowStream) else x.__class__
+    suffix = cls.__name__.lower()[6:]
+    i = next(k for k, c in enumerate(suffix) if c.isdigit())
+    suffix = suffix[:i] + "_" + suffix[i:]
+    func_name = f"{prefix}_{suffix}"
+
+    try:
+        eval_fn = getattr(_eval_engine, func_name)
+    except AttributeError as e:
+        raise ImportError(f"Function {func_name!r} not found in eval engine") from e
+    if not callable(eval_fn):
+        raise TypeError(
+            f"{func_name} exists but is not callable (got {type(eval_fn).__name__})"
+        )
+    return eval_fn
+
+
+def build_ref_cache(
+    x: dict[int, tuple["ToEval | LowStream", list[int]]],
+    num_threads: int = 1,
+) -> dict[int, "RefCache | list[int]"]:
+    """
+    Precompute the per-row meet of the base functions, to be passed in place of bases.
+    Streamed inputs keep their bases, which are run again on each chunk as it is
+    evaluated, so that no per-row state is held for the whole stream.
+    """
+
+    return {
+        bw: (
+            bs
+            if isinstance(to_eval, LowStream)
+            else _get_eval_f("ref_cache", to_eval)(to_eval, bs, num_threads)
+        )
+        for bw, (to_eval, bs) in x.items()
+    }
+
+
+def _eval_job(
+    to_eval: "ToEval | LowStream",
+    xs: list[int],
+    bs: "list[int] | RefCache",
+    budgets: list[int],
+) -> "EvalJob":
+    if isinstance(to_eval, LowStream):
+        assert isinstance(bs, list), "streamed inputs have no RefCache"
+        return _get_eval_f("eval_job_chunks", to_eval)(
+            to_eval.lanes,
+            to_eval.chunk_rows,
+            xs,
+            bs,
+            unsound_budgets=budgets,
+        )
+
+    return _get_eval_f("eval_job", to_eval)(
+        to_eval,
+        xs,
+        **({"bases": bs} if isinstance(bs, list) else {"refs": bs}),
+        unsound_budgets=budgets,
+    )
+
+
 def eval_transfer_func(
-    x: dict[int, tuple["ToEval", list[int], list[int]]],
+    x: dict[
+        int,
+        tuple["ToEval | LowStream", list[int], "list[int] | RefCache"],
+    ],
+    num_threads: int = 1,
+    unsound_budgets: list[int] | None = None,
 ) -> list[EvalResult]:
-    def get_eval_f(x: "ToEval") -> Callable[["ToEval", list[int], list[int]], "Results"]:
-        suffix = x.__class__.__name__.lower()[6:]
-        i = next(k for k, c in enumerate(suffix) if c.isdigit())
-        suffix = suffix[:i] + "_" + suffix[i:]
-        func_name = f"eval_{suffix}"
-
-        try:
-            eval_fn = getattr(_eval_engine, func_name)
-        except AttributeError as e:
-            raise ImportError(f"Function {func_name!r} not found in eval engine") from e
-        if not callable(eval_fn):
-            raise TypeError(
-                f"{func_name} exists but is not callable (got {type(eval_fn).__name__})"
-            )
-        return eval_fn  # type: ignore
+    """
+    All bitwidths are evaluated concurrently in a single engine call, on num_threads
+    threads in all, split between the bitwidths in proportion to their inputs.
+    unsound_budgets gives, per transformer, the number of unsound inputs (at each
+    bitwidth) after which the engine stops running it, 0 meaning no limit.
+    """
 
-    per_bits = [
-        get_per_bit(get_eval_f(to_eval)(to_eval, xs, bs))
-        for to_eval, xs, bs in x.values()
-    ]
+    budgets = unsound_budgets or []
+    jobs = [_eval_job(to_eval, xs, bs, budgets) for to_eval, xs, bs in x.values()]
+    per_bits = [get_per_bit(r) for r in _eval_engine.run_eval_jobs(jobs, num_threads)]
 
     return get_eval_res(per_bits)
+
+
+@dataclass
+class CandidateOutputs:
+    """
+    The output of every candidate on every input, so that candidates can be met with a
+    set of picked ones and evaluated against them without being run again
+    """
+
+    outputs: dict[int, tuple["ToEval", "RowOutputs"]]
+    num_threads: int = 1
+
+    def refs(self) -> dict[int, "RefCache"]:
+        "The per-row meet of no candidate at all"
+        return {
+            bw: _get_eval_f("ref_cache", to_eval)(to_eval, [], self.num_threads)
+            for bw, (to_eval, _) in self.outputs.items()
+        }
+
+    def meet(self, refs: dict[int, "RefCache"], fn: int) -> dict[int, "RefCache"]:
+        "refs met with candidate fn"
+        return {
+            bw: _get_eval_f("meet_ref_cache", to_eval)(to_eval, refs[bw], outs, fn)
+            for bw, (to_eval, outs) in self.outputs.items()
+        }
+
+    def eval(self, fns: list[int], refs: dict[int, "RefCache"]) -> list[EvalResult]:
+        "Same as eval_transfer_func on candidates fns, with refs as the base"
+        return get_eval_res(
+            [
+                get_per_bit(
+                    _get_eval_f("eval_outputs", to_eval)(
+                        to_eval, outs, fns, refs[bw], self.num_threads
+                    )
+                )
+                for bw, (to_eval, outs) in self.outputs.items()
+            ]
+        )
+
+
+def eval_outputs(
+    x: dict[int, tuple["ToEval", list[int]]],
+    num_threads: int = 1,
+    max_bytes: int | None = 1 << 30,
+) -> CandidateOutputs | None:
+    """
+    Runs every transformer on every input once and keeps the outputs, so transformers
+    can be combined afterwards without running them again. Streamed inputs are not
+    supported. The outputs are all held at once, one abstract value per transformer
+    and input, so nothing is run and None is returned if they would take more than
+    max_bytes (no limit if None).
+    """
+
+    if max_bytes is not None:
+        total = sum(
+            _get_eval_f("row_outputs_bytes", to_eval)(len(xs), len(to_eval))
+            for to_eval, xs in x.values()
+        )
+        if total > max_bytes:
+            return None
+
+    return CandidateOutputs(
+        {
+            bw: (to_eval, _get_eval_f("row_outputs", to_eval)(to_eval, xs, num_threads))
+            for bw, (to_eval, xs) in x.items()
+        },
+        num_threads,
+    )
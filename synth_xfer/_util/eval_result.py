@@ -1,6 +1,16 @@
 from dataclasses import dataclass
 
 
+def _fmt_dist(x: float, is_float: bool = False) -> str:
+    # 6 significant digits, whole numbers without a fraction unless is_float, as the
+    # engine used to print them, which the log columns are sized for
+    s = f"{x:g}"
+    if not is_float and s.lstrip("-").isdigit():
+        return s
+
+    return str(float(s))
+
+
 @dataclass
 class PerBitRes:
     "The evaluation result of (a candidate transformer f MEET a set of sound transformer F) and the best transformer f_best"
@@ -33,6 +43,9 @@ class PerBitRes:
     r"sound_dis(f,g) := \sum{a, f(a) is sound} d(f(a) /\ g(a), best(a)) + \sum{a, f(a) is unsound} d(g(a), best(a))"
     "sound_dis is equal to dist if f is sound."
 
+    aborted: bool = False
+    "Whether f was dropped after exceeding its unsound budget, so the counts above only cover the inputs it was run on"
+
     def __str__(self):
         s = ""
         s += f"bw: {self.bitwidth:<3}"
@@ -41,9 +54,11 @@ class PerBitRes:
         s += f"e: {self.exacts:<6}"
         s += f"uall: {self.unsolved_cases:<6}"
         s += f"ue: {self.unsolved_exacts:<6}"
-        s += f"dis: {self.dist:<8}"
-        s += f"bdis: {self.base_dist:<8}"
-        s += f"sdis: {self.sound_dist:<8}"
+        s += f"dis: {_fmt_dist(self.dist):<8}"
+        s += f"bdis: {_fmt_dist(self.base_dist, is_float=True):<8}"
+        s += f"sdis: {_fmt_dist(self.sound_dist):<8}"
+        if self.aborted:
+            s += "(aborted)"
         return s
 
     def get_sound_prop(self) -> float:
@@ -69,6 +84,7 @@ class EvalResult:
     dist: float
     base_dist: float
     sound_dist: float
+    aborted: bool
 
     # These metrics are defined over low and medium bitwidths
     all_low_med_cases: int
@@ -96,6 +112,7 @@ class EvalResult:
         self.dist = sum(res.dist for res in per_bit_res)
         self.base_dist = sum(res.base_dist for res in per_bit_res)
         self.sound_dist = sum(res.sound_dist for res in per_bit_res)
+        self.aborted = any(res.aborted for res in per_bit_res)
 
         low_med_res = self.get_low_med_res()
         self.all_low_med_cases = sum(res.all_cases for res in low_med_res)
@@ -1,62 +1,269 @@
+from collections import OrderedDict
+from collections.abc import Hashable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from hashlib import sha256
+import multiprocessing
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
 import llvmlite.binding as llvm
 
 
+@dataclass(eq=False)
+class JitModule:
+    "A module added to a Jit, with the engine its code lives in."
+
+    engine: llvm.ExecutionEngine
+    fns: list[str]
+    size: int
+    # adds and recalls not released yet, the module may be freed once none are left
+    holds: int = 1
+    keys: list[Hashable] = field(default_factory=list)
+
+
+def _create_tm(target: llvm.Target) -> llvm.TargetMachine:
+    return target.create_target_machine(
+        cpu=llvm.get_host_cpu_name(),
+        features=llvm.get_host_cpu_features().flatten(),
+        opt=2,
+    )
+
+
+def _create_target() -> tuple[llvm.TargetMachine, llvm.Target]:
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+
+    target = llvm.Target.from_default_triple()
+
+    return _create_tm(target), target
+
+
+def _optimize(llvm_ir: str, tm: llvm.TargetMachine) -> llvm.ModuleRef:
+    mod = llvm.parse_assembly(llvm_ir)
+    mod.triple = tm.triple
+    mod.data_layout = str(tm.target_data)
+    mod.verify()
+
+    pb = llvm.PassBuilder(tm, llvm.PipelineTuningOptions())
+    mpm = pb.getModulePassManager()
+    mpm.add_aggressive_dce_pass()
+    mpm.add_aa_eval_pass()
+    mpm.add_aggressive_instcombine_pass()
+    mpm.add_simplify_cfg_pass()
+    mpm.add_constant_merge_pass()
+    mpm.add_rpo_function_attrs_pass()
+
+    mpm.run(mod, pb)
+
+    return mod
+
+
+# part of the object cache key, bump it whenever _optimize or the target changes
+_OBJ_CACHE_VERSION = 1
+
+
+_worker_tm: llvm.TargetMachine | None = None
+
+
+def _compile_obj(llvm_ir: str) -> tuple[bytes, list[str]]:
+    "Object code of llvm_ir and the fns it defines, run in a worker process."
+    global _worker_tm
+    if _worker_tm is None:
+        _worker_tm = _create_target()[0]
+
+    mod = _optimize(llvm_ir, _worker_tm)
+    fns = [f.name for f in mod.functions if not f.is_declaration]
+
+    return _worker_tm.emit_object(mod), fns
+
+
 class Jit:
-    @staticmethod
-    def _create_exec_engine() -> tuple[
-        llvm.ExecutionEngine, llvm.TargetMachine, llvm.Target
-    ]:
-        "This engine is reusable for an arbitrary number of modules."
-
-        llvm.initialize_native_target()
-        llvm.initialize_native_asmprinter()
-
-        target = llvm.Target.from_default_triple()
-        tm = target.create_target_machine(
-            cpu=llvm.get_host_cpu_name(),
-            features=llvm.get_host_cpu_features().flatten(),
-            opt=2,
+    """
+    Every module gets its own MCJIT engine, so the code of a module can be freed
+    by closing its engine (one shared engine never frees what it emitted).
+    Modules whose fns are no longer called are handed back with release, and
+    freed least recently used first once the modules held take more than
+    max_bytes (never, if None). The size of a module is its object code and IR,
+    which the engine keeps alive, on top of the engine itself.
+
+    A fn can be remembered under a key (a structural hash of the program it was
+    lowered from, say) for as long as its module is held, so the same program
+    comes back without being lowered and compiled again.
+
+    add_mods compiles independent modules to object code on num_workers processes
+    (llvmlite serializes every call into LLVM within a process), and only loads
+    the objects here.
+
+    With a cache_dir, the object code of modules added with cache=True is kept
+    there under a hash of their IR and the host target, and loaded from there by
+    later processes instead of compiled again.
+    """
+
+    # rough footprint of an engine and its target machine with no code in it
+    engine_bytes = 1 << 19
+
+    tm, target = _create_target()
+
+    def __init__(
+        self,
+        max_bytes: int | None = 256 << 20,
+        num_workers: int = 1,
+        cache_dir: Path | None = None,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.num_workers = num_workers
+        self.cache_dir = cache_dir
+        self.pool: ProcessPoolExecutor | None = None
+        # modules held, least recently used first
+        self.mods: OrderedDict[JitModule, None] = OrderedDict()
+        # the modules held that define each fn, the last one is used
+        self.defs: dict[str, list[JitModule]] = {}
+        self.held_bytes = 0
+        # the module and fn name remembered for each key
+        self.compiled: dict[Hashable, tuple[JitModule, str]] = {}
+
+    def add_mod(self, llvm_ir: str, cache: bool = False) -> JitModule:
+        mod = _optimize(llvm_ir, self.tm)
+        fns = [f.name for f in mod.functions if not f.is_declaration]
+
+        path = self._cache_path(llvm_ir) if cache else None
+        obj_bytes = 0
+
+        def notify(_: llvm.ModuleRef, obj: bytes) -> None:
+            nonlocal obj_bytes
+            obj_bytes += len(obj)
+            if path is not None:
+                self._store(path, obj)
+
+        def getbuffer(_: llvm.ModuleRef) -> bytes | None:
+            nonlocal obj_bytes
+            if path is None or not path.exists():
+                return None
+
+            obj = path.read_bytes()
+            obj_bytes += len(obj)
+            return obj
+
+        # the engine owns its target machine, and frees it when closed
+        engine = llvm.create_mcjit_compiler(mod, _create_tm(self.target))
+        engine.set_object_cache(notify, getbuffer)
+        engine.finalize_object()
+        engine.run_static_constructors()
+
+        return self._hold(
+            JitModule(engine, fns, self.engine_bytes + obj_bytes + len(llvm_ir))
         )
-        backing_mod = llvm.parse_assembly("")
 
-        return llvm.create_mcjit_compiler(backing_mod, tm), tm, target
+    def add_mods(self, llvm_irs: list[str]) -> list[JitModule]:
+        "add_mod on every module, compiled concurrently if there are workers."
+        if self.num_workers <= 1 or len(llvm_irs) <= 1:
+            return [self.add_mod(x) for x in llvm_irs]
 
-    engine, tm, target = _create_exec_engine()
+        if self.pool is None:
+            # forking a process that runs llvm threads is not safe
+            ctx = multiprocessing.get_context("spawn")
+            self.pool = ProcessPoolExecutor(self.num_workers, mp_context=ctx)
 
-    def __init__(self) -> None:
-        self.mods: list[llvm.ModuleRef] = []
+        mods: list[JitModule] = []
+        for obj, fns in self.pool.map(_compile_obj, llvm_irs):
+            engine = llvm.create_mcjit_compiler(
+                llvm.parse_assembly(""), _create_tm(self.target)
+            )
+            engine.add_object_file(llvm.ObjectFileRef.from_data(obj))
+            engine.finalize_object()
+            mods.append(self._hold(JitModule(engine, fns, self.engine_bytes + len(obj))))
 
-    def add_mod(self, llvm_ir: str) -> llvm.ModuleRef:
-        mod = self.create_mod(llvm_ir)
-        self.run_passes(mod)
-        self.engine.add_module(mod)
-        self.engine.finalize_object()
-        self.engine.run_static_constructors()
-        self.mods.append(mod)
+        return mods
 
-        return mod
+    def release(self, mod: JitModule) -> None:
+        "The fns of mod are not called anymore by whoever added or recalled it."
+        assert mod.holds > 0
+        mod.holds -= 1
+        self._evict()
 
-    def create_mod(self, llvm_ir: str) -> llvm.ModuleRef:
-        mod = llvm.parse_assembly(llvm_ir)
-        mod.triple = self.target.triple
-        mod.data_layout = str(self.tm.target_data)
-        mod.verify()
+    def remember(self, key: Hashable, mod: JitModule, fn: str) -> None:
+        self.compiled[key] = (mod, fn)
+        mod.keys.append(key)
 
-        return mod
+    def recall(self, key: Hashable) -> tuple[JitModule, int] | None:
+        """
+        The module and address of the fn remembered for key, if its module is still
+        around. The module is held once more, until this recall is released.
+        """
+        if key not in self.compiled:
+            return None
 
-    def run_passes(self, mod: llvm.ModuleRef):
-        pb = llvm.PassBuilder(self.tm, llvm.PipelineTuningOptions())
-        mpm = pb.getModulePassManager()
-        mpm.add_aggressive_dce_pass()
-        mpm.add_aa_eval_pass()
-        mpm.add_aggressive_instcombine_pass()
-        mpm.add_simplify_cfg_pass()
-        mpm.add_constant_merge_pass()
-        mpm.add_rpo_function_attrs_pass()
+        mod, fn = self.compiled[key]
+        mod.holds += 1
 
-        mpm.run(mod, pb)
+        return mod, self.get_fn_ptr(fn, mod)
 
-    def get_fn_ptr(self, fn: str) -> int:
-        ptr = self.engine.get_function_address(fn)
+    def get_fn_ptr(self, fn: str, mod: JitModule | None = None) -> int:
+        "The address of fn in mod, or in the last module held that defines it."
+        mod = self.defs[fn][-1] if mod is None else mod
+        self.mods.move_to_end(mod)
+
+        ptr = mod.engine.get_function_address(fn)
         assert ptr != 0
         return ptr
+
+    def close(self) -> None:
+        "Stops the workers, the modules stay."
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _cache_path(self, llvm_ir: str) -> Path | None:
+        if self.cache_dir is None:
+            return None
+
+        key = [
+            str(_OBJ_CACHE_VERSION),
+            ".".join(map(str, llvm.llvm_version_info)),
+            self.tm.triple,
+            llvm.get_host_cpu_name(),
+            llvm.get_host_cpu_features().flatten(),
+            llvm_ir,
+        ]
+        return self.cache_dir / f"{sha256(chr(0).join(key).encode()).hexdigest()}.o"
+
+    def _store(self, path: Path, obj: bytes) -> None:
+        if path.exists():
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written under a unique name and moved in place, so concurrent runs never
+        # see a partial file
+        with NamedTemporaryFile(dir=path.parent, suffix=".o", delete=False) as f:
+            f.write(obj)
+        os.replace(f.name, path)
+
+    def _hold(self, mod: JitModule) -> JitModule:
+        self.mods[mod] = None
+        for fn in mod.fns:
+            self.defs.setdefault(fn, []).append(mod)
+        self.held_bytes += mod.size
+        self._evict()
+
+        return mod
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+
+        for mod in [m for m in self.mods if m.holds == 0]:
+            if self.held_bytes <= self.max_bytes:
+                break
+
+            del self.mods[mod]
+            for fn in mod.fns:
+                self.defs[fn].remove(mod)
+                if not self.defs[fn]:
+                    del self.defs[fn]
+            for key in mod.keys:
+                if self.compiled.get(key, (None,))[0] is mod:
+                    del self.compiled[key]
+            self.held_bytes -= mod.size
+            mod.engine.close()
@@ -80,10 +80,22 @@ def lower_type(typ: Attribute, bw: int) -> ir.Type:
 
 
 class LowerToLLVM:
-    def __init__(self, bws: list[int], name: str = "") -> None:
+    def __init__(
+        self,
+        bws: list[int],
+        name: str = "",
+        prefix: str = "",
+        externs: dict[str, tuple[str, ir.FunctionType]] | None = None,
+    ) -> None:
         self.bws = bws
         self.llvm_mod = ir.Module(name=name)
         self.fns: dict[str, ir.Function] = {}
+        # prepended to the symbols of the fns lowered here, not to their names
+        self.prefix = prefix
+
+        # fns compiled elsewhere, called by (symbol, type) instead of lowered here
+        for fn_name, (sym, fn_ty) in (externs or {}).items():
+            self.fns[fn_name] = ir.Function(self.llvm_mod, fn_ty, name=sym)
 
     def __str__(self) -> str:
         return str(self.llvm_mod)
@@ -135,7 +147,9 @@ class LowerToLLVM:
 
         return one_ret_val and ret_is_abst and abst_args
 
-    def add_fn(self, mlir_fn: FuncOp, shim: bool = False) -> dict[int, ir.Function]:
+    def add_fn(
+        self, mlir_fn: FuncOp, shim: bool = False, batch: bool = False
+    ) -> dict[int, ir.Function]:
         bw_fns: dict[int, ir.Function] = {}
 
         for bw in self.bws:
@@ -145,7 +159,7 @@ class LowerToLLVM:
             fn_arg_types = (lower_type(x.type, bw) for x in mlir_fn.args)
             fn_type = ir.FunctionType(fn_ret_type, fn_arg_types)
 
-            llvm_fn = ir.Function(self.llvm_mod, fn_type, name=bw_fn_name)
+            llvm_fn = ir.Function(self.llvm_mod, fn_type, name=self.prefix + bw_fn_name)
             llvm_fn = self.add_attrs(llvm_fn)
 
             self.fns[bw_fn_name] = _LowerFuncToLLVM(
@@ -156,6 +170,11 @@ class LowerToLLVM:
                 shimmed_fn = self.shim(mlir_fn, self.fns[bw_fn_name], bw)
                 self.fns[f"{bw_fn_name}_shim"] = shimmed_fn
                 bw_fns[bw] = shimmed_fn
+                # a variant of the concrete op (or constraint) looping over inputs
+                if batch:
+                    assert not self.is_transfer_fn(mlir_fn)
+                    batch_fn = self.batch_shim(shimmed_fn)
+                    self.fns[batch_fn.name] = batch_fn
             else:
                 bw_fns[bw] = self.fns[bw_fn_name]
 
@@ -236,6 +255,47 @@ class LowerToLLVM:
 
         return shim_fn
 
+    def batch_shim(self, shim_fn: ir.Function) -> ir.Function:
+        # void f(i64* in, i64* out, i64 n) with out[i] the shim on input i, whose arg
+        # k is at in[k * n + i]. one call per buffer, with the loop left to vectorize
+        n_args = len(shim_fn.function_type.args)
+        i64 = ir.IntType(64)
+        zero = ir.Constant(i64, 0)
+
+        fn_ty = ir.FunctionType(ir.VoidType(), [i64.as_pointer(), i64.as_pointer(), i64])
+        batch_fn = ir.Function(self.llvm_mod, fn_ty, name=f"{shim_fn.name}_batch")
+        batch_fn.attributes.add("nounwind")
+        batch_fn.attributes.add("norecurse")
+
+        in_ptr, out_ptr, n = batch_fn.args
+        in_ptr.name, out_ptr.name, n.name = "in", "out", "n"
+        in_ptr.add_attribute("noalias")
+        out_ptr.add_attribute("noalias")
+
+        entry = batch_fn.append_basic_block(name="entry")
+        loop = batch_fn.append_basic_block(name="loop")
+        done = batch_fn.append_basic_block(name="done")
+
+        b = ir.IRBuilder(entry)
+        b.cbranch(b.icmp_unsigned("==", n, zero), done, loop)
+
+        b.position_at_end(loop)
+        i = b.phi(i64, name="i")
+        i.add_incoming(zero, entry)
+        args = []
+        for k in range(n_args):
+            idx = b.add(b.mul(ir.Constant(i64, k), n), i)
+            args.append(b.load(b.gep(in_ptr, [idx])))
+        b.store(b.call(shim_fn, args), b.gep(out_ptr, [i]))
+        i_next = b.add(i, ir.Constant(i64, 1), name="i_next")
+        i.add_incoming(i_next, loop)
+        b.cbranch(b.icmp_unsigned("==", i_next, n), done, loop)
+
+        b.position_at_end(done)
+        b.ret_void()
+
+        return batch_fn
+
     def shim_xfer(self, mlir_fn: FuncOp, old_fn: ir.Function, bw: int) -> ir.Function:
         n_args = len(old_fn.function_type.args)
         i64 = ir.IntType(64)
@@ -58,6 +58,7 @@ def synthesize_one_iteration(
     prec_set: list[FuncOp],
     lbw: list[int],
     vbw: list[int],
+    unsound_budget: int = 0,
 ) -> SolutionSet:
     "Given ith_iter, performs total_rounds mcmc sampling"
 
@@ -75,7 +76,13 @@ def synthesize_one_iteration(
     transfers = [spl.get_current() for spl in mcmc_samplers]
     func_with_cond_lst = _build_eval_list(transfers, sp_range, p_range, c_range, prec_set)
 
-    cmp_results = solution_set.eval_improve(func_with_cond_lst)
+    # precise chains ignore soundness, so only the others may be cut short
+    unsound_budgets = (
+        [0 if i in p_range else unsound_budget for i in range(num_programs)]
+        if unsound_budget
+        else []
+    )
+    cmp_results = solution_set.eval_improve(func_with_cond_lst, unsound_budgets)
 
     for i, cmp in enumerate(cmp_results):
         mcmc_samplers[i].current_cmp = cmp
@@ -110,7 +117,7 @@ def synthesize_one_iteration(
         sample_total += perf_counter() - s
 
         s = perf_counter()
-        cmp_results = solution_set.eval_improve(func_with_cond_lst)
+        cmp_results = solution_set.eval_improve(func_with_cond_lst, unsound_budgets)
         eval_total += perf_counter() - s
 
         s = perf_counter()
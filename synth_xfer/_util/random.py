@@ -78,60 +78,85 @@ class Sampler:
         SKEW_RIGHT = "skew_right"
         BIMODAL = "bimodal"
 
+    # how the draws of the lattice levels of the mid/high rows are spread:
+    # independently, one per stratum of the unit interval (latin hypercube over
+    # the args), or along a randomly shifted low discrepancy sequence
+    class Spread(str, Enum):
+        IID = "iid"
+        STRATIFIED = "stratified"
+        QUASI = "quasi"
+
     kind: DistKind
     sampler: Any
     sigma: float | None = None
     alpha: float | None = None
     separation: float | None = None
+    spread: Spread = Spread.IID
 
     @staticmethod
-    def uniform() -> "Sampler":
-        return Sampler(kind=Sampler.DistKind.UNIFORM, sampler=ee.uniform_sampler())
+    def uniform(spread: Spread = Spread.IID) -> "Sampler":
+        return Sampler(
+            kind=Sampler.DistKind.UNIFORM,
+            spread=spread,
+            sampler=ee.uniform_sampler(Sampler.ee_spread(spread)),
+        )
 
     @staticmethod
-    def normal(sigma: float) -> "Sampler":
+    def normal(sigma: float, spread: Spread = Spread.IID) -> "Sampler":
         Sampler.validate_sigma(sigma)
         return Sampler(
             kind=Sampler.DistKind.NORMAL,
             sigma=sigma,
-            sampler=ee.normal_sampler(sigma),
+            spread=spread,
+            sampler=ee.normal_sampler(sigma, Sampler.ee_spread(spread)),
         )
 
     @staticmethod
-    def skew_left(sigma: float, alpha: float) -> "Sampler":
+    def skew_left(sigma: float, alpha: float, spread: Spread = Spread.IID) -> "Sampler":
         Sampler.validate_sigma(sigma)
         Sampler.validate_alpha(alpha)
         return Sampler(
             kind=Sampler.DistKind.SKEW_LEFT,
             sigma=sigma,
             alpha=alpha,
-            sampler=ee.skew_left_sampler(sigma, alpha),
+            spread=spread,
+            sampler=ee.skew_left_sampler(sigma, alpha, Sampler.ee_spread(spread)),
         )
 
     @staticmethod
-    def skew_right(sigma: float, alpha: float) -> "Sampler":
+    def skew_right(sigma: float, alpha: float, spread: Spread = Spread.IID) -> "Sampler":
         Sampler.validate_sigma(sigma)
         Sampler.validate_alpha(alpha)
         return Sampler(
             kind=Sampler.DistKind.SKEW_RIGHT,
             sigma=sigma,
             alpha=alpha,
-            sampler=ee.skew_right_sampler(sigma, alpha),
+            spread=spread,
+            sampler=ee.skew_right_sampler(sigma, alpha, Sampler.ee_spread(spread)),
         )
 
     @staticmethod
-    def bimodal(sigma: float, separation: float) -> "Sampler":
+    def bimodal(
+        sigma: float, separation: float, spread: Spread = Spread.IID
+    ) -> "Sampler":
         Sampler.validate_sigma(sigma)
         Sampler.validate_separation(separation)
         return Sampler(
             kind=Sampler.DistKind.BIMODAL,
             sigma=sigma,
             separation=separation,
-            sampler=ee.bimodal_sampler(sigma, separation),
+            spread=spread,
+            sampler=ee.bimodal_sampler(sigma, separation, Sampler.ee_spread(spread)),
         )
 
+    @staticmethod
+    def ee_spread(spread: Spread) -> Any:
+        return getattr(ee.Spread, Sampler.Spread(spread).value)
+
     def __repr__(self) -> str:
         parts = [str(self.kind.value)]
+        if self.spread != Sampler.Spread.IID:
+            parts.append(f"spread={self.spread.value}")
         if self.sigma is not None:
             parts.append(f"sigma={self.sigma}")
         if self.alpha is not None:
@@ -0,0 +1,39 @@
+from hashlib import sha256
+
+import llvmlite.binding as llvm
+from xdsl.dialects.func import FuncOp
+
+from synth_xfer._util.jit import Jit
+from synth_xfer._util.lower import LowerToLLVM
+
+
+class Runtime:
+    """
+    Helper fns (getTop, meet, ...) lowered and compiled once, into a module the jit
+    keeps for good. Modules lowered by lowerer() call them by symbol instead of
+    carrying their own copy, so a round only lowers and compiles its candidates.
+    The symbols of a runtime are prefixed with a hash of the helpers, so the
+    runtimes of different domains can live in one process, while the same helpers
+    always make the same module (and hit the object cache of the jit).
+    """
+
+    def __init__(self, jit: Jit, bws: list[int], fns: list[FuncOp]) -> None:
+        self.bws = bws
+
+        digest = sha256("\n".join(str(fn) for fn in fns).encode()).hexdigest()
+        lowerer = LowerToLLVM(bws, prefix=f"rt_{digest[:16]}_")
+        for fn in fns:
+            lowerer.add_fn(fn)
+        self.mod = jit.add_mod(str(lowerer), cache=True)
+
+        # the symbol and type of every fn, by the name calls refer to it by
+        self.fns = {
+            name: (fn.name, fn.function_type)
+            for name, fn in lowerer.fns.items()
+            if not fn.is_declaration
+        }
+        for sym, _ in self.fns.values():
+            llvm.add_symbol(sym, jit.get_fn_ptr(sym, self.mod))
+
+    def lowerer(self) -> LowerToLLVM:
+        return LowerToLLVM(self.bws, externs=self.fns)
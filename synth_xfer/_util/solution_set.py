@@ -9,6 +9,7 @@ from xdsl.dialects.func import CallOp, FuncOp, ReturnOp
 
 from synth_xfer._util.cond_func import FunctionWithCondition
 from synth_xfer._util.dce import dce
+from synth_xfer._util.eval import CandidateOutputs
 from synth_xfer._util.eval_result import EvalResult
 from synth_xfer._util.log import get_logger, write_log_file
 from synth_xfer._util.parse_mlir import HelperFuncs
@@ -25,6 +26,28 @@ def _rename_functions(lst: list[FunctionWithCondition], prefix: str) -> list[str
     return func_names
 
 
+class _GreedyCover:
+    """
+    Greedy selection over the outputs of the candidates on every input, so that picking
+    the next one does not run the candidates again. The per input meet of the picks is
+    kept, and the remaining candidates are evaluated against it the same way
+    eval_improve evaluates them against the solutions.
+    """
+
+    def __init__(
+        self, candidates: list[FunctionWithCondition], outputs: CandidateOutputs
+    ):
+        self.index = {id(c): i for i, c in enumerate(candidates)}
+        self.outputs = outputs
+        self.refs = outputs.refs()
+
+    def eval_improve(self, candidates: list[FunctionWithCondition]) -> list[EvalResult]:
+        return self.outputs.eval([self.index[id(c)] for c in candidates], self.refs)
+
+    def add(self, cand: FunctionWithCondition):
+        self.refs = self.outputs.meet(self.refs, self.index[id(cand)])
+
+
 class SolutionSet(ABC):
     "This class is an abstract class for maintaining solutions. It supports to generate the meet of solutions"
 
@@ -38,31 +61,47 @@ class SolutionSet(ABC):
     list of transfer functions
     list of name of base functions
     list of base functions
+    per transfer function unsound budget (see eval_transfer_func)
     """
     eval_func: Callable[
-        [list[FunctionWithCondition], list[FunctionWithCondition]], list[EvalResult]
+        [list[FunctionWithCondition], list[FunctionWithCondition], list[int]],
+        list[EvalResult],
     ]
+    "per input outputs of transfer functions on their own (see eval_outputs)"
+    eval_outputs_func: (
+        Callable[[list[FunctionWithCondition]], CandidateOutputs | None] | None
+    )
     optimize: bool
 
     def __init__(
         self,
         initial_solutions: list[FunctionWithCondition],
         eval_func: Callable[
-            [list[FunctionWithCondition], list[FunctionWithCondition]], list[EvalResult]
+            [list[FunctionWithCondition], list[FunctionWithCondition], list[int]],
+            list[EvalResult],
         ],
         is_perfect: bool = False,
         optimize: bool = True,
+        eval_outputs_func: Callable[
+            [list[FunctionWithCondition]], CandidateOutputs | None
+        ]
+        | None = None,
     ):
         _rename_functions(initial_solutions, "partial_solution_")
         self.solutions = initial_solutions
         self.solutions_size = len(initial_solutions)
         self.eval_func = eval_func
+        self.eval_outputs_func = eval_outputs_func
         self.precise_set = []
         self.is_perfect = is_perfect
         self.optimize = optimize
 
-    def eval_improve(self, transfers: list[FunctionWithCondition]) -> list[EvalResult]:
-        return self.eval_func(transfers, self.solutions)
+    def eval_improve(
+        self,
+        transfers: list[FunctionWithCondition],
+        unsound_budgets: list[int] | None = None,
+    ) -> list[EvalResult]:
+        return self.eval_func(transfers, self.solutions, unsound_budgets or [])
 
     @abstractmethod
     def construct_new_solution_set(
@@ -142,13 +181,24 @@ class UnsizedSolutionSet(SolutionSet):
             [
                 list[FunctionWithCondition],
                 list[FunctionWithCondition],
+                list[int],
             ],
             list[EvalResult],
         ],
         is_perfect: bool = False,
         optimize: bool = True,
+        eval_outputs_func: Callable[
+            [list[FunctionWithCondition]], CandidateOutputs | None
+        ]
+        | None = None,
     ):
-        super().__init__(initial_solutions, eval_func_with_cond, is_perfect, optimize)
+        super().__init__(
+            initial_solutions,
+            eval_func_with_cond,
+            is_perfect,
+            optimize,
+            eval_outputs_func,
+        )
 
     def handle_inconsistent_result(self, f: FunctionWithCondition):
         str_output = io.StringIO()
@@ -207,8 +257,22 @@ class UnsizedSolutionSet(SolutionSet):
         self.solutions = []
         num_cond_solutions = 0
 
+        # with per input outputs, the picks are made on those instead of running the
+        # remaining candidates again after every pick. there are none if they would
+        # not fit in memory
+        outputs = (
+            self.eval_outputs_func(candidates)
+            if self.eval_outputs_func is not None and candidates
+            else None
+        )
+        cover = None if outputs is None else _GreedyCover(candidates, outputs)
+
         while len(candidates) > 0:
-            result = self.eval_improve(candidates)
+            result = (
+                self.eval_improve(candidates)
+                if cover is None
+                else cover.eval_improve(candidates)
+            )
             if result[0].get_base_dist() == 0:  # current solution set is already perfect
                 break
             cand, max_improve_res = max(
@@ -309,6 +373,8 @@ class UnsizedSolutionSet(SolutionSet):
             )
             candidates.remove(cand)
             self.solutions.append(cand_to_be_added)
+            if cover is not None:
+                cover.add(cand)
 
         logger.info(f"The number of solutions after reseting: {len(self.solutions)}")
         logger.info(f"The number of conditional solutions: {num_cond_solutions}")
@@ -353,6 +419,7 @@ class UnsizedSolutionSet(SolutionSet):
             cmp_results: list[EvalResult] = self.eval_func(
                 [sol],
                 self.solutions[:i] + self.solutions[i + 1 :],
+                [],
             )
             res = cmp_results[0]
             to_learn = res.get_new_exact_prop() > 0.005
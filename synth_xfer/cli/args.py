@@ -90,6 +90,20 @@ def make_sampler_parser(p: ArgumentParser):
         "-bimodal", action="store_true", help="Use bimodal symmetric sampling"
     )
 
+    spread = p.add_mutually_exclusive_group(required=False)
+    spread.add_argument(
+        "-stratified",
+        action="store_true",
+        help="Stratify the lattice levels of the mid/high rows over the distribution, "
+        "within the share of the rows each of the -num_threads threads draws",
+    )
+    spread.add_argument(
+        "-quasi-random",
+        action="store_true",
+        help="Draw the lattice levels of the mid/high rows quasi-randomly, one sequence "
+        "per thread as with -stratified",
+    )
+
     g_normal = p.add_argument_group("normal options")
     g_normal.add_argument("-sigma", type=float, default=0.15, help="Stddev in unit space")
 
@@ -105,16 +119,24 @@ def make_sampler_parser(p: ArgumentParser):
 
 
 def get_sampler(args: Namespace) -> Sampler:
+    spread = Sampler.Spread.IID
+    if args.stratified:
+        spread = Sampler.Spread.STRATIFIED
+    if args.quasi_random:
+        spread = Sampler.Spread.QUASI
+
     if args.normal:
-        return Sampler.normal(sigma=args.sigma)
+        return Sampler.normal(sigma=args.sigma, spread=spread)
     if args.skew_left:
-        return Sampler.skew_left(sigma=args.sigma, alpha=args.alpha)
+        return Sampler.skew_left(sigma=args.sigma, alpha=args.alpha, spread=spread)
     if args.skew_right:
-        return Sampler.skew_right(sigma=args.sigma, alpha=args.alpha)
+        return Sampler.skew_right(sigma=args.sigma, alpha=args.alpha, spread=spread)
     if args.bimodal:
-        return Sampler.bimodal(sigma=args.sigma, separation=args.separation)
+        return Sampler.bimodal(
+            sigma=args.sigma, separation=args.separation, spread=spread
+        )
 
-    return Sampler.uniform()
+    return Sampler.uniform(spread=spread)
 
 
 ALL_OPS = [
@@ -311,6 +333,58 @@ def build_parser(prog: str) -> Namespace:
         help="number of unsound candidates considered for abduction",
         default=15,
     )
+    p.add_argument(
+        "-unsound_budget",
+        type=int,
+        help="stop evaluating a sound&precise or abduction candidate after this many unsound inputs per bitwidth (0 to always evaluate every input)",
+        default=0,
+    )
+    p.add_argument(
+        "-num_threads",
+        type=int,
+        help="number of threads the enum and eval engines shard rows across",
+        default=1,
+    )
+    p.add_argument(
+        "-enum_cache",
+        type=Path,
+        help="directory to cache enumerated inputs in, reused by later runs with the same settings",
+    )
+    p.add_argument(
+        "-low_chunk_rows",
+        type=int,
+        help="enumerate the low bitwidth inputs this many rows at a time into a file (the enum cache, or a temporary one) and evaluate them from it in chunks instead of keeping them in memory (0 to keep them)",
+        default=0,
+    )
+    p.add_argument(
+        "-fast_abst",
+        action="store_true",
+        help="compute best abstractions from a few concrete inputs instead of all of them, for ops monotone in every arg (ranges) or bitwise ones (KnownBits), checked at bitwidth 4, where KnownBits falls back to all of them if it fails",
+    )
+    p.add_argument(
+        "-symmetric",
+        action="store_true",
+        help="compute the low bitwidth best abstractions of a commutative op once for both orders of its args, checked at bitwidth 4",
+    )
+    p.add_argument(
+        "-jit_max_mb",
+        type=int,
+        help="MiB of jit'd code kept around before the modules of finished eval rounds are freed, least recently used first",
+        default=256,
+    )
+    # benchmark runs sxf in pool workers, which can't start processes of their own
+    if prog != "benchmark":
+        p.add_argument(
+            "-jit_workers",
+            type=int,
+            help="number of processes the candidates of an eval round are compiled on",
+            default=1,
+        )
+    p.add_argument(
+        "-jit_cache",
+        type=Path,
+        help="directory to cache the object code of the concrete op and helper fns in, reused by later runs on the same host",
+    )
     p.add_argument(
         "-subs",
         action=BooleanOptionalAction,
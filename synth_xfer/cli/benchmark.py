@@ -52,6 +52,14 @@ def synth_run(
             num_unsound_candidates=args.num_unsound_candidates,
             optimize=args.optimize,
             sampler=sampler,
+            num_threads=args.num_threads,
+            unsound_budget=args.unsound_budget,
+            enum_cache=args.enum_cache,
+            low_chunk_rows=args.low_chunk_rows,
+            fast_abst=args.fast_abst,
+            symmetric=args.symmetric,
+            jit_max_mb=args.jit_max_mb,
+            jit_cache=args.jit_cache,
         )
 
         return {
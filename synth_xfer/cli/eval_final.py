@@ -13,9 +13,9 @@ from synth_xfer._util.domain import AbstractDomain
 from synth_xfer._util.eval import eval_transfer_func, setup_eval
 from synth_xfer._util.eval_result import EvalResult
 from synth_xfer._util.jit import Jit
-from synth_xfer._util.lower import LowerToLLVM
 from synth_xfer._util.parse_mlir import get_helper_funcs, parse_mlir_mod, top_as_xfer
 from synth_xfer._util.random import Random, Sampler
+from synth_xfer._util.runtime import Runtime
 from synth_xfer.cli.args import get_sampler, make_sampler_parser
 
 
@@ -42,6 +42,11 @@ def _reg_args():
     p.add_argument("-norm-bw", type=_int_tuple, default=(64, 2500, 50000))
     make_sampler_parser(p)
     p.add_argument("-o", "--output", type=Path, default=None)
+    p.add_argument("-enum_cache", type=Path, default=None)
+    p.add_argument("-jit_cache", type=Path, default=None)
+    p.add_argument("-low_chunk_rows", type=int, default=0)
+    p.add_argument("-fast_abst", action="store_true")
+    p.add_argument("-symmetric", action="store_true")
 
     return p.parse_args()
 
@@ -96,6 +101,11 @@ def run(
     solution_path: Path,
     random_seed: int | None,
     sampler: Sampler,
+    enum_cache: Path | None = None,
+    low_chunk_rows: int = 0,
+    fast_abst: bool = False,
+    symmetric: bool = False,
+    jit_cache: Path | None = None,
 ) -> tuple[EvalResult, EvalResult]:
     all_bws = lbw + [x[0] for x in mbw] + [x[0] for x in hbw]
     helpers = get_helper_funcs(input_path, domain)
@@ -104,16 +114,25 @@ def run(
     random = Random(random_seed)
     random_seed = random.randint(0, 1_000_000) if random_seed is None else random_seed
 
-    lowerer = LowerToLLVM(all_bws)
-    top_mlir = top_as_xfer(helpers.transfer_func)
-    lowerer.add_fn(helpers.meet_func)
-    lowerer.add_fn(helpers.get_top_func)
-    top_xfer = lowerer.add_fn(top_mlir, shim=True)
+    jit = Jit(cache_dir=jit_cache)
+    runtime = Runtime(jit, all_bws, [helpers.get_top_func, helpers.meet_func])
+    lowerer = runtime.lowerer()
+    top_xfer = lowerer.add_fn(top_as_xfer(helpers.transfer_func), shim=True)
     lowerer.add_mod(sol_module, ["solution"])
-
-    jit = Jit()
-    jit.add_mod(str(lowerer))
-    to_eval = setup_eval(lbw, mbw, hbw, random_seed, helpers, jit, sampler)
+    jit.add_mod(str(lowerer), cache=True)
+    to_eval = setup_eval(
+        lbw,
+        mbw,
+        hbw,
+        random_seed,
+        helpers,
+        jit,
+        sampler,
+        enum_cache,
+        low_chunk_rows,
+        fast_abst=fast_abst,
+        symmetric=symmetric,
+    )
 
     input = {
         bw: (
@@ -142,6 +161,11 @@ def _run_wrapper(x: tuple[AbstractDomain, Path, Path, int | None, tuple, Namespa
         solution_path=x[2],
         random_seed=x[3],
         sampler=sampler,
+        enum_cache=x[5].enum_cache,
+        low_chunk_rows=x[5].low_chunk_rows,
+        fast_abst=x[5].fast_abst,
+        symmetric=x[5].symmetric,
+        jit_cache=x[5].jit_cache,
     )
 
 
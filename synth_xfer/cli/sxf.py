@@ -6,15 +6,22 @@ import numpy as np
 from synth_xfer._util.cond_func import FunctionWithCondition
 from synth_xfer._util.domain import AbstractDomain
 from synth_xfer._util.dsl_operators import DslOpSet, load_dsl_ops
-from synth_xfer._util.eval import eval_transfer_func, setup_eval
+from synth_xfer._util.eval import (
+    CandidateOutputs,
+    LowStream,
+    build_ref_cache,
+    eval_outputs,
+    eval_transfer_func,
+    setup_eval,
+)
 from synth_xfer._util.eval_result import EvalResult
-from synth_xfer._util.jit import Jit
+from synth_xfer._util.jit import Jit, JitModule
 from synth_xfer._util.log import get_logger, init_logging, write_log_file
-from synth_xfer._util.lower import LowerToLLVM
 from synth_xfer._util.mcmc_sampler import setup_mcmc
 from synth_xfer._util.one_iter import synthesize_one_iteration
 from synth_xfer._util.parse_mlir import HelperFuncs, get_helper_funcs, top_as_xfer
 from synth_xfer._util.random import Random, Sampler
+from synth_xfer._util.runtime import Runtime
 from synth_xfer._util.solution_set import UnsizedSolutionSet
 from synth_xfer._util.synth_context import SynthesizerContext
 from synth_xfer._util.op_groups import *
@@ -22,46 +29,138 @@ from synth_xfer._util.thompson_sample import LinearThompsonSampling
 from synth_xfer.cli.args import build_parser, get_sampler
 
 if TYPE_CHECKING:
-    from synth_xfer._eval_engine import ToEval
+    from synth_xfer._eval_engine import RefCache, ToEval
+
+
+def _compile(
+    fcs: list[FunctionWithCondition],
+    bws: list[int],
+    runtime: Runtime,
+    jit: Jit,
+) -> tuple[dict[int, list[int]], list[JitModule]]:
+    """
+    The address of every fn at every bw, and the modules they are in, to be released
+    once they are not called anymore. A program the jit still holds, up to names and
+    dead code, is taken from it instead of being lowered and compiled again.
+    """
+    keys = [fc.structural_key() for fc in fcs]
+    addrs: list[dict[int, int]] = [{} for _ in fcs]
+    mods: list[JitModule] = []
+    missed: list[int] = []
+    for i, key in enumerate(keys):
+        for bw in bws:
+            hit = jit.recall((key, bw))
+            if hit is None:
+                missed.append(i)
+                break
+            mods.append(hit[0])
+            addrs[i][bw] = hit[1]
+
+    if missed:
+        # proposals of the same program in one round are lowered once, into a module
+        # per jit worker so they compile concurrently
+        first_of = {keys[i]: i for i in reversed(missed)}
+        first = list(first_of.values())
+        parts = [first[k :: jit.num_workers] for k in range(jit.num_workers)]
+        parts = [part for part in parts if part]
+        lowerers = [runtime.lowerer() for _ in parts]
+        names: dict[int, dict[int, str]] = {}
+        for lowerer, part in zip(lowerers, parts):
+            names.update({i: fcs[i].lower(lowerer.add_fn) for i in part})
+        part_mods = jit.add_mods([str(lowerer) for lowerer in lowerers])
+        mods.extend(part_mods)
+
+        mod_of = {i: mod for mod, part in zip(part_mods, parts) for i in part}
+        for i in first:
+            for bw, name in names[i].items():
+                jit.remember((keys[i], bw), mod_of[i], name)
+        for i in missed:
+            j = first_of[keys[i]]
+            addrs[i] = {bw: jit.get_fn_ptr(names[j][bw], mod_of[j]) for bw in bws}
+
+    return {bw: [a[bw] for a in addrs] for bw in bws}, mods
 
 
 def _eval_helper(
-    to_eval: dict[int, "ToEval"],
+    to_eval: dict[int, "ToEval | LowStream"],
     bws: list[int],
     helper_funcs: HelperFuncs,
+    runtime: Runtime,
     jit: Jit,
+    num_threads: int = 1,
 ) -> Callable[
-    [list[FunctionWithCondition], list[FunctionWithCondition]],
+    [list[FunctionWithCondition], list[FunctionWithCondition], list[int]],
     list[EvalResult],
 ]:
+    # the base set only changes when the solution set does, so the per-row meet
+    # of the last base set seen is kept around and reused until it changes
+    cached_base: list[FunctionWithCondition] | None = None
+    cached_refs: dict[int, "RefCache | list[int]"] = {}
+    # streamed inputs keep calling the base fns, so their modules are held until
+    # the next base set replaces them
+    base_mods: list[JitModule] = []
+
+    def get_refs(base: list[FunctionWithCondition]) -> dict[int, "RefCache | list[int]"]:
+        nonlocal cached_base, cached_refs, base_mods
+        if (
+            cached_base is not None
+            and len(cached_base) == len(base)
+            and all(a is b for a, b in zip(cached_base, base))
+        ):
+            return cached_refs
+
+        base_fns, mods = _compile(base, bws, runtime, jit)
+        cached_refs = build_ref_cache(
+            {bw: (to_eval[bw], base_fns.get(bw, [])) for bw in to_eval}, num_threads
+        )
+        for mod in base_mods:
+            jit.release(mod)
+        base_mods = mods
+        cached_base = list(base)
+
+        return cached_refs
+
     def helper(
         xfer: list[FunctionWithCondition],
         base: list[FunctionWithCondition],
+        unsound_budgets: list[int],
     ) -> list[EvalResult]:
-        lowerer = LowerToLLVM(bws)
-        lowerer.add_fn(helper_funcs.get_top_func)
+        refs = get_refs(base)
 
         if not xfer:
             ret_top_func = FunctionWithCondition(top_as_xfer(helper_funcs.transfer_func))
             ret_top_func.set_func_name("ret_top")
             xfer = [ret_top_func]
 
-        xfer_names = [fc.lower(lowerer.add_fn) for fc in xfer]
-        base_names = [fc.lower(lowerer.add_fn) for fc in base]
+        xfer_fns, mods = _compile(xfer, bws, runtime, jit)
+
+        input = {bw: (to_eval[bw], xfer_fns.get(bw, []), refs[bw]) for bw in to_eval}
+        results = eval_transfer_func(input, num_threads, unsound_budgets)
+        for mod in mods:
+            jit.release(mod)
 
-        xfer_names = {bw: [d[bw] for d in xfer_names] for bw in bws}
-        base_names = {bw: [d[bw] for d in base_names] for bw in bws}
+        return results
 
-        jit.add_mod(str(lowerer))
-        xfer_fns = {bw: [jit.get_fn_ptr(x) for x in xfer_names[bw]] for bw in xfer_names}
-        base_fns = {bw: [jit.get_fn_ptr(x) for x in base_names[bw]] for bw in base_names}
+    return helper
 
-        input = {
-            bw: (to_eval[bw], xfer_fns.get(bw, []), base_fns.get(bw, []))
-            for bw in to_eval
-        }
 
-        return eval_transfer_func(input)
+def _eval_outputs_helper(
+    to_eval: dict[int, "ToEval"],
+    bws: list[int],
+    runtime: Runtime,
+    jit: Jit,
+    num_threads: int = 1,
+) -> Callable[[list[FunctionWithCondition]], CandidateOutputs | None]:
+    def helper(xfer: list[FunctionWithCondition]) -> CandidateOutputs | None:
+        xfer_fns, mods = _compile(xfer, bws, runtime, jit)
+
+        outputs = eval_outputs(
+            {bw: (to_eval[bw], xfer_fns.get(bw, [])) for bw in to_eval}, num_threads
+        )
+        for mod in mods:
+            jit.release(mod)
+
+        return outputs
 
     return helper
 
@@ -95,9 +194,18 @@ def run_subset(
     num_unsound_candidates: int,
     optimize: bool,
     sampler: Sampler,
+    num_threads: int = 1,
+    unsound_budget: int = 0,
+    enum_cache: Path | None = None,
+    low_chunk_rows: int = 0,
+    fast_abst: bool = False,
+    symmetric: bool = False,
+    jit_max_mb: int | None = 256,
+    jit_workers: int = 1,
+    jit_cache: Path | None = None,
 ) -> EvalResult:
     logger = get_logger()
-    jit = Jit()
+    jit = Jit(None if jit_max_mb is None else jit_max_mb << 20, jit_workers, jit_cache)
 
     EvalResult.init_bw_settings(
         set(lbw), set([t[0] for t in mbw]), set([t[0] for t in hbw])
@@ -113,13 +221,37 @@ def run_subset(
     helper_funcs = get_helper_funcs(transformer_file, domain)
 
     start_time = perf_counter()
-    to_eval = setup_eval(lbw, mbw, hbw, random_seed, helper_funcs, jit, sampler)
+    to_eval = setup_eval(
+        lbw,
+        mbw,
+        hbw,
+        random_seed,
+        helper_funcs,
+        jit,
+        sampler,
+        enum_cache,
+        low_chunk_rows,
+        num_threads,
+        fast_abst,
+        symmetric,
+    )
     run_time = perf_counter() - start_time
     logger.perf(f"Enum engine took {run_time:.4f}s")
 
     all_bws = lbw + [x[0] for x in mbw] + [x[0] for x in hbw]
-    solution_eval_func = _eval_helper(to_eval, all_bws, helper_funcs, jit)
-    solution_set = UnsizedSolutionSet([], solution_eval_func, optimize=optimize)
+    runtime = Runtime(jit, all_bws, [helper_funcs.get_top_func, helper_funcs.meet_func])
+    solution_eval_func = _eval_helper(
+        to_eval, all_bws, helper_funcs, runtime, jit, num_threads
+    )
+    # per row outputs need every input in memory at once, which streaming avoids
+    solution_outputs_func = (
+        None
+        if low_chunk_rows
+        else _eval_outputs_helper(to_eval, all_bws, runtime, jit, num_threads)
+    )
+    solution_set = UnsizedSolutionSet(
+        [], solution_eval_func, optimize=optimize, eval_outputs_func=solution_outputs_func
+    )
 
     # initialize SynthesizerContexts for each subset to contain only allowed ops
     contexts: dict[tuple[str, ...], SynthesizerContext] = {}
@@ -203,7 +335,8 @@ def run_subset(
             mcmc_samplers,
             prec_set,
             lbw,
-            vbw
+            vbw,
+            unsound_budget,
         )
 
         # Update the MAB distribution
@@ -249,14 +382,13 @@ def run_subset(
     solution_module = solution_set.generate_solution_mlir()
     write_log_file("solution.mlir", solution_module)
 
-    lowerer = LowerToLLVM(all_bws)
-    lowerer.add_fn(helper_funcs.meet_func)
-    lowerer.add_fn(helper_funcs.get_top_func)
+    lowerer = runtime.lowerer()
     lowerer.add_mod(solution_module, ["solution"])
     jit.add_mod(str(lowerer))
     sol_ptrs = {bw: jit.get_fn_ptr(f"solution_{bw}_shim") for bw in all_bws}
     sol_to_eval = {bw: (to_eval[bw], [sol_ptrs[bw]], []) for bw in all_bws}
-    solution_result = eval_transfer_func(sol_to_eval)[0]
+    solution_result = eval_transfer_func(sol_to_eval, num_threads)[0]
+    jit.close()
 
     solution_exact = solution_result.get_exact_prop() * 100
     print(
@@ -287,9 +419,18 @@ def run(
     num_unsound_candidates: int,
     optimize: bool,
     sampler: Sampler,
+    num_threads: int = 1,
+    unsound_budget: int = 0,
+    enum_cache: Path | None = None,
+    low_chunk_rows: int = 0,
+    fast_abst: bool = False,
+    symmetric: bool = False,
+    jit_max_mb: int | None = 256,
+    jit_workers: int = 1,
+    jit_cache: Path | None = None,
 ) -> EvalResult:
     logger = get_logger()
-    jit = Jit()
+    jit = Jit(None if jit_max_mb is None else jit_max_mb << 20, jit_workers, jit_cache)
     dsl_ops: DslOpSet | None = load_dsl_ops(dsl_ops_path) if dsl_ops_path else None
 
     EvalResult.init_bw_settings(
@@ -306,13 +447,37 @@ def run(
     helper_funcs = get_helper_funcs(transformer_file, domain)
 
     start_time = perf_counter()
-    to_eval = setup_eval(lbw, mbw, hbw, random_seed, helper_funcs, jit, sampler)
+    to_eval = setup_eval(
+        lbw,
+        mbw,
+        hbw,
+        random_seed,
+        helper_funcs,
+        jit,
+        sampler,
+        enum_cache,
+        low_chunk_rows,
+        num_threads,
+        fast_abst,
+        symmetric,
+    )
     run_time = perf_counter() - start_time
     logger.perf(f"Enum engine took {run_time:.4f}s")
 
     all_bws = lbw + [x[0] for x in mbw] + [x[0] for x in hbw]
-    solution_eval_func = _eval_helper(to_eval, all_bws, helper_funcs, jit)
-    solution_set = UnsizedSolutionSet([], solution_eval_func, optimize=optimize)
+    runtime = Runtime(jit, all_bws, [helper_funcs.get_top_func, helper_funcs.meet_func])
+    solution_eval_func = _eval_helper(
+        to_eval, all_bws, helper_funcs, runtime, jit, num_threads
+    )
+    # per row outputs need every input in memory at once, which streaming avoids
+    solution_outputs_func = (
+        None
+        if low_chunk_rows
+        else _eval_outputs_helper(to_eval, all_bws, runtime, jit, num_threads)
+    )
+    solution_set = UnsizedSolutionSet(
+        [], solution_eval_func, optimize=optimize, eval_outputs_func=solution_outputs_func
+    )
 
     context = _setup_context(random, False, dsl_ops)
     context_weighted = _setup_context(random, False, dsl_ops)
@@ -372,6 +537,7 @@ def run(
             prec_set,
             lbw,
             vbw,
+            unsound_budget,
         )
 
         write_log_file(
@@ -408,14 +574,13 @@ def run(
     solution_module = solution_set.generate_solution_mlir()
     write_log_file("solution.mlir", solution_module)
 
-    lowerer = LowerToLLVM(all_bws)
-    lowerer.add_fn(helper_funcs.meet_func)
-    lowerer.add_fn(helper_funcs.get_top_func)
+    lowerer = runtime.lowerer()
     lowerer.add_mod(solution_module, ["solution"])
     jit.add_mod(str(lowerer))
     sol_ptrs = {bw: jit.get_fn_ptr(f"solution_{bw}_shim") for bw in all_bws}
     sol_to_eval = {bw: (to_eval[bw], [sol_ptrs[bw]], []) for bw in all_bws}
-    solution_result = eval_transfer_func(sol_to_eval)[0]
+    solution_result = eval_transfer_func(sol_to_eval, num_threads)[0]
+    jit.close()
 
     solution_exact = solution_result.get_exact_prop() * 100
     print(
@@ -468,6 +633,15 @@ def main() -> None:
             num_unsound_candidates=args.num_unsound_candidates,
             optimize=args.optimize,
             sampler=sampler,
+            num_threads=args.num_threads,
+            unsound_budget=args.unsound_budget,
+            enum_cache=args.enum_cache,
+            low_chunk_rows=args.low_chunk_rows,
+            fast_abst=args.fast_abst,
+            symmetric=args.symmetric,
+            jit_max_mb=args.jit_max_mb,
+            jit_workers=args.jit_workers,
+            jit_cache=args.jit_cache,
         )
     else:
         run(
@@ -491,5 +665,14 @@ def main() -> None:
             num_unsound_candidates=args.num_unsound_candidates,
             optimize=args.optimize,
             sampler=sampler,
+            num_threads=args.num_threads,
+            unsound_budget=args.unsound_budget,
+            enum_cache=args.enum_cache,
+            low_chunk_rows=args.low_chunk_rows,
+            fast_abst=args.fast_abst,
+            symmetric=args.symmetric,
+            jit_max_mb=args.jit_max_mb,
+            jit_workers=args.jit_workers,
+            jit_cache=args.jit_cache,
         )        
     
\ No newline at end of file
@@ -1,50 +1,195 @@
+from collections.abc import Iterator
 from pathlib import Path
 
+import numpy as np
+import pytest
+
 from synth_xfer._eval_engine import (
+    ToEvalKnownBits4_4_4,
+    conc_table_4_4_4,
     enum_low_knownbits_4_4_4,
     enum_low_uconstrange_4_4_4,
     enum_mid_knownbits_8_8_8,
     enum_mid_uconstrange_8_8_8,
+    eval_job_chunks_knownbits_4_4_4,
+    eval_job_knownbits_4_4_4,
     eval_knownbits_4_4_4,
     eval_knownbits_8_8_8,
+    eval_outputs_knownbits_4_4_4,
     eval_uconstrange_4_4_4,
     eval_uconstrange_8_8_8,
+    meet_ref_cache_knownbits_4_4_4,
+    num_lows_knownbits_4_4_4,
+    ref_cache_knownbits_4_4_4,
+    row_outputs_bytes_knownbits_4_4_4,
+    row_outputs_knownbits_4_4_4,
+    run_eval_jobs,
 )
+from synth_xfer._util.cond_func import FunctionWithCondition
 from synth_xfer._util.domain import AbstractDomain
-from synth_xfer._util.eval import get_per_bit
+from synth_xfer._util.eval import LowStream, eval_outputs, get_per_bit, setup_eval
 from synth_xfer._util.jit import Jit
 from synth_xfer._util.lower import LowerToLLVM
-from synth_xfer._util.parse_mlir import get_helper_funcs, parse_mlir_func
+from synth_xfer._util.parse_mlir import (
+    HelperFuncs,
+    get_helper_funcs,
+    parse_mlir_func,
+    top_as_xfer,
+)
 from synth_xfer._util.random import Sampler
+from synth_xfer._util.runtime import Runtime
+from synth_xfer.cli.sxf import _compile, _eval_helper
 
 PROJ_DIR = Path(__file__).parent.parent
 DATA_DIR = PROJ_DIR / "tests" / "data"
+KB_OPS = ("and", "or", "xor")
+
+
+@pytest.fixture
+def and_helpers() -> HelperFuncs:
+    "The helpers of the and op in KnownBits"
+    return get_helper_funcs(
+        PROJ_DIR / "mlir" / "Operations" / "And.mlir", AbstractDomain.KnownBits
+    )
+
+
+@pytest.fixture
+def kb_lowerer(and_helpers: HelperFuncs) -> LowerToLLVM:
+    "The and op and the KnownBits transformers of KB_OPS, lowered at bitwidth 4"
+    lowerer = LowerToLLVM([4])
+    lowerer.add_fn(and_helpers.crt_func, shim=True)
+    for op in KB_OPS:
+        lowerer.add_fn(parse_mlir_func(DATA_DIR / f"kb_{op}.mlir"), shim=True)
 
+    return lowerer
 
-def test_jit_with_kb_and():
-    conc_and_f = PROJ_DIR / "mlir" / "Operations" / "And.mlir"
 
+@pytest.fixture
+def kb_xfers(
+    kb_lowerer: LowerToLLVM,
+) -> Iterator[tuple[ToEvalKnownBits4_4_4, list[int]]]:
+    "The low rows of the and op at bitwidth 4 and the transformers of KB_OPS"
+    jit = Jit()
+    jit.add_mod(str(kb_lowerer))
+    to_eval = enum_low_knownbits_4_4_4(jit.get_fn_ptr("concrete_op_4_shim"), None)
+    # the jit is held until the test is done with its fns
+    yield to_eval, [jit.get_fn_ptr(f"kb_{op}_4_shim") for op in KB_OPS]
+
+
+@pytest.fixture
+def kb_and_jit(and_helpers: HelperFuncs) -> Jit:
+    "A jit holding the and op (batched too) and its KnownBits transformer at 4 and 8 bits"
     lowerer = LowerToLLVM([4, 8])
-    helpers = get_helper_funcs(conc_and_f, AbstractDomain.KnownBits)
-    xfer_mlir = parse_mlir_func(DATA_DIR / "kb_and.mlir")
-    lowerer.add_fn(xfer_mlir, shim=True)
-    lowerer.add_fn(helpers.crt_func, shim=True)
+    lowerer.add_fn(parse_mlir_func(DATA_DIR / "kb_and.mlir"), shim=True)
+    lowerer.add_fn(and_helpers.crt_func, shim=True, batch=True)
 
     jit = Jit()
     jit.add_mod(str(lowerer))
-    conc_op_addr = jit.get_fn_ptr("concrete_op_4_shim")
-    xfer_fn_addr = jit.get_fn_ptr("kb_and_4_shim")
+    return jit
+
+
+def test_jit_with_kb_and(kb_and_jit: Jit):
+    conc_op_addr = kb_and_jit.get_fn_ptr("concrete_op_4_shim")
+    xfer_fn_addr = kb_and_jit.get_fn_ptr("kb_and_4_shim")
 
     to_eval_low = enum_low_knownbits_4_4_4(conc_op_addr, None)
     raw_res = eval_knownbits_4_4_4(to_eval_low, [xfer_fn_addr], [])
+    counters = np.asarray(raw_res)
+    assert counters.shape == (1, len(raw_res.fields))
+    assert counters.tolist() == [[6561, 0, 6561, 6480, 0, 6561]]
+    assert (raw_res.cases, raw_res.unsolved_cases, raw_res.max_dist) == (6561, 6480, 4)
     res = get_per_bit(raw_res)[0]
     assert (
         str(res).strip()
         == "bw: 4  all: 6561  s: 6561  e: 6561  uall: 6480  ue: 6480  dis: 0       bdis: 4374.0  sdis: 0"
     )
 
-    conc_op_addr = jit.get_fn_ptr("concrete_op_8_shim")
-    xfer_fn_addr = jit.get_fn_ptr("kb_and_8_shim")
+    refs = ref_cache_knownbits_4_4_4(to_eval_low, [xfer_fn_addr])
+    assert len(refs) == len(to_eval_low)
+    cached_res = eval_knownbits_4_4_4(to_eval_low, [xfer_fn_addr], refs)
+    raw_res = eval_knownbits_4_4_4(to_eval_low, [xfer_fn_addr], [xfer_fn_addr])
+    assert str(get_per_bit(cached_res)[0]) == str(get_per_bit(raw_res)[0])
+
+
+def test_enum_low(kb_and_jit: Jit):
+    conc_op_addr = kb_and_jit.get_fn_ptr("concrete_op_4_shim")
+    lanes = np.asarray(enum_low_knownbits_4_4_4(conc_op_addr, None))
+    assert lanes.shape == (6561, 6) and not lanes.flags.writeable
+    assert num_lows_knownbits_4_4_4() == 6561
+
+    # sharded, looked up from a table or in row ranges, the rows are the same
+    assert np.array_equal(
+        np.asarray(enum_low_knownbits_4_4_4(conc_op_addr, None, num_threads=3)), lanes
+    )
+    table = conc_table_4_4_4(conc_op_addr, None)
+    assert np.asarray(table).shape == (2, 256)
+    assert np.array_equal(
+        np.asarray(enum_low_knownbits_4_4_4(conc_op_addr, None, table=table)), lanes
+    )
+    assert np.array_equal(
+        np.asarray(enum_low_knownbits_4_4_4(conc_op_addr, None, begin=100, end=2100)),
+        lanes[100:2100],
+    )
+
+
+def test_to_eval_from_lanes(kb_and_jit: Jit):
+    xfer_fn_addr = kb_and_jit.get_fn_ptr("kb_and_4_shim")
+    to_eval = enum_low_knownbits_4_4_4(kb_and_jit.get_fn_ptr("concrete_op_4_shim"), None)
+    lanes = np.asarray(to_eval)
+
+    rebuilt = type(to_eval)(lanes[lanes[:, 4] == 0])
+    assert np.array_equal(np.asarray(rebuilt), lanes[lanes[:, 4] == 0])
+    assert eval_knownbits_4_4_4(rebuilt, [xfer_fn_addr], []).cases == len(rebuilt)
+    weighted = type(to_eval)(lanes[:3], weights=np.array([1, 2, 3], np.uint64))
+    assert np.array_equal(weighted.weights, [1, 2, 3])
+
+    repeated = type(to_eval)(np.concatenate([lanes, lanes[:100]]))
+    deduped = repeated.dedup()
+    assert (len(deduped), deduped.weights.sum()) == (6561, 6661)
+    assert np.array_equal(
+        np.asarray(eval_knownbits_4_4_4(deduped, [xfer_fn_addr], [])),
+        np.asarray(eval_knownbits_4_4_4(repeated, [xfer_fn_addr], [])),
+    )
+
+
+def test_eval_job_chunks(kb_and_jit: Jit):
+    xfer_fn_addr = kb_and_jit.get_fn_ptr("kb_and_4_shim")
+    to_eval = enum_low_knownbits_4_4_4(kb_and_jit.get_fn_ptr("concrete_op_4_shim"), None)
+    whole = eval_knownbits_4_4_4(to_eval, [xfer_fn_addr], [xfer_fn_addr])
+
+    job = eval_job_chunks_knownbits_4_4_4(
+        np.asarray(to_eval), 1000, [xfer_fn_addr], [xfer_fn_addr]
+    )
+    (streamed,) = run_eval_jobs([job])
+    assert np.array_equal(np.asarray(streamed), np.asarray(whole))
+    assert streamed.unsolved_cases == whole.unsolved_cases
+
+
+def test_enum_low_symmetric(kb_and_jit: Jit):
+    conc_op_addr = kb_and_jit.get_fn_ptr("concrete_op_4_shim")
+    xfer_fn_addr = kb_and_jit.get_fn_ptr("kb_and_4_shim")
+    plain = enum_low_knownbits_4_4_4(conc_op_addr, None)
+
+    # symmetric only shares the best abstraction of swapped args, both orders are
+    # still rows so that candidates which do not commute are run on both
+    symmetric = enum_low_knownbits_4_4_4(conc_op_addr, None, symmetric=True)
+    assert np.array_equal(
+        np.unique(np.asarray(symmetric), axis=0), np.unique(np.asarray(plain), axis=0)
+    )
+    assert np.array_equal(
+        np.asarray(eval_knownbits_4_4_4(symmetric, [xfer_fn_addr], [])),
+        np.asarray(eval_knownbits_4_4_4(plain, [xfer_fn_addr], [])),
+    )
+    for begin, end, n in ((0, 6561, 3), (1, 2, 1), (100, 2101, 4), (6480, 6561, 2)):
+        part = enum_low_knownbits_4_4_4(
+            conc_op_addr, None, n, symmetric=True, begin=begin, end=end
+        )
+        assert np.array_equal(np.asarray(part), np.asarray(symmetric)[begin:end])
+
+
+def test_enum_mid(kb_and_jit: Jit):
+    conc_op_addr = kb_and_jit.get_fn_ptr("concrete_op_8_shim")
+    xfer_fn_addr = kb_and_jit.get_fn_ptr("kb_and_8_shim")
 
     NUM_CASES = 5000
     sampler = Sampler.uniform()
@@ -57,6 +202,53 @@ def test_jit_with_kb_and():
     assert res.all_cases == NUM_CASES
     assert res.bitwidth == 8
 
+    sharded = [
+        np.asarray(
+            enum_mid_knownbits_8_8_8(
+                conc_op_addr, None, NUM_CASES, 100, sampler.sampler, num_threads=4
+            )
+        )
+        for _ in range(2)
+    ]
+    assert len(sharded[0]) == NUM_CASES
+    assert np.array_equal(sharded[0], sharded[1])
+
+    batched = enum_mid_knownbits_8_8_8(
+        conc_op_addr,
+        None,
+        NUM_CASES,
+        100,
+        sampler.sampler,
+        crtBatchAddr=kb_and_jit.get_fn_ptr("concrete_op_8_shim_batch"),
+    )
+    assert np.array_equal(np.asarray(batched), np.asarray(to_eval_mid))
+
+
+def test_enum_mid_levels(kb_and_jit: Jit):
+    conc_op_addr = kb_and_jit.get_fn_ptr("concrete_op_8_shim")
+
+    # a narrow normal sampler draws the middle of the 9 lattice levels every time
+    narrow = enum_mid_knownbits_8_8_8(
+        conc_op_addr, None, 1000, 100, Sampler.normal(0.01).sampler
+    )
+    known = np.asarray(narrow)[:, 0] | np.asarray(narrow)[:, 1]
+    assert {int(k).bit_count() for k in known} == {4}
+
+    # stratified levels hit each of the 9 levels of both args equally often
+    strata = np.asarray(
+        enum_mid_knownbits_8_8_8(
+            conc_op_addr,
+            None,
+            900,
+            100,
+            Sampler.uniform(spread=Sampler.Spread.STRATIFIED).sampler,
+        )
+    )
+    for arg in range(2):
+        known = strata[:, 2 * arg] | strata[:, 2 * arg + 1]
+        levels = np.bincount([int(k).bit_count() for k in known], minlength=9)
+        assert levels.tolist() == [100] * 9
+
 
 def test_jit_with_ucr_add():
     conc_add_f = PROJ_DIR / "mlir" / "Operations" / "Add.mlir"
@@ -93,3 +285,329 @@ def test_jit_with_ucr_add():
     assert res.get_exact_prop() == 1.0
     assert res.all_cases == NUM_CASES
     assert res.bitwidth == 8
+
+
+def test_enum_cache(tmp_path: Path):
+    def enum(seed: int, domain=AbstractDomain.KnownBits) -> dict[int, np.ndarray]:
+        helpers = get_helper_funcs(PROJ_DIR / "mlir" / "Operations" / "And.mlir", domain)
+        to_eval = setup_eval(
+            [4], [(8, 100)], [], seed, helpers, Jit(), Sampler.uniform(), tmp_path
+        )
+        return {bw: np.asarray(x) for bw, x in to_eval.items()}
+
+    # an enumeration and a concrete op table per bitwidth
+    first = enum(7)
+    assert len(list(tmp_path.glob("*.npy"))) == 4
+    cached = enum(7)
+    assert all(np.array_equal(first[bw], cached[bw]) for bw in (4, 8))
+    # only the sampled enumeration depends on the seed
+    enum(8)
+    assert len(list(tmp_path.glob("*.npy"))) == 5
+    # the tables are shared by every domain
+    enum(7, AbstractDomain.UConstRange)
+    assert len(list(tmp_path.glob("*.npy"))) == 7
+
+
+def test_enum_cache_symmetric(tmp_path: Path, and_helpers: HelperFuncs):
+    def enum(cache_dir: Path | None) -> np.ndarray:
+        (to_eval,) = setup_eval(
+            [4],
+            [],
+            [],
+            7,
+            and_helpers,
+            Jit(),
+            Sampler.uniform(),
+            cache_dir,
+            symmetric=True,
+        ).values()
+        return np.asarray(to_eval)
+
+    # symmetric rows are cached apart from the plain ones, as they are in another order
+    fresh = enum(None)
+    for _ in range(2):
+        assert np.array_equal(enum(tmp_path), fresh)
+    (to_eval,) = setup_eval(
+        [4], [], [], 7, and_helpers, Jit(), Sampler.uniform(), tmp_path
+    ).values()
+    assert not np.array_equal(np.asarray(to_eval), fresh)
+    assert len(list(tmp_path.glob("*.npy"))) == 3
+
+
+def test_enum_cache_stream(tmp_path: Path, and_helpers: HelperFuncs):
+    def enum(cache_dir: Path | None, low_chunk_rows: int, symmetric: bool):
+        (to_eval,) = setup_eval(
+            [4],
+            [],
+            [],
+            7,
+            and_helpers,
+            Jit(),
+            Sampler.uniform(),
+            cache_dir,
+            low_chunk_rows=low_chunk_rows,
+            symmetric=symmetric,
+        ).values()
+        return to_eval
+
+    for symmetric in (False, True):
+        kept = enum(None, 0, symmetric)
+        for cache_dir in (None, tmp_path, tmp_path):
+            stream = enum(cache_dir, 1000, symmetric)
+            assert isinstance(stream, LowStream)
+            assert len(stream) == (len(kept) + 999) // 1000
+            assert np.array_equal(stream.lanes, np.asarray(kept))
+            assert np.array_equal(
+                np.asarray(stream.chunk(len(stream) - 1)), np.asarray(kept)[-561:]
+            )
+
+        # streamed inputs are enumerated into the same cache entry as kept ones
+        entries = sorted(tmp_path.glob("*.npy"))
+        cached = enum(tmp_path, 0, symmetric)
+        assert sorted(tmp_path.glob("*.npy")) == entries
+        assert np.array_equal(np.asarray(cached), np.asarray(kept))
+
+
+def test_fast_abst():
+    def enum(
+        op: str, fast_abst: bool, domain=AbstractDomain.UConstRange
+    ) -> dict[int, np.ndarray]:
+        helpers = get_helper_funcs(
+            PROJ_DIR / "mlir" / "Operations" / f"{op}.mlir", domain
+        )
+        to_eval = setup_eval(
+            [4], [(8, 100)], [], 7, helpers, Jit(), Sampler.uniform(), fast_abst=fast_abst
+        )
+        return {bw: np.asarray(x) for bw, x in to_eval.items()}
+
+    # umax is monotone in both args, so the corners give the best abstractions
+    fast, exact = enum("Umax", True), enum("Umax", False)
+    assert all(np.array_equal(fast[bw], exact[bw]) for bw in (4, 8))
+    # add wraps around, which the check at bitwidth 4 catches
+    with pytest.raises(ValueError, match="fast_abst"):
+        enum("Add", True)
+
+    # and is bitwise, so the result bits only depend on the arg bits at the same place
+    kb = AbstractDomain.KnownBits
+    fast, exact = enum("And", True, kb), enum("And", False, kb)
+    assert all(np.array_equal(fast[bw], exact[bw]) for bw in (4, 8))
+    # the carries of add are not, so the best abstractions come from every input
+    fast, exact = enum("Add", True, kb), enum("Add", False, kb)
+    assert all(np.array_equal(fast[bw], exact[bw]) for bw in (4, 8))
+
+
+def test_symmetric():
+    def enum(op: str, symmetric: bool) -> np.ndarray:
+        helpers = get_helper_funcs(
+            PROJ_DIR / "mlir" / "Operations" / f"{op}.mlir", AbstractDomain.KnownBits
+        )
+        to_eval = setup_eval(
+            [4], [], [], 7, helpers, Jit(), Sampler.uniform(), symmetric=symmetric
+        )
+        return np.unique(np.asarray(to_eval[4]), axis=0)
+
+    # xor commutes, so both orders of two args get the same best abstraction
+    assert np.array_equal(enum("Xor", True), enum("Xor", False))
+    with pytest.raises(ValueError, match="commutative"):
+        enum("Sub", True)
+
+
+def test_jit_release(kb_lowerer: LowerToLLVM):
+    jit = Jit(max_bytes=0)
+    kept = jit.add_mod(str(kb_lowerer))
+    to_eval = enum_low_knownbits_4_4_4(jit.get_fn_ptr("concrete_op_4_shim"), None)
+
+    # a module released once its round is over is freed right away under the cap
+    for _ in range(3):
+        mod = jit.add_mod(str(kb_lowerer))
+        res = eval_knownbits_4_4_4(to_eval, [jit.get_fn_ptr("kb_and_4_shim")], [])
+        assert np.asarray(res).tolist() == [[6561, 0, 6561, 6480, 0, 6561]]
+        jit.release(mod)
+        assert list(jit.mods) == [kept]
+
+    # the fns of a module still held stay callable
+    res = eval_knownbits_4_4_4(to_eval, [jit.get_fn_ptr("kb_and_4_shim")], [])
+    assert np.asarray(res).tolist() == [[6561, 0, 6561, 6480, 0, 6561]]
+
+
+def test_compile_cache(and_helpers: HelperFuncs):
+    fcs = [FunctionWithCondition(parse_mlir_func(DATA_DIR / "kb_and.mlir")) for _ in "ab"]
+    fcs[0].set_func_name("a")
+    fcs[1].set_func_name("b")
+    # the same program under another name
+    key = fcs[0].structural_key()
+    assert fcs[1].structural_key() == key
+
+    for max_bytes in (None, 0):
+        lowerer = LowerToLLVM([4])
+        lowerer.add_fn(and_helpers.get_top_func)
+        names = fcs[0].lower(lowerer.add_fn)
+        jit = Jit(max_bytes=max_bytes)
+        mod = jit.add_mod(str(lowerer))
+        jit.remember((key, 4), mod, names[4])
+        ptr = jit.get_fn_ptr(names[4])
+
+        # a module freed after its release forgets its fns
+        jit.release(mod)
+        assert jit.recall((key, 4)) == (None if max_bytes == 0 else (mod, ptr))
+
+
+def test_jit_workers(kb_lowerer: LowerToLLVM):
+    # modules compiled on worker processes and loaded here as object code
+    jit = Jit(num_workers=2)
+    mods = jit.add_mods([str(kb_lowerer)] * 2)
+    to_eval = enum_low_knownbits_4_4_4(
+        jit.get_fn_ptr("concrete_op_4_shim", mods[0]), None
+    )
+    res = eval_knownbits_4_4_4(to_eval, [jit.get_fn_ptr("kb_and_4_shim", mods[1])], [])
+    jit.close()
+    assert np.asarray(res).tolist() == [[6561, 0, 6561, 6480, 0, 6561]]
+
+
+def test_runtime(and_helpers: HelperFuncs):
+    jit = Jit()
+    runtime = Runtime(jit, [4], [and_helpers.get_top_func, and_helpers.meet_func])
+    # the same helpers get the same symbols, so their object code can be cached
+    again = Runtime(jit, [4], [and_helpers.get_top_func, and_helpers.meet_func])
+    assert {x[0] for x in again.fns.values()} == {x[0] for x in runtime.fns.values()}
+
+    # the helpers are only declared, and resolve to the runtime when compiled
+    lowerer = runtime.lowerer()
+    assert lowerer.fns["getTop_4"].is_declaration
+    lowerer.add_fn(and_helpers.crt_func, shim=True)
+    lowerer.add_fn(parse_mlir_func(DATA_DIR / "kb_and.mlir"), shim=True)
+    mod = jit.add_mod(str(lowerer))
+    assert "getTop_4" not in mod.fns
+
+    to_eval = enum_low_knownbits_4_4_4(jit.get_fn_ptr("concrete_op_4_shim"), None)
+    res = eval_knownbits_4_4_4(to_eval, [jit.get_fn_ptr("kb_and_4_shim")], [])
+    assert np.asarray(res).tolist() == [[6561, 0, 6561, 6480, 0, 6561]]
+
+
+def test_jit_cache(tmp_path: Path, kb_lowerer: LowerToLLVM):
+    # only modules added with cache=True are stored, and later jits load them
+    Jit(cache_dir=tmp_path).add_mod(str(kb_lowerer))
+    assert not list(tmp_path.iterdir())
+    for _ in range(2):
+        jit = Jit(cache_dir=tmp_path)
+        jit.add_mod(str(kb_lowerer), cache=True)
+        assert len(list(tmp_path.iterdir())) == 1
+
+        to_eval = enum_low_knownbits_4_4_4(jit.get_fn_ptr("concrete_op_4_shim"), None)
+        res = eval_knownbits_4_4_4(to_eval, [jit.get_fn_ptr("kb_and_4_shim")], [])
+        assert np.asarray(res).tolist() == [[6561, 0, 6561, 6480, 0, 6561]]
+
+
+def test_shared_module_release(and_helpers: HelperFuncs):
+    jit = Jit(max_bytes=0)
+    runtime = Runtime(jit, [4], [and_helpers.get_top_func, and_helpers.meet_func])
+    fc = FunctionWithCondition(parse_mlir_func(DATA_DIR / "kb_and.mlir"))
+
+    # a module compiled for one user and recalled by another is held until both
+    # release it
+    _, (mod,) = _compile([fc], [4], runtime, jit)
+    _, (again,) = _compile([fc], [4], runtime, jit)
+    assert again is mod
+    jit.release(mod)
+    assert mod in jit.mods
+    jit.release(again)
+    assert mod not in jit.mods
+
+
+def test_stream_base_held(and_helpers: HelperFuncs):
+    jit = Jit(max_bytes=0)
+    to_eval = setup_eval(
+        [4], [], [], 7, and_helpers, jit, Sampler.uniform(), low_chunk_rows=1000
+    )
+    runtime = Runtime(jit, [4], [and_helpers.get_top_func, and_helpers.meet_func])
+    eval_f = _eval_helper(to_eval, [4], and_helpers, runtime, jit)
+    base = [FunctionWithCondition(parse_mlir_func(DATA_DIR / "kb_and.mlir"))]
+    top = FunctionWithCondition(top_as_xfer(and_helpers.transfer_func))
+
+    # the module of the base set outlives the rounds freed in between
+    for _ in range(3):
+        (res,) = eval_f([top], base, [0])
+        assert (res.all_cases, res.sounds, res.exacts) == (6561, 6561, 6561)
+
+
+def test_row_outputs(kb_xfers: tuple[ToEvalKnownBits4_4_4, list[int]]):
+    to_eval, fns = kb_xfers
+    outs = row_outputs_knownbits_4_4_4(to_eval, fns)
+    assert (len(outs), outs.rows) == (3, 6561)
+
+    # one abstract value per fn and row, which eval_outputs keeps under max_bytes
+    size = row_outputs_bytes_knownbits_4_4_4(3, 6561)
+    assert size == 3 * 6561 * row_outputs_bytes_knownbits_4_4_4(1, 1)
+    assert eval_outputs({4: (to_eval, fns)}, max_bytes=size - 1) is None
+    assert eval_outputs({4: (to_eval, fns)}, max_bytes=size) is not None
+
+    # the fns met with the picked ones from their outputs, as if they were run again
+    refs = ref_cache_knownbits_4_4_4(to_eval, [])
+    for picks in ([], [1], [1, 2]):
+        for pick in picks:
+            refs = meet_ref_cache_knownbits_4_4_4(to_eval, refs, outs, pick)
+        rest = [k for k in range(3) if k not in picks]
+        met = eval_outputs_knownbits_4_4_4(to_eval, outs, rest, refs)
+        run = eval_knownbits_4_4_4(
+            to_eval, [fns[k] for k in rest], [fns[k] for k in picks]
+        )
+        assert np.array_equal(np.asarray(met), np.asarray(run))
+        assert met.base_distance == run.base_distance
+
+
+def test_unsound_budget_threads(kb_xfers: tuple[ToEvalKnownBits4_4_4, list[int]]):
+    to_eval, fns = kb_xfers
+    refs = ref_cache_knownbits_4_4_4(to_eval, [])
+
+    # where a fn runs out of budget does not depend on how the rows are sharded
+    budgets = [0, 100, 5000]
+    runs = [
+        np.asarray(eval_knownbits_4_4_4(to_eval, fns, [], n, unsound_budgets=budgets))
+        for n in (1, 3, 8)
+    ] + [
+        np.asarray(eval_knownbits_4_4_4(to_eval, fns, refs, n, unsound_budgets=budgets))
+        for n in (1, 5)
+    ]
+    for r in runs[1:]:
+        assert np.array_equal(r, runs[0])
+
+    unbounded = np.asarray(eval_knownbits_4_4_4(to_eval, fns, []))
+    assert np.array_equal(runs[0][0], unbounded[0])
+    assert (runs[0][1:, -1] < 6561).all()
+
+
+def test_eval_threads(kb_xfers: tuple[ToEvalKnownBits4_4_4, list[int]]):
+    to_eval, fns = kb_xfers
+    refs = ref_cache_knownbits_4_4_4(to_eval, fns[2:], num_threads=3)
+
+    # the shards sum to exactly the serial counters
+    serial = eval_knownbits_4_4_4(to_eval, fns[:2], fns[2:])
+    for n in (1, 3, 8):
+        for sharded in (
+            eval_knownbits_4_4_4(to_eval, fns[:2], fns[2:], n),
+            eval_knownbits_4_4_4(to_eval, fns[:2], refs, n),
+        ):
+            assert np.array_equal(np.asarray(sharded), np.asarray(serial))
+            assert (sharded.cases, sharded.unsolved_cases, sharded.base_distance) == (
+                serial.cases,
+                serial.unsolved_cases,
+                serial.base_distance,
+            )
+
+
+def test_eval_jobs_threads(kb_xfers: tuple[ToEvalKnownBits4_4_4, list[int]]):
+    to_eval, fns = kb_xfers
+    small = type(to_eval)(np.asarray(to_eval)[:100])
+
+    # num_threads is split between the jobs, not given to each of them
+    def run(num_threads: int) -> list[np.ndarray]:
+        jobs = [
+            eval_job_knownbits_4_4_4(to_eval, fns[:2], fns[2:]),
+            eval_job_knownbits_4_4_4(small, fns, unsound_budgets=[0, 10, 10]),
+            eval_job_chunks_knownbits_4_4_4(np.asarray(to_eval), 1000, fns),
+        ]
+        return [np.asarray(r) for r in run_eval_jobs(jobs, num_threads)]
+
+    serial = run(1)
+    for n in (2, 3, 8):
+        assert all(np.array_equal(a, b) for a, b in zip(run(n), serial))